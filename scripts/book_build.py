@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Incremental book builds: recompile only the chapters that changed.
+
+``make full`` recompiles the whole book (``latexmk -g``) whenever any
+source changes. This orchestrator maps changed sources to the chapters
+the main document ``\\include``s and compiles only those with
+``\\includeonly``. LaTeX then keeps the other chapters' ``.aux`` files,
+so their labels, counters and page numbers stay available for
+cross-references.
+
+A chapter's sources are
+
+  - its ``\\include``d file and everything under its ``chXX/`` directory,
+  - the versioned/versionless sections it references (see
+    section_index.py), ``index.tex`` and ``source.md``,
+  - the exercise files defining the problems of those versioned sections
+    (``common/source-dependencies.json``), and ``chXX_exercises.tex``.
+
+Any other book-wide file (main document, ``0-*.tex``, ``common/*.tex``,
+styles, bibliographies, ``figures/``) changing triggers a full build. So
+does an includeonly build that invalidates the rest of the book: a
+changed table of contents, or changed counters (page, equation, ...) at
+the end of a rebuilt chapter. When label values change, the rebuilt
+chapters are compiled again together with the chapters referencing those
+labels, until the labels settle.
+
+Each latexmk run is a single LuaLaTeX pass, so a full build is repeated
+until the ``.aux`` and ``.toc`` files stop changing (at most
+``MAX_PASSES`` times). A build that has not settled is not recorded, so
+the next run builds the book again instead of calling it up to date.
+
+Builds use their own output directory (``build-book/``) and job name, so
+they never overwrite the PDF of ``make full``. After an includeonly build
+the PDF contains the front matter and the rebuilt chapters, with the
+page numbers and references of the full book.
+
+Usage:
+    python scripts/book_build.py book-0.tex [--defs '\\def\\nocropmarks{1}'] [--latexmkrc latexmkrc_main]
+    python scripts/book_build.py book-0.tex --dry-run    # show what would be built
+    python scripts/book_build.py book-0.tex --full
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from section_index import SectionIndex
+
+BUILD_DIR = Path("build-book")
+DEPS_FILE = Path("common/source-dependencies.json")
+GLOBAL_PATTERNS = ("0-*.tex", "*.bib", "common/*.tex", "common/*.bib", "common/styles-tex/**/*",
+                   "figures/*", "scripts/index-see-entries.tex", "latexmkrc*")
+OPTIONS = ["-interaction=nonstopmode", "-halt-on-error", "-file-line-error", "-shell-escape", "-synctex=1"]
+INCLUDE_RE = re.compile(r"^[^%\n]*?\\include\{([^}]+)\}", re.MULTILINE)
+EXERCISE_ID_RE = re.compile(r"\\begin\{exercise\}\[[^\]]*?ID=([^,\]]+)")
+# Counters LaTeX writes at the end of an \include'd file's .aux
+CHECKPOINT_RE = re.compile(r"\\@setckpt\{[^}]*\}\{(.*)\}", re.DOTALL)
+NEWLABEL_RE = re.compile(r"^\\newlabel\{([^}]+)\}(.*)$", re.MULTILINE)
+MAX_PASSES = 5
+
+
+def _read(path) -> str:
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def signature(paths) -> str:
+    """Hash of the names, sizes and modification times of paths."""
+    digest = hashlib.sha256()
+    for path in sorted(set(paths)):
+        try:
+            st = os.stat(path)
+            digest.update(f"{path}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8"))
+        except OSError:
+            digest.update(f"{path}\0missing\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def chapter_key(include: str) -> str:
+    """ch03 for \\include{ch03}, \\include{ch03/main}, ..."""
+    return Path(include).parts[0].split(".")[0]
+
+
+class BookBuild:
+    """Chapter-granular builds of one main document.
+
+    Args:
+        tex: Main document (e.g. book-0.tex)
+        defs: LaTeX definitions run before the document (as in tex_cmd)
+        latexmkrc: latexmkrc used instead of the default ones
+    """
+
+    def __init__(self, tex: str, defs: str = "", latexmkrc: Optional[str] = None):
+        self.tex = Path(tex)
+        self.stem = str(self.tex.with_suffix(""))
+        self.jobname = f"{self.tex.stem}-chapters"
+        self.defs = defs
+        self.latexmkrc = latexmkrc
+        self.state_file = BUILD_DIR / f"{self.jobname}.state.json"
+        self.includes = INCLUDE_RE.findall(_read(self.tex))
+
+    # sources -------------------------------------------------------------
+
+    def chapter_files(self) -> Dict[str, Set[str]]:
+        """include name -> files it is built from."""
+        sections = SectionIndex().sections()
+        try:
+            with open(DEPS_FILE, encoding="utf-8") as f:
+                deps = json.load(f)
+        except (OSError, ValueError):
+            deps = {}
+        exercise_files: Dict[str, str] = {}
+        for path in sorted(Path(".").glob("ch*_exercises.tex")):
+            for pid in EXERCISE_ID_RE.findall(_read(path)):
+                exercise_files.setdefault(pid.strip(), str(path))
+
+        files: Dict[str, Set[str]] = {}
+        for include in self.includes:
+            key = chapter_key(include)
+            chapter = {include if include.endswith(".tex") else f"{include}.tex", f"{key}_exercises.tex"}
+            if os.path.isdir(key):
+                for dirpath, dirnames, filenames in os.walk(key):
+                    chapter.update(os.path.join(dirpath, name) for name in filenames)
+            for h, section in sections.items():
+                if section["chapter"] != key or section["type"] == "chapter":
+                    continue
+                chapter.update((section["tex"], section["source"]))
+                members = deps.get(h) if section["type"] == "versioned" else None
+                for pid in members if isinstance(members, list) else []:
+                    if str(pid) in exercise_files:
+                        chapter.add(exercise_files[str(pid)])
+            files[include] = chapter
+        return files
+
+    def global_files(self, chapter_files: Dict[str, Set[str]]) -> List[str]:
+        attributed = set().union(*chapter_files.values()) if chapter_files else set()
+        paths = {str(self.tex)}
+        for pattern in GLOBAL_PATTERNS:
+            paths.update(str(p) for p in Path(".").glob(pattern) if p.is_file())
+        return sorted(paths - attributed)
+
+    # LaTeX ---------------------------------------------------------------
+
+    def _aux(self, include: str) -> Path:
+        return BUILD_DIR / f"{include.removesuffix('.tex')}.aux"
+
+    def _snapshot(self, includes) -> Dict:
+        snapshot = {"toc": _read(BUILD_DIR / f"{self.jobname}.toc"), "checkpoints": {}, "labels": {}}
+        for include in includes:
+            aux = _read(self._aux(include))
+            checkpoint = CHECKPOINT_RE.search(aux)
+            snapshot["checkpoints"][include] = checkpoint.group(1) if checkpoint else None
+            snapshot["labels"][include] = dict(NEWLABEL_RE.findall(aux))
+        return snapshot
+
+    def _references(self) -> List[str]:
+        """The .aux and .toc files of the whole book, whose changes call for another pass."""
+        files = [BUILD_DIR / f"{self.jobname}.aux", BUILD_DIR / f"{self.jobname}.toc"]
+        return [_read(path) for path in files + [self._aux(include) for include in self.includes]]
+
+    def latexmk(self, only: Optional[List[str]] = None) -> int:
+        """Compile the whole book, or only the includes in only."""
+        for include in self.includes:
+            (BUILD_DIR / include).parent.mkdir(parents=True, exist_ok=True)
+        defs = self.defs
+        if only is not None:
+            defs += "\\includeonly{" + ",".join(i.removesuffix(".tex") for i in only) + "}"
+        out_dir = f"{BUILD_DIR}/"
+        cmd = ["latexmk", "-g", "-lualatex", "-e", "$max_repeat=1"] + OPTIONS
+        if self.latexmkrc:
+            cmd += ["-norc", "-r", self.latexmkrc]
+        cmd += [f"-jobname={self.jobname}", f"--output-directory={out_dir}",
+                f"-lualatex=lualatex %O '{defs}\\PassOptionsToPackage{{outputdir={out_dir}}}{{minted}}"
+                f"\\input{{{self.stem}}}'", self.stem]
+        print(("Compiling " + ", ".join(only)) if only is not None else "Compiling the full book")
+        try:
+            return subprocess.run(cmd).returncode
+        except FileNotFoundError:
+            print("✗ Error: latexmk not found")
+            return 127
+
+    def full(self) -> tuple:
+        """Compile the whole book until its references settle; (returncode, settled)."""
+        for _ in range(MAX_PASSES):
+            before = self._references()
+            returncode = self.latexmk()
+            if returncode != 0:
+                return returncode, False
+            if self._references() == before:
+                return 0, True
+        return 0, False
+
+    def partial(self, changed: List[str], chapter_files: Dict[str, Set[str]]) -> tuple:
+        """includeonly build of changed; (returncode, reason a full build is needed or None)."""
+        todo = list(changed)
+        for _ in range(MAX_PASSES):
+            before = self._snapshot(todo)
+            returncode = self.latexmk(only=todo)
+            if returncode != 0:
+                return returncode, None
+            after = self._snapshot(todo)
+            if before["toc"] != after["toc"]:
+                return 0, "the table of contents changed"
+            for include in todo:
+                if before["checkpoints"][include] != after["checkpoints"][include]:
+                    return 0, f"page numbering or counters after {include} changed"
+            changed_labels = set()
+            for include in todo:
+                old, new = before["labels"][include], after["labels"][include]
+                changed_labels.update(k for k in old.keys() | new.keys() if old.get(k) != new.get(k))
+            if not changed_labels:
+                return 0, None
+            label_re = re.compile(r"\{(?:[^{}]*,)?(" + "|".join(map(re.escape, sorted(changed_labels))) + r")[,}]")
+            referencing = {include for include, paths in chapter_files.items() if include not in todo
+                           and any(label_re.search(_read(p)) for p in paths if p.endswith(".tex"))}
+            # The chapters just compiled stay in: the PDF must contain them, and they may reference their own labels
+            todo = [include for include in self.includes if include in todo or include in referencing]
+            print(f"Labels changed ({len(changed_labels)}); recompiling " + ", ".join(todo))
+        return 0, "labels kept changing"
+
+    # orchestration -------------------------------------------------------
+
+    def build(self, full: bool = False, dry_run: bool = False) -> int:
+        chapter_files = self.chapter_files()
+        current = {
+            "global": signature(self.global_files(chapter_files)),
+            "chapters": {include: signature(paths) for include, paths in chapter_files.items()},
+        }
+        try:
+            with open(self.state_file, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = None
+
+        reason = None
+        changed: List[str] = []
+        if full:
+            reason = "requested"
+        elif not self.includes:
+            reason = f"{self.tex} has no \\include'd chapters"
+        elif state is None:
+            reason = "no previous build"
+        elif state["global"] != current["global"]:
+            reason = "a book-wide file changed"
+        elif set(state["chapters"]) != set(current["chapters"]):
+            reason = "the chapter list changed"
+        elif not (BUILD_DIR / f"{self.jobname}.aux").exists():
+            reason = "no .aux from a previous build"
+        else:
+            changed = [i for i in self.includes if state["chapters"].get(i) != current["chapters"][i]]
+            if not changed:
+                print(f"{BUILD_DIR}/{self.jobname}.pdf is up to date")
+                return 0
+
+        if dry_run:
+            print(f"Full build ({reason})" if reason else "Chapters to compile: " + " ".join(changed))
+            return 0
+
+        if not reason:
+            returncode, reason = self.partial(changed, chapter_files)
+            if returncode != 0:
+                return returncode
+            if reason:
+                print(f"Full rebuild needed: {reason}")
+        else:
+            print(f"Full build: {reason}")
+        if reason:
+            returncode, settled = self.full()
+            if returncode != 0:
+                return returncode
+            if not settled:
+                print(f"⚠ Warning: references still changing after {MAX_PASSES} passes; "
+                      "the next build will compile the book again")
+                self.state_file.unlink(missing_ok=True)
+                return 0
+
+        BUILD_DIR.mkdir(parents=True, exist_ok=True)
+        with open(self.state_file, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+        print(f"Wrote {BUILD_DIR}/{self.jobname}.pdf")
+        return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compile only the book chapters that changed")
+    parser.add_argument("tex", help="Main document (e.g. book-0.tex)")
+    parser.add_argument("--defs", default="", help="LaTeX definitions run before the document")
+    parser.add_argument("--latexmkrc", help="latexmkrc to use instead of the default ones (e.g. latexmkrc_main)")
+    parser.add_argument("--full", action="store_true", help="Compile the whole book")
+    parser.add_argument("--dry-run", action="store_true", help="Only print what would be compiled")
+    args = parser.parse_args(argv)
+
+    if not Path(args.tex).exists():
+        print(f"✗ Error: {args.tex} not found")
+        return 1
+    return BookBuild(args.tex, args.defs, args.latexmkrc).build(full=args.full, dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
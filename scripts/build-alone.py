@@ -1,87 +1,204 @@
 import argparse
 import shutil
 from pathlib import Path
+import os
 import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-parser = argparse.ArgumentParser(description="Build a tex file in book environment by its hash.")
+from preamble_format import ENDOFDUMP, PreambleFormat
+from section_index import SectionIndex
+
+parser = argparse.ArgumentParser(description="Build tex files in book environment by their hashes.")
+parser.add_argument(
+    'hash',
+    metavar='hash',
+    type=str,
+    nargs='*',
+    help='the hash(es) of the section(s) to build'
+)
 parser.add_argument(
-    'hash', 
-    metavar='hash', 
-    type=str, 
-    help='the hash of the section to build'
+    '--chapter',
+    metavar='chapter',
+    type=str,
+    help='build every section of this chapter (e.g. ch03)',
+    required=False
 )
 parser.add_argument(
-    '--trashaux', 
-    metavar='trashaux', 
-    type=str, 
+    '--trashaux',
+    metavar='trashaux',
+    type=str,
     help='trash entire folder (including aux)',
     required=False
 )
+parser.add_argument(
+    '--compile',
+    action='store_true',
+    help='also compile the assembled files (otherwise make does it)'
+)
+parser.add_argument(
+    '--jobs', '-j',
+    metavar='jobs',
+    type=int,
+    default=4,
+    help='concurrent compiles with --compile (default: 4)'
+)
+parser.add_argument(
+    '--tex-defs',
+    metavar='tex_defs',
+    type=str,
+    default='\\def\\nowrite{1}\\def\\nocropmarks{1}',
+    help='LaTeX code run before the section (see build_section_text in the Makefile)'
+)
 args = parser.parse_args()
 
-h = args.hash
 trashaux = args.trashaux
 
-# find the tex file
-
-chdirs = []
-p = Path('.') # ls of directory
-for x in p.rglob("*"): # includes subdirectories
-	if x.is_dir() and str(x).startswith('ch'):
-		chdirs.append(str(x))
-otherdirs = ['common/versioned','versionless'] # directories to search
-dirs = otherdirs + chdirs
-
-f = None
-for d in dirs:
-	if Path.exists(Path(d+f'/{h}')):
-		f = Path(d+f'/{h}/index.tex')
-	elif Path.exists(Path(d+f'/{h}.tex')):
-		f = Path(d+f'/{h}.tex')
-
-if not f:
-	raise(Exception(f'A TeX file for hash {h} not found!'))
-elif not Path.exists(f):
-	raise(Exception(f'A TeX file for hash {h} not found!'))
-else:
-	print(f'File {f} found.')
-
-# identify output tex file
-
-build_dir = Path(f'build-sections/{h}')
-if Path.exists(build_dir):
-	if trashaux == True or trashaux == 'true':
-		shutil.rmtree(build_dir)
-build_dir.mkdir(parents=True,exist_ok=True)
-exercises_dir = Path(f'{build_dir}/exercises')
-exercises_dir.mkdir(parents=True,exist_ok=True) # for xsim problems
-full_tex_filename = f'{build_dir}/{h}.tex'
-
-# identify 0-*.tex files
-
-tex_filenames = [
-	'0-documentclass.tex',
-	'0-xr.tex',
-	'0-preamble.tex',
-	'0-begin.tex',
-	f,
-	'0-bib.tex',
-	'0-index.tex',
-	'0-post.tex'
-]
-
-print(f'Writing buildable file to {full_tex_filename}')
-
-with open(full_tex_filename, 'w') as full_tex_file:
-	for tex_filename in tex_filenames:
-		with open(tex_filename) as tex_file:
-			for line in tex_file:
-				full_tex_file.write(line)
+# latexmk command for a section (same as tex_cmd in the Makefile, without -g so up-to-date sections are skipped)
+
+latex_command = ['latexmk', '-lualatex', '-e', '$max_repeat=1']
+options = ['-interaction=nonstopmode', '-halt-on-error', '-file-line-error', '-shell-escape', '-synctex=1']
+
+# find the tex files (cached hash index, see section_index.py)
+
+index = SectionIndex()
+sections = index.sections()
+hashes = list(args.hash)
+if args.chapter:
+	chapter_hashes = sorted(h for h, s in sections.items() if s['chapter'] == args.chapter)
+	if not chapter_hashes:
+		raise(Exception(f'No sections found for chapter {args.chapter}!'))
+	hashes += [h for h in chapter_hashes if h not in hashes]
+if not hashes:
+	parser.error('pass at least one hash or --chapter')
 
-# copy styles to the directory (to fix issue with missing styles/index_style.ist)
+files = {}
+for h in hashes:
+	section = sections.get(h)
+	f = Path(section['tex']) if section else None
+	if not f:
+		raise(Exception(f'A TeX file for hash {h} not found!'))
+	elif not Path.exists(f):
+		raise(Exception(f'A TeX file for hash {h} not found!'))
+	else:
+		print(f'File {f} found.')
+	files[h] = f
+
+# identify 0-*.tex files (read once for all sections)
+
+tex_parts = {}
+for tex_filename in ['0-documentclass.tex', '0-xr.tex', '0-preamble.tex', '0-begin.tex', '0-bib.tex', '0-index.tex', '0-post.tex']:
+	with open(tex_filename) as tex_file:
+		tex_parts[tex_filename] = tex_file.read()
 
 styles_dir = Path('common/styles-tex')
-if Path.exists(styles_dir):
-	shutil.copytree(styles_dir,f'{build_dir}/{styles_dir}',dirs_exist_ok=True)
-else:
-	raise Exception(f'styles directory does not exist: {styles_dir}!')
\ No newline at end of file
+if not Path.exists(styles_dir):
+	raise Exception(f'styles directory does not exist: {styles_dir}!')
+
+def stage_styles(src_dir, dst_dir):
+	"""Hardlink (or copy) the files of src_dir into dst_dir, skipping those already staged"""
+	for src_root, dirnames, filenames in os.walk(src_dir):
+		dst_root = Path(dst_dir) / Path(src_root).relative_to(src_dir)
+		dst_root.mkdir(parents=True, exist_ok=True)
+		for filename in filenames:
+			src = Path(src_root) / filename
+			dst = dst_root / filename
+			src_stat = src.stat()
+			try:
+				dst_stat = dst.stat()
+			except FileNotFoundError:
+				dst_stat = None
+			if dst_stat is not None:
+				if os.path.samestat(src_stat, dst_stat):
+					continue # hardlinked already
+				if dst_stat.st_size == src_stat.st_size and dst_stat.st_mtime_ns == src_stat.st_mtime_ns:
+					continue # copied already, unchanged
+				dst.unlink()
+			try:
+				os.link(src, dst)
+			except OSError: # e.g. another filesystem
+				shutil.copy2(src, dst)
+
+def assemble(h, f):
+	"""Write build-sections/<h>/<h>.tex from the 0-*.tex parts and the section"""
+	build_dir = Path(f'build-sections/{h}')
+	if Path.exists(build_dir):
+		if trashaux == True or trashaux == 'true':
+			shutil.rmtree(build_dir)
+	build_dir.mkdir(parents=True,exist_ok=True)
+	exercises_dir = Path(f'{build_dir}/exercises')
+	exercises_dir.mkdir(parents=True,exist_ok=True) # for xsim problems
+	full_tex_filename = f'{build_dir}/{h}.tex'
+
+	tex_filenames = [
+		'0-documentclass.tex',
+		'0-xr.tex',
+		'0-preamble.tex',
+		'0-begin.tex',
+		f,
+		'0-bib.tex',
+		'0-index.tex',
+		'0-post.tex'
+	]
+
+	full_tex = ''
+	for tex_filename in tex_filenames:
+		if tex_filename in tex_parts:
+			full_tex += tex_parts[tex_filename]
+		else:
+			with open(tex_filename) as tex_file:
+				full_tex += tex_file.read()
+		if tex_filename == '0-preamble.tex':
+			full_tex += ENDOFDUMP # end of the precompiled preamble (see preamble_format.py)
+
+	# only write when changed, so the file's mtime doesn't make latexmk/make rebuild
+
+	try:
+		with open(full_tex_filename) as full_tex_file:
+			unchanged = full_tex_file.read() == full_tex
+	except FileNotFoundError:
+		unchanged = False
+	if unchanged:
+		print(f'Buildable file {full_tex_filename} is up to date')
+	else:
+		print(f'Writing buildable file to {full_tex_filename}')
+		with open(full_tex_filename, 'w') as full_tex_file:
+			full_tex_file.write(full_tex)
+
+	# stage styles in the directory (to fix issue with missing styles/index_style.ist)
+
+	stage_styles(styles_dir,f'{build_dir}/{styles_dir}')
+	return build_dir
+
+def compile_section(h, build_dir):
+	"""Compile build-sections/<h>/<h>.tex with latexmk, logging to build-sections/<h>/build.log"""
+	out_dir = f'{build_dir}/'
+	# the format has minted's outputdir baked in, so each section uses its own (see preamble_format.py)
+	preamble_format = PreambleFormat(args.tex_defs, outputdir=out_dir)
+	format_name = preamble_format.ensure()
+	format_option = f'-fmt={format_name} ' if format_name else ''
+	lualatex = f"lualatex %O {format_option}'{args.tex_defs}\\PassOptionsToPackage{{outputdir={out_dir}}}{{minted}}\\input{{{build_dir}/{h}}}'"
+	cmd = latex_command + options + [f'-jobname={h}', f'--output-directory={out_dir}', f'-lualatex={lualatex}', f'{build_dir}/{h}']
+	log_filename = f'{build_dir}/build.log'
+	start = time.time()
+	with open(log_filename, 'w') as log_file:
+		try:
+			returncode = subprocess.run(cmd, stdout=log_file, stderr=subprocess.STDOUT, env=preamble_format.env()).returncode
+		except FileNotFoundError:
+			log_file.write('latexmk not found\n')
+			returncode = 127
+	status = 'ok' if returncode == 0 else f'FAILED (see {log_filename})'
+	print(f'{h}: {status} [{time.time() - start:.1f}s]' + (f' (preamble format {format_name})' if format_name else ''))
+	return returncode
+
+build_dirs = {h: assemble(h, f) for h, f in files.items()}
+
+if args.compile:
+	print(f'Compiling {len(build_dirs)} section(s) with {args.jobs} job(s) ...')
+	with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+		returncodes = dict(zip(build_dirs, pool.map(lambda h: compile_section(h, build_dirs[h]), build_dirs)))
+	failed = [h for h, returncode in returncodes.items() if returncode != 0]
+	if failed:
+		print(f'Failed sections: {" ".join(failed)}')
+		raise SystemExit(1)
+	print(f'Built {len(returncodes)} section(s): ' + ' '.join(f'build-sections/{h}/{h}.pdf' for h in returncodes))
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Assemble compiled exams into print-ready PDFs without running TeX again.
+
+Merges PDFs in a given order, pads each one to an even number of pages
+so that every document starts on a new sheet when printed duplex, and
+adds a bookmark per document. The input is either a list of PDFs or the
+``manifest.json`` written by roster.py, in which case the bookmarks show
+each student's name, ID and variant seed. Exams and solution keys can
+be selected or interleaved; students whose documents roster.py failed
+to compile (``"compiled": false``) are reported and left out, so a stale
+PDF from an earlier run is never printed.
+
+Needs the pure-Python ``pypdf`` package (``pip install pypdf``). pypdf
+holds each input it merges in memory until the output is written, so
+the result is written as volumes of at most ``--batch-size`` documents
+(default 50; ``all-001.pdf``, ``all-002.pdf``, ...), which bounds memory
+use for hundreds of inputs and gives print-shop-sized files. A run that
+fits in one volume writes just the output file.
+
+Usage:
+    python assemble_pdfs.py --manifest midterm_variants/manifest.json -o midterm_all.pdf
+    python assemble_pdfs.py --manifest midterm_variants/manifest.json --include both --order name
+    python assemble_pdfs.py midterm_A.pdf midterm_B.pdf -o midterm_versions.pdf --no-pad
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import List, Tuple
+
+ORDERS = ("manifest", "name", "id", "seed")
+DEFAULT_BATCH_SIZE = 50
+
+
+def manifest_documents(manifest_path, include: str = "exams", order: str = "manifest") -> List[Tuple[Path, str]]:
+    """(pdf, bookmark title) for the students in a roster manifest."""
+    manifest_path = Path(manifest_path)
+    with open(manifest_path, encoding="utf-8") as f:
+        students = json.load(f)["students"]
+    if order != "manifest":
+        students = sorted(students, key=lambda s: str(s[order]).lower())
+    documents = []
+    for student in students:
+        if not student.get("compiled", True):
+            print(f"⚠ Warning: {student['name']} ({student['id']}) did not compile; skipped")
+            continue
+        title = f"{student['name']} ({student['id']}) - variant {student['seed']}"
+        if include in ("exams", "both"):
+            documents.append((manifest_path.parent / student["pdf"], title))
+        if include in ("solutions", "both") and student.get("solutions_pdf"):
+            documents.append((manifest_path.parent / student["solutions_pdf"], f"{title} - solutions"))
+    return documents
+
+
+def _volume_path(output: Path, index: int, volumes: int) -> Path:
+    if volumes == 1:
+        return output
+    return output.with_name(f"{output.stem}-{index:03d}{output.suffix}")
+
+
+def assemble(documents: List[Tuple[Path, str]], output: Path, pad: bool = True,
+             batch_size: int = DEFAULT_BATCH_SIZE) -> List[Path]:
+    """Merge documents into output (or numbered volumes of batch_size documents).
+
+    Returns the paths written. Missing inputs are reported and skipped.
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    present = []
+    for pdf, title in documents:
+        if pdf.exists():
+            present.append((pdf, title))
+        else:
+            print(f"⚠ Warning: {pdf} not found; skipped")
+    size = batch_size if batch_size > 0 else max(1, len(present))
+    batches = [present[i:i + size] for i in range(0, len(present), size)]
+
+    written = []
+    for index, batch in enumerate(batches, 1):
+        writer = PdfWriter()
+        for pdf, title in batch:
+            reader = PdfReader(pdf)
+            start = len(writer.pages)
+            for page in reader.pages:
+                writer.add_page(page)
+            if pad and len(reader.pages) % 2:
+                box = reader.pages[-1].mediabox
+                writer.add_blank_page(width=box.width, height=box.height)
+            writer.add_outline_item(title, start)
+        path = _volume_path(output, index, len(batches))
+        with open(path, "wb") as f:
+            writer.write(f)
+        writer.close()
+        print(f"Wrote {path} ({len(batch)} document(s))")
+        written.append(path)
+    return written
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Merge compiled exams into print-ready PDFs")
+    parser.add_argument("pdfs", nargs="*", help="PDFs to merge, in order (bookmarked by file name)")
+    parser.add_argument("--manifest", help="roster.py manifest.json to take documents and bookmarks from")
+    parser.add_argument("--include", choices=("exams", "solutions", "both"), default="exams",
+                        help="With --manifest: which documents to merge (both: exam then key per student)")
+    parser.add_argument("--order", choices=ORDERS, default="manifest",
+                        help="With --manifest: order of the students (default: manifest order)")
+    parser.add_argument("--output", "-o", help="Output PDF (default: <manifest dir>.pdf or merged.pdf)")
+    parser.add_argument("--no-pad", action="store_true", help="Do not pad documents to an even page count")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Write volumes of at most this many documents each, bounding memory use "
+                             f"(default: {DEFAULT_BATCH_SIZE}; 0: one file)")
+    args = parser.parse_args(argv)
+
+    if args.manifest:
+        documents = manifest_documents(args.manifest, args.include, args.order)
+        default_output = Path(args.manifest).resolve().parent.with_suffix(".pdf")
+    elif args.pdfs:
+        documents = [(Path(p), Path(p).stem) for p in args.pdfs]
+        default_output = Path("merged.pdf")
+    else:
+        parser.error("give PDFs to merge or --manifest")
+    if not documents:
+        print("✗ Error: nothing to assemble")
+        return 1
+
+    try:
+        import pypdf  # noqa: F401
+    except ImportError:
+        print("✗ Error: assembling PDFs needs pypdf (pip install pypdf)")
+        return 1
+
+    written = assemble(documents, Path(args.output) if args.output else default_output,
+                       pad=not args.no_pad, batch_size=args.batch_size)
+    return 0 if written else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Asset dependencies of exercises.
+
+Scans exercise and solution text for the files it pulls in
+(``\\includegraphics``, ``\\includestandalone``, ``\\inputpgf``, ``\\input``)
+and the bibliography keys it cites, and resolves each file reference once,
+against the same search path the exam/pset preambles give TeX
+(``\\graphicspath`` and ``\\input@path``), relative to the book root where
+documents are compiled. Standalone and PGF sources are scanned in turn, so
+the result is the closure of files a document needs.
+
+Directory listings are cached, so resolving thousands of references costs
+one ``os.listdir`` per search directory rather than a stat per candidate.
+
+The result is stored in each exercise record as ``record['assets']``:
+
+    {"files": ["common/figures/bode.pdf", "source/ch03/figure-0.pgf", ...],
+     "resolved": {"bode": "common/figures/bode.pdf", ...},
+     "cite_keys": ["ogata2010", ...],
+     "missing": ["nonexistent-figure"]}
+
+``rewrite_asset_paths`` replaces the references in generated text with the
+resolved paths, so TeX opens each file directly instead of searching.
+
+Author: meta-book project
+Date: 2024
+"""
+from __future__ import annotations
+
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Union of the exam and pset \graphicspath entries, relative to the book root
+GRAPHICS_DIRS = (".", "figures", "source/figures", "common", "common/figures",
+                 "..", "../common", "../common/figures")
+# \input@path in the exam preamble
+INPUT_DIRS = (".", "..")
+# Extensions pdflatex tries for \includegraphics without one, in order
+GRAPHICS_EXTS = (".pdf", ".png", ".jpg", ".mps", ".jpeg", ".PDF", ".PNG", ".JPG", ".JPEG")
+
+_OPT = r'(?:\[[^\]]*\])?'
+ASSET_RE = re.compile(
+    r'\\(includegraphics|includestandalone|inputpgf|input|pgfimage)\*?' + _OPT + r'\s*\{([^}]+)\}')
+CITE_RE = re.compile(
+    r'\\(?:[Pp]aren|[Tt]ext|[Aa]uto|foot|full|[Ss]mart)?cite[tp]?\*?' + _OPT + _OPT + r'\s*\{([^}]+)\}')
+# Sources that are themselves scanned for further assets
+_SCANNED_EXTS = (".tex", ".pgf", ".tikz")
+
+
+class AssetResolver:
+    """Resolve asset references against the book's search paths.
+
+    Args:
+        base_path: Book root (the directory documents are compiled in)
+        graphics_dirs: \\graphicspath entries relative to base_path
+        input_dirs: \\input@path entries relative to base_path
+    """
+
+    def __init__(self, base_path, graphics_dirs=GRAPHICS_DIRS, input_dirs=INPUT_DIRS):
+        self.base_path = Path(base_path).resolve()
+        self.graphics_dirs = graphics_dirs
+        self.input_dirs = input_dirs
+        self._listings: Dict[Path, frozenset] = {}
+        self._resolved: Dict[tuple, Optional[str]] = {}
+        self._closures: Dict[str, tuple] = {}
+
+    def _listing(self, directory: Path) -> frozenset:
+        listing = self._listings.get(directory)
+        if listing is None:
+            try:
+                listing = frozenset(os.listdir(directory))
+            except OSError:
+                listing = frozenset()
+            self._listings[directory] = listing
+        return listing
+
+    def _exists(self, path: Path) -> bool:
+        return path.name in self._listing(path.parent)
+
+    def _relative(self, path: Path) -> str:
+        return os.path.relpath(path, self.base_path)
+
+    def _candidates(self, kind: str, ref: str) -> List[str]:
+        suffix = Path(ref).suffix
+        if kind in ("includegraphics", "pgfimage"):
+            return [ref] if suffix else [ref + ext for ext in GRAPHICS_EXTS]
+        if kind == "includestandalone":
+            # standalone's default mode inputs the .tex source; image modes use the PDF
+            return [ref + ".tex", ref + ".pdf"] if suffix != ".tex" else [ref]
+        return [ref] if suffix else [ref + ".tex", ref]
+
+    def resolve(self, kind: str, ref: str, relative_to: Optional[Path] = None) -> Optional[str]:
+        """Path of the file TeX would open for ``\\<kind>{ref}``, relative to the book root.
+
+        ``relative_to`` is the directory of the file containing the reference
+        (for references inside standalone/PGF sources); it is searched first.
+        """
+        key = (kind, ref, relative_to)
+        if key in self._resolved:
+            return self._resolved[key]
+        dirs = self.graphics_dirs if kind in ("includegraphics", "pgfimage") else self.input_dirs
+        roots = [relative_to] if relative_to is not None else []
+        roots += [self.base_path / d for d in dirs]
+        found = None
+        for root in roots:
+            for name in self._candidates(kind, ref):
+                path = Path(os.path.normpath(root / name))
+                if self._exists(path):
+                    found = self._relative(path)
+                    break
+            if found:
+                break
+        self._resolved[key] = found
+        return found
+
+    def _closure(self, rel: str) -> tuple:
+        """Files referenced (recursively) from a standalone/PGF/TeX source."""
+        if rel in self._closures:
+            return self._closures[rel]
+        self._closures[rel] = ((), ())  # guard against cycles
+        path = self.base_path / rel
+        files: List[str] = []
+        missing: List[str] = []
+        try:
+            text = path.read_text(encoding="utf-8", errors="replace")
+        except OSError:
+            text = ""
+        for m in ASSET_RE.finditer(text):
+            kind, ref = m.group(1), m.group(2).strip()
+            # matplotlib's PGF backend references images relative to the .pgf itself
+            found = self.resolve(kind, ref, path.parent)
+            if not found:
+                missing.append(ref)
+                continue
+            files.append(found)
+            if found.endswith(_SCANNED_EXTS):
+                sub_files, sub_missing = self._closure(found)
+                files.extend(sub_files)
+                missing.extend(sub_missing)
+        self._closures[rel] = (tuple(files), tuple(missing))
+        return self._closures[rel]
+
+    def scan(self, *texts: str) -> Dict:
+        """Asset closure and cite keys of the given exercise/solution texts."""
+        files: List[str] = []
+        resolved: Dict[str, str] = {}
+        missing: List[str] = []
+        cite_keys: List[str] = []
+        for text in texts:
+            if not text:
+                continue
+            # Substring checks are much cheaper than running the regexes over every body
+            has_assets = "\\include" in text or "\\input" in text or "\\pgfimage" in text
+            for m in ASSET_RE.finditer(text) if has_assets else ():
+                kind, ref = m.group(1), m.group(2).strip()
+                found = self.resolve(kind, ref)
+                if not found:
+                    missing.append(ref)
+                    continue
+                resolved[ref] = found
+                files.append(found)
+                if found.endswith(_SCANNED_EXTS):
+                    sub_files, sub_missing = self._closure(found)
+                    files.extend(sub_files)
+                    missing.extend(sub_missing)
+            for m in CITE_RE.finditer(text) if "cite" in text else ():
+                cite_keys.extend(k.strip() for k in m.group(1).split(",") if k.strip())
+        return {
+            "files": list(dict.fromkeys(files)),
+            "resolved": resolved,
+            "cite_keys": list(dict.fromkeys(cite_keys)),
+            "missing": list(dict.fromkeys(missing)),
+        }
+
+
+def rewrite_asset_paths(text: str, resolved: Dict[str, str]) -> str:
+    """Replace asset references in text with their resolved paths."""
+    if not resolved:
+        return text
+
+    def replace(m: re.Match) -> str:
+        kind, ref = m.group(1), m.group(2).strip()
+        path = resolved.get(ref)
+        if not path:
+            return m.group(0)
+        if kind == "includestandalone":
+            # \includestandalone takes the name without extension
+            path = os.path.splitext(path)[0]
+        start, end = m.span(2)
+        return m.group(0)[:start - m.start()] + path + m.group(0)[end - m.start():]
+
+    return ASSET_RE.sub(replace, text)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Cache of biber output (.bbl) for generated documents.
+
+A document that loads biblatex needs a biber run and extra LaTeX passes
+to resolve its citations, although the bibliography is the same every
+time the same problems are cited. The .bbl biber writes depends only on
+
+  - the cited keys, in order of first citation (the documents use
+    ``sorting=none``),
+  - the contents of the ``\\addbibresource`` files, and
+  - the biblatex package options,
+
+so ``bbl_key`` hashes these three, and ``compile_pdf`` stores the .bbl
+under ``.exam-cache/bbl/<key>.bbl`` once biber has run without errors
+(latexmk exited 0, or biber did and its .blg reports no ERROR). On the
+next compile with the same key, the cached .bbl is placed beside the
+document before the first pass, and biber and the citation passes are
+skipped. Delete the cache after upgrading biblatex, whose .bbl format
+is versioned.
+"""
+from __future__ import annotations
+
+import os
+import re
+from pathlib import Path
+from typing import Optional
+
+from assets import CITE_RE
+from cache import cache_dir, content_key
+
+BIBLATEX_RE = re.compile(r'\\usepackage\s*(?:\[([^\]]*)\])?\s*\{biblatex\}')
+BIBRESOURCE_RE = re.compile(r'\\addbibresource\s*(?:\[[^\]]*\])?\s*\{([^}]+)\}')
+NOCITE_RE = re.compile(r'\\nocite\s*\{([^}]+)\}')
+
+
+def bbl_key(tex_text: str, book_dir) -> Optional[str]:
+    """Cache key of the .bbl for a document, or None if it does not use biblatex."""
+    package = BIBLATEX_RE.search(tex_text)
+    if not package:
+        return None
+    body = tex_text[tex_text.find('\\begin{document}'):]
+    keys = []
+    for m in CITE_RE.finditer(body):
+        keys.extend(k.strip() for k in m.group(1).split(',') if k.strip())
+    for m in NOCITE_RE.finditer(body):
+        keys.extend(k.strip() for k in m.group(1).split(',') if k.strip())
+    resources = []
+    for m in BIBRESOURCE_RE.finditer(tex_text):
+        path = Path(book_dir) / m.group(1).strip()
+        try:
+            resources.append(path.read_bytes())
+        except OSError:
+            # Found by kpsewhich, or missing: the key cannot capture its contents
+            return None
+    return content_key(package.group(1) or '', ','.join(dict.fromkeys(keys)), *resources)
+
+
+def restore_bbl(key: str, base_path, target: Path) -> bool:
+    """Copy the cached .bbl for key to target; return True on a cache hit."""
+    cached = cache_dir(base_path, 'bbl') / f"{key}.bbl"
+    if not cached.exists():
+        return False
+    import shutil  # imported here to keep generate_exam's startup light
+    shutil.copyfile(cached, target)
+    return True
+
+
+def biber_succeeded(result, blg: Path) -> bool:
+    """True if a biber run exited 0 and its .blg reports no errors."""
+    if result is None or result.returncode != 0:
+        return False
+    try:
+        return 'ERROR - ' not in blg.read_text(encoding='utf-8', errors='replace')
+    except OSError:
+        return True
+
+
+def store_bbl(key: str, base_path, bbl: Path) -> None:
+    """Store a .bbl produced by biber under key."""
+    if not bbl.exists() or bbl.stat().st_size == 0:
+        return
+    cached = cache_dir(base_path, 'bbl') / f"{key}.bbl"
+    tmp = cached.with_name(f"{cached.name}.{os.getpid()}.tmp")
+    import shutil
+    shutil.copyfile(bbl, tmp)
+    os.replace(tmp, cached)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Benchmark the exam/pset tooling on synthetic books.
+
+For each scale (number of exercises) a synthetic book is generated with
+synthetic_book.py and the following are timed, without invoking TeX:
+
+    load              ExerciseExtractor over all chapter files
+    lookup_id         get_exercise() by ID (per call)
+    lookup_hash       get_exercise() by hash (per call)
+    generate_exam     ExamGenerator.generate_exam() for a 30-problem exam
+    pset_init         PsetSolutionsGenerator() incl. .xsim numbering
+    pset_generate     PsetSolutionsGenerator.generate() for 30 problems
+    clean_solutions   clean_solution_markdown() over every solution
+    validate          validate_exercises.validate_extractor()
+
+Each measurement is the best of --repeat runs. Results are written as JSON
+and can be compared against an earlier results file to spot regressions.
+
+Usage:
+    bench.py [--scales 100,1000,10000,50000] [--output results.json]
+    bench.py --compare baseline.json [--threshold 1.25]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+_here = Path(__file__).resolve().parent
+sys.path.insert(0, str(_here))
+sys.path.insert(0, str(_here.parent / "psets"))
+
+from generate_exam import ExamGenerator, ExerciseExtractor  # noqa: E402
+from generate_pset_solutions import PsetSolutionsGenerator, clean_solution_markdown  # noqa: E402
+from synthetic_book import generate_book  # noqa: E402
+from validate_exercises import validate_extractor  # noqa: E402
+
+RESULTS_VERSION = 1
+EXAM_PROBLEMS = 30
+LOOKUPS = 2000
+# Measurements (whole runs, not per call) shorter than this are too noisy to compare
+NOISE_FLOOR_S = 2e-3
+PER_CALL = {"lookup_id": LOOKUPS, "lookup_hash": LOOKUPS}
+
+
+def best_of(repeat: int, fn: Callable[[], object], per: int = 1) -> float:
+    """Best wall-clock time of fn() over repeat runs, divided by per."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best / per
+
+
+def bench_scale(exercises: int, chapters: int, repeat: int, jobs: int) -> dict:
+    """Run every benchmark on one synthetic book and return timings in seconds."""
+    with tempfile.TemporaryDirectory(prefix="exam-bench-") as tmp:
+        book = Path(tmp)
+        ids = generate_book(book, chapters, exercises)
+        rng = random.Random(0)
+
+        results = {"exercises": exercises, "chapters": chapters}
+        results["load"] = best_of(repeat, lambda: ExerciseExtractor(book, "ch*_exercises.tex", jobs=jobs))
+
+        extractor = ExerciseExtractor(book, "ch*_exercises.tex", jobs=jobs)
+        sample_ids = [rng.choice(ids) for _ in range(LOOKUPS)]
+        sample_hashes = [extractor.exercises_db[i]["hash"] for i in sample_ids]
+        results["lookup_id"] = best_of(
+            repeat, lambda: [extractor.get_exercise(i) for i in sample_ids], LOOKUPS)
+        results["lookup_hash"] = best_of(
+            repeat, lambda: [extractor.get_exercise(h) for h in sample_hashes], LOOKUPS)
+
+        problems = [{"id": i, "points": 10} for i in rng.sample(ids, min(EXAM_PROBLEMS, len(ids)))]
+        config = {"title": "Benchmark", "problems": problems, "base_path_resolved": str(book),
+                  "output_dir": str(book), "include_solutions": True}
+        exam = ExamGenerator(extractor)
+        results["generate_exam"] = best_of(repeat, lambda: exam.generate_exam(config))
+
+        results["pset_init"] = best_of(repeat, lambda: PsetSolutionsGenerator(extractor))
+        pset = PsetSolutionsGenerator(extractor)
+        pset_config = {"title": "Benchmark", "problems": problems, "base_path_resolved": str(book)}
+        results["pset_generate"] = best_of(repeat, lambda: pset.generate(pset_config))
+
+        solutions = [(ex["solution"], ex["id"]) for ex in extractor.exercises_db.values()]
+        results["clean_solutions"] = best_of(
+            repeat, lambda: [clean_solution_markdown(s, i) for s, i in solutions])
+
+        results["validate"] = best_of(repeat, lambda: validate_extractor(extractor))
+        return results
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> int:
+    """Print current/baseline ratios and return the number of regressions."""
+    base_by_scale = {r["exercises"]: r for r in baseline.get("results", [])}
+    regressions = 0
+    print()
+    print(f"Comparison against baseline ({baseline.get('created', '?')}), threshold x{threshold}:")
+    for r in current["results"]:
+        b = base_by_scale.get(r["exercises"])
+        if not b:
+            continue
+        for key, value in r.items():
+            if key in ("exercises", "chapters") or key not in b or not b[key]:
+                continue
+            ratio = value / b[key]
+            flag = ""
+            if b[key] * PER_CALL.get(key, 1) < NOISE_FLOOR_S:
+                flag = "  (below noise floor)"
+            elif ratio > threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(f"  {r['exercises']:>7} {key:<16} x{ratio:6.2f}{flag}")
+    return regressions
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--scales", default="100,1000,10000,50000",
+                    help="Comma-separated exercise counts (default: 100,1000,10000,50000)")
+    ap.add_argument("--chapters", type=int, default=0,
+                    help="Chapters per book (default: one per 100 exercises, at least 1)")
+    ap.add_argument("--repeat", type=int, default=3, help="Runs per measurement; best is kept")
+    ap.add_argument("--jobs", type=int, default=1, help="Extractor parse processes")
+    ap.add_argument("--output", "-o", type=Path, help="Write results JSON here")
+    ap.add_argument("--compare", type=Path, help="Baseline results JSON to compare against")
+    ap.add_argument("--threshold", type=float, default=1.25,
+                    help="Slowdown ratio reported as a regression (default: 1.25)")
+    args = ap.parse_args()
+
+    scales = [int(s) for s in args.scales.split(",") if s.strip()]
+    report = {
+        "version": RESULTS_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeat": args.repeat,
+        "jobs": args.jobs,
+        "results": [],
+    }
+
+    print(f"{'exercises':>9} {'load s':>9} {'id us':>7} {'hash us':>8} {'exam ms':>8} "
+          f"{'pset ms':>8} {'clean s':>8} {'valid s':>8}")
+    for n in scales:
+        chapters = args.chapters or max(1, n // 100)
+        r = bench_scale(n, chapters, args.repeat, args.jobs)
+        report["results"].append(r)
+        print(f"{n:>9} {r['load']:>9.3f} {r['lookup_id'] * 1e6:>7.2f} {r['lookup_hash'] * 1e6:>8.2f} "
+              f"{r['generate_exam'] * 1e3:>8.2f} {r['pset_generate'] * 1e3:>8.2f} "
+              f"{r['clean_solutions']:>8.3f} {r['validate']:>8.3f}", flush=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written: {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
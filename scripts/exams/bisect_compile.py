@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Find the exercise(s) that break a compile by parallel bisection.
+
+Used by ``generate_exam.py --bisect`` and ``generate_pset_solutions.py
+--bisect`` when compilation fails. The problem list is split into as many
+groups as there are workers. For each group a sub-document is rendered
+with the same generator, so it has the same preamble. The sub-documents
+are compiled concurrently, and the groups that fail are split again until
+single problems remain.
+
+Each sub-document is compiled in its own build directory
+(``-output-directory``), with the book root as the working directory, so
+figures, styles and the book .aux resolve exactly as in a normal compile
+and concurrent runs never share an .aux or .log. A single pdflatex pass
+with ``-halt-on-error`` is enough to see the error; latexmk is used only
+when pdflatex is not available.
+
+The header alone is compiled first. If it fails, the template (not an
+exercise) is at fault. If a set of problems fails only as a whole while
+every part compiles, the set is reported as failing together.
+"""
+from __future__ import annotations
+
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from generate_exam import find_tex_tool
+from profiling import Profiler
+
+LOG_CONTEXT_LINES = 6
+MAX_EXCERPT_ERRORS = 3
+
+
+def log_excerpt(log_text: str) -> str:
+    """The TeX error messages ('!' lines and the lines after them) from a .log."""
+    lines = log_text.splitlines()
+    excerpts = []
+    for i, line in enumerate(lines):
+        if line.startswith('!'):
+            excerpts.append('\n'.join(lines[i:i + LOG_CONTEXT_LINES]).rstrip())
+            if len(excerpts) == MAX_EXCERPT_ERRORS:
+                break
+    if not excerpts and lines:
+        # No TeX error line (e.g. a crash or missing file); show the tail
+        excerpts.append('\n'.join(lines[-LOG_CONTEXT_LINES:]))
+    return '\n\n'.join(excerpts)
+
+
+class IsolatedCompiler:
+    """Compile documents in separate build directories under one temporary root."""
+
+    def __init__(self, book_dir, profiler: Optional[Profiler] = None):
+        self.book_dir = Path(book_dir).resolve()
+        self.profiler = profiler or Profiler('bisect')
+        self.pdflatex = find_tex_tool('pdflatex')
+        self.latexmk = find_tex_tool('latexmk')
+        self._tmp = tempfile.TemporaryDirectory(prefix='exam-bisect-')
+        self.root = Path(self._tmp.name)
+
+    @property
+    def available(self) -> bool:
+        return bool(self.pdflatex or self.latexmk)
+
+    def compile(self, name: str, latex: str) -> Tuple[bool, str]:
+        """Compile latex as <name>.tex; return (success, log excerpt)."""
+        build = self.root / name
+        build.mkdir(parents=True, exist_ok=True)
+        tex = build / f"{name}.tex"
+        tex.write_text(latex, encoding='utf-8')
+        # minted writes its cache next to the other outputs, as in compile_pdf
+        tex_input = f"\\PassOptionsToPackage{{outputdir={build}}}{{minted}}\\input{{{tex}}}"
+        if self.pdflatex:
+            cmd = [self.pdflatex, '-interaction=nonstopmode', '-halt-on-error', '-shell-escape',
+                   f'-jobname={name}', f'-output-directory={build}', tex_input]
+        else:
+            cmd = [self.latexmk, '-pdf', '-interaction=nonstopmode', '-halt-on-error', '-shell-escape',
+                   f'-jobname={name}', f'-outdir={build}', f"-pdflatex=pdflatex %O '{tex_input}'", str(tex)]
+        result = self.profiler.run(cmd, capture_output=True, text=True, cwd=self.book_dir,
+                                   stdin=subprocess.DEVNULL)
+        ok = result.returncode == 0 and (build / f"{name}.pdf").exists()
+        if ok:
+            return True, ''
+        log = build / f"{name}.log"
+        text = log.read_text(encoding='utf-8', errors='replace') if log.exists() else (result.stdout or '')
+        return False, log_excerpt(text)
+
+    def cleanup(self):
+        self._tmp.cleanup()
+
+
+def bisect_problems(problems: List, render: Callable[[List], str], book_dir, jobs: int = 1,
+                    profiler: Optional[Profiler] = None) -> Dict:
+    """Narrow a failing problem list down to the problems that break the compile.
+
+    Args:
+        problems: The config's problem list (failing as a whole)
+        render: Returns the complete LaTeX document for a subset of problems
+        book_dir: Book root (compile working directory)
+        jobs: Number of concurrent compiles
+
+    Returns:
+        {'culprits': [(problem, excerpt)], 'together': [(problems, excerpt)],
+         'header_error': excerpt or None, 'compiles': n}
+    """
+    compiler = IsolatedCompiler(book_dir, profiler)
+    report = {'culprits': [], 'together': [], 'header_error': None, 'compiles': 0}
+    if not compiler.available:
+        raise RuntimeError("No LaTeX toolchain found (latexmk or pdflatex)")
+    jobs = max(1, jobs)
+    lock = threading.Lock()
+
+    def run(subset: List) -> Tuple[bool, str]:
+        # Called from the pool's worker threads
+        with lock:
+            report['compiles'] += 1
+            number = report['compiles']
+        return compiler.compile(f"part{number:04d}", render(subset))
+
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            ok, excerpt = run([])
+            if not ok:
+                report['header_error'] = excerpt
+                return report
+
+            # Work list of failing groups still to be split
+            pending = [(list(problems), None)]
+            while pending:
+                groups = []
+                for group, excerpt in pending:
+                    if len(group) == 1:
+                        report['culprits'].append((group[0], excerpt or run(group)[1]))
+                        continue
+                    n = min(len(group), max(2, jobs // max(1, len(pending))))
+                    size = -(-len(group) // n)
+                    parts = [group[i:i + size] for i in range(0, len(group), size)]
+                    groups.append((group, excerpt, parts))
+                if not groups:
+                    break
+
+                subsets = [part for _, _, parts in groups for part in parts]
+                results = iter(pool.map(run, subsets))
+                pending = []
+                for group, excerpt, parts in groups:
+                    failing = []
+                    for part in parts:
+                        part_ok, part_excerpt = next(results)
+                        if not part_ok:
+                            failing.append((part, part_excerpt))
+                    if failing:
+                        pending.extend(failing)
+                    else:
+                        report['together'].append((group, excerpt or ''))
+        return report
+    finally:
+        compiler.cleanup()
+
+
+def _problem_id(problem) -> str:
+    return problem.get('id') if isinstance(problem, dict) else str(problem)
+
+
+def print_bisect_report(report: Dict):
+    print()
+    print(f"Bisection finished after {report['compiles']} compile(s).")
+    if report['header_error'] is not None:
+        print("✗ The document fails to compile with no problems at all; the template or preamble is at fault:")
+        print(report['header_error'])
+        return
+    for problem, excerpt in report['culprits']:
+        print(f"✗ Problem {_problem_id(problem)} fails to compile:")
+        print('    ' + excerpt.replace('\n', '\n    '))
+    for group, excerpt in report['together']:
+        ids = ', '.join(_problem_id(p) for p in group)
+        print(f"✗ Problems {ids} compile separately but fail together:")
+        if excerpt:
+            print('    ' + excerpt.replace('\n', '\n    '))
+    if not report['culprits'] and not report['together']:
+        print("All sub-documents compiled; the failure may depend on the full build (bibliography, passes).")
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Shared on-disk cache for the exam/pset tooling.
+
+Cached results (static check results, and later build artifacts) live
+under ``EXAM_CACHE_DIR`` if set, otherwise ``<book root>/.exam-cache/``.
+Entries are content-addressed: keys are hashes of everything the result
+depends on, so stale entries are never reused and the directory can be
+deleted at any time.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+
+def cache_dir(base_path, *parts: str) -> Path:
+    """Return (and create) a directory under the cache root."""
+    root = Path(os.environ.get("EXAM_CACHE_DIR") or Path(base_path) / ".exam-cache")
+    path = root.joinpath(*parts)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def content_key(*parts) -> str:
+    """Hash of the given strings/bytes, usable as a cache key or file name."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def load_json(path: Path, default=None):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json(path: Path, data) -> None:
+    """Write JSON atomically, so concurrent readers never see a partial file."""
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
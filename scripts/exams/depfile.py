@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Make-compatible dependency files for generated exams and psets.
+
+After writing ``exams/foo.tex`` the generators write ``exams/foo.d``:
+
+    exams/foo.tex exams/foo.pdf: exams/foo.yaml common/versioned/cedar/index.tex \\
+      common/versioned/cedar/source.md common/figures/bode.pdf ...
+    exams/foo.yaml:
+    common/versioned/cedar/index.tex:
+    ...
+
+listing everything the document was built from: the config, the exercise
+files of the selected problems, the versioned ``source.md`` they are
+generated from (via common/source-dependencies.json), the assets those
+exercises reference (see assets.py), the book style files, the
+bibliography and the book ``.aux`` used for cross-references. The
+book's Makefile includes the ``.d`` files, so ``make exams/foo.pdf`` is a
+no-op until one of those changes. As with ``gcc -MP``, every prerequisite
+also gets an empty rule so deleting a file does not break the build.
+
+Paths are written relative to the book root, where make runs.
+"""
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+STYLE_FILES = ("bookmathmacros.sty", "booktikz.sty", "bookcolors.sty")
+DEPS_FILE = "common/source-dependencies.json"
+
+
+def _versioned_sources(base_path: Path, ids: Iterable[str]) -> List[Path]:
+    """source.md (and the map itself) for versioned files holding the given IDs."""
+    deps_path = base_path / DEPS_FILE
+    try:
+        with open(deps_path) as f:
+            deps = json.load(f)
+    except (OSError, ValueError):
+        return []
+    wanted = set(ids)
+    sources = [deps_path]
+    for version, members in deps.items():
+        if isinstance(members, list) and wanted.intersection(map(str, members)):
+            sources.append(base_path / "common" / "versioned" / str(version) / "source.md")
+    return sources
+
+
+def document_dependencies(extractor, problem_specs: List, styles_path: str,
+                          extra: Iterable[Optional[str]] = ()) -> List[Path]:
+    """Files a document generated from problem_specs depends on (absolute paths).
+
+    Args:
+        extractor: Loaded ExerciseExtractor
+        problem_specs: The config's problem list (IDs, hashes or dicts with 'id')
+        styles_path: Book style directory relative to the book root
+        extra: Further files (config, bibliography, book .aux), absolute or
+               relative to the book root; None entries are skipped
+    """
+    base_path = Path(extractor.base_path).resolve()
+    deps: List[Path] = [base_path / p for p in extra if p]
+    ids = []
+    for exercise in extractor.select(problem_specs):
+        ids.append(exercise['id'])
+        deps.append(base_path / exercise['path'])
+        deps.extend(base_path / f for f in exercise.get('assets', {}).get('files', []))
+    deps.extend(_versioned_sources(base_path, ids))
+    deps.extend(base_path / styles_path / name for name in STYLE_FILES)
+    return [p for p in dict.fromkeys(Path(os.path.normpath(d)) for d in deps) if p.exists()]
+
+
+def _make_escape(path: str) -> str:
+    return path.replace('$', '$$').replace('#', '\\#').replace(' ', '\\ ')
+
+
+def write_depfile(depfile: Path, targets: Iterable, deps: Iterable, root) -> bool:
+    """Write a make rule ``targets: deps`` plus empty rules for each dep.
+
+    Paths are made relative to root. The file is only rewritten when its
+    content changes; returns True if it was written.
+    """
+    root = Path(root).resolve()
+
+    def rel(p) -> str:
+        return _make_escape(os.path.relpath(Path(p).resolve(), root))
+
+    prereqs = [rel(d) for d in deps]
+    rule = ' '.join(rel(t) for t in targets) + ':' + ''.join(f' \\\n  {p}' for p in prereqs)
+    text = rule + '\n\n' + ''.join(f'{p}:\n' for p in prereqs)
+
+    depfile = Path(depfile)
+    try:
+        if depfile.read_text(encoding='utf-8') == text:
+            return False
+    except OSError:
+        pass
+    depfile.write_text(text, encoding='utf-8')
+    return True
@@ -28,7 +28,9 @@ cd "$SCRIPT_DIR"
 # Configuration
 PYTHON=${PYTHON:-python3}
 EXAM_GENERATOR="generate_exam.py"
-DEPS_REBUILDER="rebuild_deps.py"
+# Single-process entry point: rebuilds the versioned index.tex files the
+# requested problems live in (rebuild_deps.py) and then generates the exam
+EXAM_CLI="exam_cli.py"
 LATEX=${LATEX:-pdflatex}
 
 # Default paths (can be overridden)
@@ -61,13 +63,17 @@ print_info() {
 }
 
 # Check dependencies
+# PyYAML is only probed for commands that read or write YAML, so listing,
+# validation and statistics don't pay for an extra interpreter start.
 check_dependencies() {
+    local needs_yaml="$1"
+
     if ! command -v $PYTHON &> /dev/null; then
         print_error "Python3 not found. Please install Python 3."
         exit 1
     fi
     
-    if ! $PYTHON -c "import yaml" &> /dev/null; then
+    if [[ "$needs_yaml" == "true" ]] && ! $PYTHON -c "import yaml" &> /dev/null; then
         print_warning "PyYAML not found. Installing..."
         $PYTHON -m pip install pyyaml
     fi
@@ -95,8 +101,8 @@ COMMANDS:
     --config FILE           Generate and compile exam from YAML configuration file
     --no-quick FILE         Generate exam without compiling (use with --config or --problems)
     --solutions PROBLEMS    Generate exam with solutions
-    --validate              Validate exercise database
-    --stats                 Show exercise database statistics
+    --validate [--json]     Validate exercise database (JSON report for CI)
+    --stats [--format json] Show exercise database statistics
 
 OPTIONS (for --problems and --quick):
     --title TITLE           Exam title (default: "Exam")
@@ -111,6 +117,8 @@ ENVIRONMENT VARIABLES:
     BASE_PATH               Path to book directory (default: "../..")
     EXERCISE_PATTERN        Glob pattern for exercise files (default: "ch*_exercises.tex")
     STYLES_PATH             Path to book styles (default: "common/styles-tex")
+    PANDOC_TEX_ARGS         pandoc arguments for source.md -> index.tex; stale versioned
+                            problems are then converted from source.md, one by one
 
 EXAMPLES:
     # List available exercises
@@ -138,7 +146,7 @@ EOF
 # List available exercises
 list_exercises() {
     print_info "Available exercises:"
-    $PYTHON "$EXAM_GENERATOR" --list --base-path "$BASE_PATH" --exercise-pattern "$EXERCISE_PATTERN"
+    $PYTHON "$EXAM_CLI" list --base-path "$BASE_PATH" --exercise-pattern "$EXERCISE_PATTERN"
 }
 
 # Create sample configuration
@@ -148,42 +156,16 @@ create_sample_config() {
     print_success "Sample configuration created: exam_config_sample.yaml"
 }
 
-# Rebuild the specific versioned index.tex files that the requested problems
-# live in, using source-dependencies.json to map problem IDs -> versioned files.
-# This runs `make` on just those targets (from the book root) so problem-source
-# edits propagate into the exam without requiring a full-book rebuild.
-# Failures here are fatal: a stale versioned file would silently produce a
-# stale exam, which is worse than aborting.
-rebuild_dependencies_for_problems() {
-    local problems="$1"
-    if [[ ! -f "$DEPS_REBUILDER" ]]; then
-        return 0
-    fi
-    print_info "Rebuilding versioned index.tex files for: $problems"
-    "$PYTHON" "$DEPS_REBUILDER" --problems "$problems" --base-path "$BASE_PATH"
-}
-
-rebuild_dependencies_for_config() {
-    local config_file="$1"
-    if [[ ! -f "$DEPS_REBUILDER" ]]; then
-        return 0
-    fi
-    print_info "Rebuilding versioned index.tex files for: $config_file"
-    "$PYTHON" "$DEPS_REBUILDER" --config "$config_file" --base-path "$BASE_PATH"
-}
-
 # Generate exam from problems list
 generate_exam_from_problems() {
     local problems="$1"
     local no_quick="$2"
     shift 2
 
-    rebuild_dependencies_for_problems "$problems"
-
     print_info "Generating exam with problems: $problems"
     
     # Build command with optional parameters
-    local cmd=("$PYTHON" "$EXAM_GENERATOR" "--problems" "$problems" "--base-path" "$BASE_PATH" "--exercise-pattern" "$EXERCISE_PATTERN" "--styles-path" "$STYLES_PATH")
+    local cmd=("$PYTHON" "$EXAM_CLI" "exam" "--problems" "$problems" "--base-path" "$BASE_PATH" "--exercise-pattern" "$EXERCISE_PATTERN" "--styles-path" "$STYLES_PATH")
     
     if [[ "$no_quick" == "true" ]]; then
         cmd+=("--no-quick")
@@ -245,11 +227,9 @@ generate_exam_from_config() {
         exit 1
     fi
 
-    rebuild_dependencies_for_config "$config_file"
-
     print_info "Generating exam from configuration: $config_file"
     
-    local cmd=("$PYTHON" "$EXAM_GENERATOR" "--config" "$config_file" "--base-path" "$BASE_PATH" "--exercise-pattern" "$EXERCISE_PATTERN" "--styles-path" "$STYLES_PATH")
+    local cmd=("$PYTHON" "$EXAM_CLI" "exam" "--config" "$config_file" "--base-path" "$BASE_PATH" "--exercise-pattern" "$EXERCISE_PATTERN" "--styles-path" "$STYLES_PATH")
     if [[ "$no_quick" == "true" ]]; then
         cmd+=("--no-quick")
     fi
@@ -264,93 +244,27 @@ generate_exam_from_config() {
 # Validate exercise database
 validate_database() {
     print_info "Validating exercise database..."
-    
-    $PYTHON -c "
-import sys
-sys.path.append('.')
-try:
-    from generate_exam import ExerciseExtractor
-    extractor = ExerciseExtractor('$BASE_PATH', '$EXERCISE_PATTERN')
-    exercises = extractor.list_exercises()
-    print(f'✓ Successfully loaded {len(exercises)} exercises')
-    
-    warnings = 0
-    for ex_id, ex in exercises.items():
-        if not ex['content'].strip():
-            print(f'⚠ Warning: Exercise {ex_id} has empty content')
-            warnings += 1
-        if ex['solution'] and not ex['solution'].strip():
-            print(f'⚠ Warning: Exercise {ex_id} has empty solution')
-            warnings += 1
-    
-    if warnings == 0:
-        print('✓ No issues found')
-    else:
-        print(f'⚠ Found {warnings} warnings')
-        
-    print('Validation complete')
-except Exception as e:
-    print(f'✗ Validation failed: {e}')
-    sys.exit(1)
-"
+    "$PYTHON" "$EXAM_CLI" validate --base-path "$BASE_PATH" --exercise-pattern "$EXERCISE_PATTERN" "$@"
     print_success "Database validation completed"
 }
 
 # Show statistics
 show_stats() {
     print_info "Exercise Database Statistics:"
-    
-    $PYTHON -c "
-import sys
-from pathlib import Path
-import re
-
-def count_exercises_in_file(file_path):
-    if not file_path.exists():
-        return 0
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        return len(re.findall(r'\\\\begin\{exercise\}', content))
-    except Exception:
-        return 0
-
-base_path = Path('$BASE_PATH')
-exercise_files = sorted(base_path.glob('$EXERCISE_PATTERN'))
-
-total_exercises = 0
-files_found = 0
-
-for file_path in exercise_files:
-    count = count_exercises_in_file(file_path)
-    total_exercises += count
-    files_found += 1
-    status = '✓' if file_path.exists() else '✗'
-    print(f'{file_path.name}: {count} exercises {status}')
-
-print(f'Total exercises: {total_exercises}')
-print(f'Files found: {files_found}')
-
-# Try to load with the extractor for comparison
-try:
-    from generate_exam import ExerciseExtractor
-    extractor = ExerciseExtractor('$BASE_PATH', '$EXERCISE_PATTERN')
-    exercises = extractor.list_exercises()
-    print(f'Exercises loaded by extractor: {len(exercises)}')
-    
-    if len(exercises) != total_exercises:
-        print(f'⚠ Warning: Mismatch between file count ({total_exercises}) and extractor count ({len(exercises)})')
-except ImportError:
-    print('Note: Could not import exercise extractor for verification')
-except Exception as e:
-    print(f'Note: Error loading exercise extractor: {e}')
-"
+    "$PYTHON" "$EXAM_CLI" stats --base-path "$BASE_PATH" --exercise-pattern "$EXERCISE_PATTERN" "$@"
 }
 
 # Main script logic
 main() {
     # Check dependencies
-    check_dependencies
+    case "${1:-}" in
+        --list|-l|list|--validate|validate|--stats|stats|--help|-h|help|"")
+            check_dependencies "false"
+            ;;
+        *)
+            check_dependencies "true"
+            ;;
+    esac
     
     # Parse command line arguments
     case "${1:-}" in
@@ -423,10 +337,12 @@ main() {
             generate_exam_from_problems "$problems_list" "false" --solutions "$@"
             ;;
         --validate|validate)
-            validate_database
+            shift
+            validate_database "$@"
             ;;
         --stats|stats)
-            show_stats
+            shift
+            show_stats "$@"
             ;;
         "")
             print_error "No command specified"
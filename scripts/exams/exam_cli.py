@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Single entry point for the exam/pset tools.
+
+Runs every step in one Python process: ``exam`` and ``pset`` rebuild the
+versioned index.tex files their problems live in (rebuild_deps) and then
+generate, without a second interpreter. Modules are imported only when a
+subcommand needs them, so ``list``, ``validate`` and ``stats`` never load
+YAML, subprocess or the pset generator.
+
+Usage:
+    exam_cli.py list
+    exam_cli.py validate [--json] [--report FILE]
+    exam_cli.py stats [--format json] [--profiles DIR]
+    exam_cli.py deps (--config FILE | --problems IDS) [--print-only]
+    exam_cli.py export [--output-dir DIR] [--format jsonl|binary|both] [--if-stale]
+    exam_cli.py exam (--config FILE | --problems IDS) [generate_exam options]
+    exam_cli.py pset (--config FILE | --problems IDS) [pset options]
+    exam_cli.py roster --config FILE --roster CSV [roster options]
+    exam_cli.py assemble (--manifest FILE | PDF...) [-o OUTPUT] [--batch-size N]
+
+Every subcommand accepts the options of the script it wraps; BASE_PATH,
+EXERCISE_PATTERN and STYLES_PATH are honoured as before. ``exam``,
+``pset`` and ``roster`` also accept ``--no-deps`` to skip the
+versioned-file rebuild. With ``PANDOC_TEX_ARGS`` set (the book's
+pandoc arguments for source.md -> index.tex), a failed rebuild (e.g. no
+make or pandoc batch here) is only a warning: the extractor reads the
+exercise divs of stale versioned files from source.md and converts just
+those (see mdexercises.py).
+"""
+from __future__ import annotations
+
+import argparse
+import importlib
+import os
+import sys
+from pathlib import Path
+
+_here = Path(__file__).resolve().parent
+_psets_dir = _here.parent / "psets"
+
+# subcommand -> (module, extra leading argv, help)
+COMMANDS = {
+    "list": ("generate_exam", ["--list"], "List available exercises"),
+    "validate": ("validate_exercises", [], "Validate the exercise database"),
+    "stats": ("show_stats", [], "Show exercise database statistics"),
+    "deps": ("rebuild_deps", [], "Rebuild versioned index.tex files for problems"),
+    "export": ("export_db", [], "Export the exercise database (JSON Lines / binary)"),
+    "exam": ("generate_exam", [], "Rebuild dependencies, then generate an exam"),
+    "pset": ("generate_pset_solutions", [], "Rebuild dependencies, then generate pset solutions"),
+    "roster": ("roster", [], "Rebuild dependencies, then generate one exam per student"),
+    "assemble": ("assemble_pdfs", [], "Merge compiled PDFs into print-ready files"),
+}
+
+
+def _load(module: str):
+    if str(_here) not in sys.path:
+        sys.path.insert(0, str(_here))
+    if module == "generate_pset_solutions" and str(_psets_dir) not in sys.path:
+        sys.path.insert(0, str(_psets_dir))
+    return importlib.import_module(module)
+
+
+def _rebuild_dependencies(argv: list[str]) -> int:
+    """Run rebuild_deps in-process for the --config/--problems in argv."""
+    ap = argparse.ArgumentParser(add_help=False)
+    ap.add_argument("--config")
+    ap.add_argument("--problems")
+    ap.add_argument("--base-path", default=os.environ.get("BASE_PATH", "../.."))
+    known, _ = ap.parse_known_args(argv)
+    if not known.config and not known.problems:
+        return 0
+
+    rebuild_deps = _load("rebuild_deps")
+    if known.config:
+        ids = rebuild_deps.load_problem_ids_from_config(Path(known.config))
+    else:
+        ids = rebuild_deps.parse_problem_ids(known.problems)
+    print(f"Rebuilding versioned index.tex files for: {known.config or known.problems}", file=sys.stderr)
+    return rebuild_deps.rebuild(ids, Path(known.base_path))
+
+
+def main(argv: list[str] | None = None) -> int:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or argv[0] in ("-h", "--help", "help"):
+        print(__doc__.strip())
+        print("\nSubcommands:")
+        for name, (_, _, text) in COMMANDS.items():
+            print(f"  {name:<10} {text}")
+        return 0
+
+    command, rest = argv[0], argv[1:]
+    if command not in COMMANDS:
+        print(f"exam_cli: unknown subcommand '{command}' (see --help)", file=sys.stderr)
+        return 2
+    module, extra, _ = COMMANDS[command]
+
+    if command == "deps" and "--base-path" not in rest:
+        rest += ["--base-path", os.environ.get("BASE_PATH", "../..")]
+
+    if command in ("exam", "pset", "roster"):
+        if "--no-deps" in rest:
+            rest = [a for a in rest if a != "--no-deps"]
+        elif not any(a in ("--list", "--sample-config", "-h", "--help") for a in rest):
+            # A stale versioned file would silently produce a stale document
+            status = _rebuild_dependencies(rest)
+            if status and os.environ.get("PANDOC_TEX_ARGS"):
+                print("⚠ Warning: rebuilding versioned files failed; reading stale ones from source.md",
+                      file=sys.stderr)
+            elif status:
+                return status
+        if "--styles-path" not in rest and os.environ.get("STYLES_PATH"):
+            rest += ["--styles-path", os.environ["STYLES_PATH"]]
+
+    status = _load(module).main(extra + rest)
+    return status or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+Export the exercise database for downstream tools.
+
+Parses the book once with ExerciseExtractor and writes every exercise (ID,
+hash, file, line, options, body, solution, xsim number, resolved assets)
+to a versioned export, so LMS sync, website and grading scripts can read
+the pool without importing the extractor or re-parsing LaTeX.
+
+Two formats are written:
+
+JSON Lines (``exercises.jsonl``)
+    The first line is a header ``{"format": "meta-book-exercises",
+    "version": 1, "count": N, "base_path": ..., "patterns": [...],
+    "sources": {...}, "encoding": "json"}``; every following line is one
+    exercise record.
+
+Binary (``exercises.exdb``)
+    A fixed preamble, the header as JSON, the IDs and hashes as
+    newline-separated UTF-8, an offset table of N+1 little-endian uint64
+    and the concatenated records (JSON, or msgpack with ``--msgpack``).
+    ExerciseDB memory-maps the file and decodes only the records asked for.
+
+The header records the size and mtime of every source file (exercise
+files, versioned source.md, .xsim and the resolved assets), so
+``--if-stale`` skips the export when nothing in the book changed.
+
+Usage:
+    export_db.py [--base-path PATH] [--output-dir DIR] [--format jsonl|binary|both]
+    export_db.py --if-stale
+    export_db.py --show exercises.exdb [IDS...]
+
+Reading from Python:
+    from export_db import ExerciseDB
+    db = ExerciseDB("exercises.exdb")
+    db.get_exercise("madrid")["solution"]
+
+Author: meta-book project
+Date: 2024
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+FORMAT_NAME = "meta-book-exercises"
+EXPORT_VERSION = 1
+MAGIC = b"MBEXDB\x00\x00"
+# magic, version, encoding, count, header length, ids length, hashes length
+PREAMBLE = struct.Struct("<8sHHIIII")
+ENCODINGS = {"json": 0, "msgpack": 1}
+
+# Record fields written to the export (in this order)
+FIELDS = ("id", "hash", "number", "file", "path", "line", "options", "content",
+          "solution", "has_solution", "has_hash", "full_exercise", "full_solution", "assets")
+
+
+def _source_files(base_path: Path, patterns: list[str]) -> list[Path]:
+    files = []
+    for pattern in patterns:
+        files.extend(sorted(base_path.glob(pattern)))
+        if pattern.endswith("/index.tex"):
+            # Versioned sections: the extractor reads source.md on top of index.tex
+            files.extend(sorted(base_path.glob(pattern[:-len("index.tex")] + "source.md")))
+    files.extend(sorted(base_path.glob("*.xsim")))
+    return list(dict.fromkeys(files))
+
+
+def source_stamps(base_path: Path, patterns: list[str], extra: Iterable[str] = ()) -> dict:
+    """Map each source file (exercise files, source.md, .xsim and extra paths) to [size, mtime_ns].
+
+    A missing extra file (e.g. a deleted asset) is stamped None.
+    """
+    stamps = {}
+    for f in _source_files(base_path, patterns):
+        st = f.stat()
+        try:
+            key = str(f.relative_to(base_path))
+        except ValueError:
+            key = f.name
+        stamps[key] = [st.st_size, st.st_mtime_ns]
+    for rel in extra:
+        if rel in stamps:
+            continue
+        try:
+            st = (base_path / rel).stat()
+        except OSError:
+            stamps[rel] = None
+            continue
+        stamps[rel] = [st.st_size, st.st_mtime_ns]
+    return stamps
+
+
+def build_records(extractor, numbers: dict) -> list[dict]:
+    """Export records for every exercise in the extractor, in load order."""
+    records = []
+    for ex in extractor.exercises_db.values():
+        record = {k: ex.get(k) for k in FIELDS}
+        record["number"] = numbers.get(ex["id"])
+        records.append(record)
+    return records
+
+
+def _header(extractor, records: list[dict], encoding: str) -> dict:
+    assets = [f for r in records for f in (r.get("assets") or {}).get("files", [])]
+    return {
+        "format": FORMAT_NAME,
+        "version": EXPORT_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "count": len(records),
+        "encoding": encoding,
+        "base_path": str(Path(extractor.base_path).resolve()),
+        "patterns": extractor.exercise_patterns,
+        "sources": source_stamps(Path(extractor.base_path), extractor.exercise_patterns, assets),
+    }
+
+
+def _encoder(encoding: str):
+    if encoding == "msgpack":
+        import msgpack
+        return msgpack.packb
+    return lambda r: json.dumps(r, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _decoder(encoding: str):
+    if encoding == "msgpack":
+        import msgpack
+        return lambda b: msgpack.unpackb(b, raw=False)
+    return json.loads
+
+
+def _write_atomic(path: Path, write) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+def write_jsonl(path: Path, header: dict, records: list[dict]) -> None:
+    """Write the header line followed by one JSON record per line."""
+    header = dict(header, encoding="json")
+
+    def write(f):
+        f.write(json.dumps(header, ensure_ascii=False).encode("utf-8") + b"\n")
+        for r in records:
+            f.write(json.dumps(r, ensure_ascii=False).encode("utf-8") + b"\n")
+
+    _write_atomic(path, write)
+
+
+def write_binary(path: Path, header: dict, records: list[dict], encoding: str = "json") -> None:
+    """Write the memory-mappable binary export."""
+    header = dict(header, encoding=encoding)
+    encode = _encoder(encoding)
+    blobs = [encode(r) for r in records]
+    head = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    ids = "\n".join(r["id"] for r in records).encode("utf-8")
+    hashes = "\n".join(r["hash"] for r in records).encode("utf-8")
+
+    offsets = array("Q", [0])
+    for b in blobs:
+        offsets.append(offsets[-1] + len(b))
+    if sys.byteorder != "little":
+        offsets.byteswap()
+
+    def write(f):
+        f.write(PREAMBLE.pack(MAGIC, EXPORT_VERSION, ENCODINGS[encoding], len(records),
+                              len(head), len(ids), len(hashes)))
+        f.write(head)
+        f.write(ids)
+        f.write(hashes)
+        f.write(b"\0" * (-f.tell() % 8))
+        f.write(offsets.tobytes())
+        for b in blobs:
+            f.write(b)
+
+    _write_atomic(path, write)
+
+
+class ExerciseDB:
+    """Read-only view of a binary export.
+
+    The file is memory-mapped; only the ID/hash lists and the offset table
+    are read up front, and each record is decoded when it is requested.
+    Provides the lookup API of ExerciseExtractor (get_exercise,
+    list_exercises) for tools that only need to read the pool.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mm
+        if len(mm) < PREAMBLE.size or mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{self.path} is not an exercise export")
+        _, version, encoding, count, head_len, ids_len, hashes_len = PREAMBLE.unpack_from(mm, 0)
+        if version != EXPORT_VERSION:
+            raise ValueError(f"{self.path}: unsupported export version {version}")
+
+        pos = PREAMBLE.size
+        self.header = json.loads(mm[pos:pos + head_len])
+        pos += head_len
+        self.ids = mm[pos:pos + ids_len].decode("utf-8").split("\n") if count else []
+        pos += ids_len
+        hashes = mm[pos:pos + hashes_len].decode("utf-8").split("\n") if count else []
+        pos += hashes_len
+        pos += -pos % 8
+        self._offsets = array("Q")
+        self._offsets.frombytes(mm[pos:pos + 8 * (count + 1)])
+        if sys.byteorder != "little":
+            self._offsets.byteswap()
+        self._data = pos + 8 * (count + 1)
+        self._decode = _decoder({v: k for k, v in ENCODINGS.items()}[encoding])
+
+        self._by_id = {ex_id: i for i, ex_id in enumerate(self.ids)}
+        # Hash lookups resolve to the first exercise carrying the hash, as in the extractor
+        self._by_hash: dict[str, int] = {}
+        for i, h in enumerate(hashes):
+            self._by_hash.setdefault(h, i)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, identifier: str) -> bool:
+        return identifier in self._by_id or identifier in self._by_hash
+
+    def __iter__(self) -> Iterator[dict]:
+        for i in range(len(self.ids)):
+            yield self.record(i)
+
+    def record(self, index: int) -> dict:
+        start = self._data + self._offsets[index]
+        end = self._data + self._offsets[index + 1]
+        return self._decode(self._mm[start:end])
+
+    def get_exercise(self, identifier: str) -> Optional[dict]:
+        """Get exercise by ID or hash."""
+        i = self._by_id.get(identifier)
+        if i is None:
+            i = self._by_hash.get(identifier)
+        return None if i is None else self.record(i)
+
+    def list_exercises(self) -> dict:
+        """Decode every record, keyed by ID."""
+        return {r["id"]: r for r in self}
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_jsonl(path) -> tuple[dict, list[dict]]:
+    """Return (header, records) from a JSON Lines export."""
+    with open(path, encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("format") != FORMAT_NAME:
+            raise ValueError(f"{path} is not an exercise export")
+        if header.get("version") != EXPORT_VERSION:
+            raise ValueError(f"{path}: unsupported export version {header.get('version')}")
+        return header, [json.loads(line) for line in f if line.strip()]
+
+
+def read_header(path) -> Optional[dict]:
+    """Header of either export format, or None if the file is missing or unreadable."""
+    path = Path(path)
+    try:
+        with open(path, "rb") as f:
+            start = f.read(PREAMBLE.size)
+            if start[:len(MAGIC)] == MAGIC:
+                head_len = PREAMBLE.unpack(start)[4]
+                return json.loads(f.read(head_len))
+            f.seek(0)
+            header = json.loads(f.readline())
+    except (OSError, ValueError, struct.error):
+        return None
+    return header if isinstance(header, dict) and header.get("format") == FORMAT_NAME else None
+
+
+def is_current(path, base_path, patterns: list[str], encoding: str = "json") -> bool:
+    """True if the export at path was made from the current source files, with the given encoding."""
+    header = read_header(path)
+    if not header or header.get("version") != EXPORT_VERSION or header.get("patterns") != patterns:
+        return False
+    if header.get("encoding", "json") != encoding:
+        return False
+    sources = header.get("sources")
+    if not isinstance(sources, dict):
+        return False
+    # The recorded paths include the assets, which only a full parse would find again
+    return sources == source_stamps(Path(base_path), patterns, sources)
+
+
+def export(base_path, exercise_pattern: str = "ch*_exercises.tex", output_dir=None,
+           formats: tuple = ("jsonl", "binary"), encoding: str = "json", jobs: int = 1,
+           if_stale: bool = False, quiet: bool = False) -> list[Path]:
+    """Parse the book and write the requested export formats; return the paths written."""
+    from generate_exam import ExerciseExtractor
+
+    output_dir = Path(output_dir or base_path)
+    targets = {"jsonl": output_dir / "exercises.jsonl", "binary": output_dir / "exercises.exdb"}
+    targets = {k: v for k, v in targets.items() if k in formats}
+    patterns = [p.strip() for p in exercise_pattern.split(",")]
+
+    # JSON Lines records are always JSON; only the binary format's payload encoding varies
+    encodings = {"jsonl": "json", "binary": encoding}
+    if if_stale and all(is_current(p, base_path, patterns, encodings[k]) for k, p in targets.items()):
+        if not quiet:
+            print("Exercise export is up to date", file=sys.stderr)
+        return []
+
+    extractor = ExerciseExtractor(base_path, exercise_pattern, jobs=jobs)
+    psets_dir = str(Path(__file__).resolve().parent.parent / "psets")
+    if psets_dir not in sys.path:
+        sys.path.insert(0, psets_dir)
+    from generate_pset_solutions import parse_xsim_numbering
+
+    records = build_records(extractor, parse_xsim_numbering(Path(base_path)))
+    header = _header(extractor, records, encoding)
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if "jsonl" in targets:
+        write_jsonl(targets["jsonl"], header, records)
+    if "binary" in targets:
+        write_binary(targets["binary"], header, records, encoding)
+    if not quiet:
+        for p in targets.values():
+            print(f"Exported {len(records)} exercises: {p}", file=sys.stderr)
+    return list(targets.values())
+
+
+def show(path: Path, ids: list[str]) -> int:
+    """Print the header (no IDs) or the requested records of an export as JSON."""
+    if path.suffix == ".jsonl":
+        header, records = read_jsonl(path)
+        by_key = {}
+        for r in records:
+            by_key.setdefault(r["hash"], r)
+        by_key.update({r["id"]: r for r in records})
+        lookup = by_key.get
+    else:
+        db = ExerciseDB(path)
+        header, lookup = db.header, db.get_exercise
+    if not ids:
+        json.dump({k: v for k, v in header.items() if k != "sources"}, sys.stdout, indent=2)
+        print()
+        return 0
+    missing = 0
+    for identifier in ids:
+        record = lookup(identifier)
+        if record is None:
+            print(f"export_db: {identifier} not found in {path}", file=sys.stderr)
+            missing += 1
+            continue
+        json.dump(record, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    return 1 if missing else 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--base-path", default=os.environ.get("BASE_PATH", "../.."), help="Base path to exercise files")
+    ap.add_argument("--exercise-pattern", default=os.environ.get("EXERCISE_PATTERN", "ch*_exercises.tex"),
+                    help="Glob pattern(s) for exercise files (comma-separated for multiple patterns)")
+    ap.add_argument("--output-dir", "-o", help="Directory for exercises.jsonl/.exdb (default: base path)")
+    ap.add_argument("--format", choices=["jsonl", "binary", "both"], default="both", help="Formats to write")
+    ap.add_argument("--msgpack", action="store_true", help="Encode binary records with msgpack (needs msgpack)")
+    ap.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1,
+                    help="Number of processes used to parse exercise files (default: CPU count)")
+    ap.add_argument("--if-stale", action="store_true", help="Skip the export if no source file changed")
+    ap.add_argument("--show", type=Path, metavar="EXPORT", help="Print an export's header, or the given records")
+    ap.add_argument("ids", nargs="*", help="IDs or hashes to print with --show")
+    args = ap.parse_args(argv)
+
+    if args.show:
+        return show(args.show, args.ids)
+
+    formats = ("jsonl", "binary") if args.format == "both" else (args.format,)
+    try:
+        export(args.base_path, args.exercise_pattern, args.output_dir, formats,
+               "msgpack" if args.msgpack else "json", args.jobs, args.if_stale)
+    except ImportError as e:
+        print(f"export_db: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
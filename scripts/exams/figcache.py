@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Shared cache of pre-rendered figures for exam and pset compiles.
+
+Every compile pass of a generated document re-typesets each TikZ figure
+it contains, inline or pulled in with ``\\includestandalone``. Before
+compiling, ``apply_figure_cache`` finds these figures in the document
+body and renders each one once, on its own, to a cropped PDF. The PDF is
+stored in ``.exam-cache/figures/`` and named by a hash of what it is
+built from:
+
+  - the figure source (the tikzpicture, or the body of the standalone file),
+  - the preamble it is rendered with, and the style files the preamble loads,
+  - the files the figure itself includes (see assets.py).
+
+The same figure in another exam, pset or version is therefore rendered
+only once. The compiled copy of the document then includes the cached
+PDFs with ``\\includegraphics``; the generated .tex is not modified.
+
+The figure preamble is the document's own: its packages (minus the page
+layout, reference and bibliography packages, which make no sense for a
+single figure), ``\\graphicspath``, ``\\input@path`` and book colours, with
+the ``standalone`` class and the document's class options (``11pt``,
+...; standalone passes them on to the class it loads). It is compiled from the book root, so paths
+resolve as in the document. Figures that depend on the surrounding
+document (references, labels, citations, overlays, a baseline, the
+text or line width) are left alone. A figure that fails to render is remembered and left in the
+document as it was, so the document compile reports the error.
+"""
+from __future__ import annotations
+
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from assets import AssetResolver
+from cache import cache_dir, content_key
+from profiling import Profiler
+
+STANDALONE_RE = re.compile(r'\\includestandalone\s*(?:\[([^\]]*)\])?\s*\{([^}]+)\}')
+TIKZ_RE = re.compile(r'^([ \t]*)(\\begin\{tikzpicture\}.*?\\end\{tikzpicture\})', re.MULTILINE | re.DOTALL)
+BODY_RE = re.compile(r'\\begin\{document\}(.*)\\end\{document\}', re.DOTALL)
+USEPACKAGE_RE = re.compile(r'^\\usepackage\s*(?:\[[^\]]*\])?\s*\{([^}]+)\}.*$', re.MULTILINE)
+PREAMBLE_LINE_RE = re.compile(r'^(?:\\graphicspath\{.*|\\DeclareUnicodeCharacter.*)$', re.MULTILINE)
+INPUT_PATH_RE = re.compile(r'^\\def\\input@path.*$', re.MULTILINE)
+STY_INPUT_RE = re.compile(r'\\input\{([^}]+\.sty)\}')
+DOCUMENTCLASS_RE = re.compile(r'\\documentclass\s*\[([^\]]*)\]')
+
+# Packages for the page, references and bibliography of the whole document
+SKIPPED_PACKAGES = {'geometry', 'fancyhdr', 'lastpage', 'xr', 'hyperref', 'hypcap', 'cleveref',
+                    'biblatex', 'minted', 'standalone'}
+# Figures containing these depend on the enclosing document
+DOCUMENT_DEPENDENT = ('\\ref', '\\label', '\\cite', '\\pageref', 'remember picture', 'overlay',
+                      'baseline', '\\theproblem', '\\linewidth', '\\textwidth', '\\columnwidth')
+# Options of \includestandalone that \includegraphics does not take
+STANDALONE_ONLY_OPTIONS = ('mode', 'obeyclassoptions')
+
+
+def figure_preamble(document: str) -> str:
+    """The preamble figures of document are rendered with."""
+    preamble = document.split('\\begin{document}', 1)[0]
+    # The font size (11pt, ...) changes how labels render
+    options = DOCUMENTCLASS_RE.search(preamble)
+    class_options = [o.strip() for o in options.group(1).split(',') if o.strip()] if options else []
+    lines = [f"\\documentclass[{','.join(['border=0pt'] + class_options)}]{{standalone}}"]
+    for m in USEPACKAGE_RE.finditer(preamble):
+        names = {Path(n.strip()).name for n in m.group(1).split(',')}
+        if not names & SKIPPED_PACKAGES:
+            lines.append(m.group(0).split('%', 1)[0].rstrip())
+    lines.extend(m.group(0) for m in PREAMBLE_LINE_RE.finditer(preamble))
+    lines.extend(f"\\makeatletter\n{m.group(0)}\n\\makeatother" for m in INPUT_PATH_RE.finditer(preamble))
+    lines.extend(f"\\AtBeginDocument{{\\input{{{m.group(1)}}}}}" for m in STY_INPUT_RE.finditer(preamble))
+    return '\n'.join(lines) + '\n'
+
+
+def _style_files(preamble: str, book_dir: Path) -> List[Path]:
+    files = []
+    for m in USEPACKAGE_RE.finditer(preamble):
+        for name in m.group(1).split(','):
+            if '/' in name:
+                files.append(book_dir / f"{name.strip()}.sty")
+    files.extend(book_dir / m.group(1) for m in STY_INPUT_RE.finditer(preamble))
+    return files
+
+
+def _read(path: Path) -> bytes:
+    try:
+        return path.read_bytes()
+    except OSError:
+        return b''
+
+
+def _graphics_options(options: Optional[str]) -> str:
+    if not options:
+        return ''
+    kept = [o for o in options.split(',') if o.split('=', 1)[0].strip() not in STANDALONE_ONLY_OPTIONS]
+    return f"[{','.join(kept)}]" if kept else ''
+
+
+class FigureCache:
+    """Render figures to content-addressed PDFs under the shared cache.
+
+    Args:
+        book_dir: Book root (the compile working directory)
+        document: The full LaTeX document the figures come from
+        jobs: Concurrent figure renders
+    """
+
+    def __init__(self, book_dir, document: str, jobs: int = 1, profiler: Optional[Profiler] = None):
+        from generate_exam import find_tex_tool
+
+        self.book_dir = Path(book_dir).resolve()
+        self.dir = cache_dir(self.book_dir, 'figures')
+        self.preamble = figure_preamble(document)
+        self.jobs = max(1, jobs)
+        self.profiler = profiler or Profiler('figures')
+        self.pdflatex = find_tex_tool('pdflatex')
+        self.resolver = AssetResolver(self.book_dir)
+        styles = b''.join(_read(p) for p in _style_files(self.preamble, self.book_dir))
+        self._preamble_key = content_key(self.preamble, styles)
+
+    def key(self, body: str) -> str:
+        files = self.resolver.scan(body)['files']
+        return content_key(self._preamble_key, body, *(_read(self.book_dir / f) for f in files))[:32]
+
+    def _render(self, key: str, body: str) -> bool:
+        failed = self.dir / f"{key}.failed"
+        with tempfile.TemporaryDirectory(prefix='figure-') as tmp:
+            tex = Path(tmp) / 'figure.tex'
+            tex.write_text(f"{self.preamble}\\begin{{document}}\n{body}\n\\end{{document}}\n", encoding='utf-8')
+            cmd = [self.pdflatex, '-interaction=nonstopmode', '-halt-on-error', '-shell-escape',
+                   f'-output-directory={tmp}', str(tex)]
+            result = self.profiler.run(cmd, capture_output=True, text=True, cwd=self.book_dir,
+                                       stdin=subprocess.DEVNULL)
+            pdf = Path(tmp) / 'figure.pdf'
+            if result.returncode != 0 or not pdf.exists():
+                failed.touch()
+                return False
+            partial = self.dir / f"{key}.pdf.{os.getpid()}.tmp"
+            shutil.copyfile(pdf, partial)
+            os.replace(partial, self.dir / f"{key}.pdf")
+            return True
+
+    def render(self, bodies: Dict[str, str]) -> Dict[str, Path]:
+        """Cached PDF for each key of bodies, rendering the missing ones; failures are omitted."""
+        done = {k: self.dir / f"{k}.pdf" for k in bodies if (self.dir / f"{k}.pdf").exists()}
+        todo = [k for k in bodies if k not in done and not (self.dir / f"{k}.failed").exists()]
+        if todo and self.pdflatex:
+            print(f"Rendering {len(todo)} figure(s) into the figure cache...")
+            with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+                for k, ok in zip(todo, pool.map(lambda k: self._render(k, bodies[k]), todo)):
+                    if ok:
+                        done[k] = self.dir / f"{k}.pdf"
+        return done
+
+
+def _standalone_body(path: Path) -> Optional[str]:
+    try:
+        text = path.read_text(encoding='utf-8', errors='replace')
+    except OSError:
+        return None
+    m = BODY_RE.search(text)
+    return (m.group(1) if m else text).strip()
+
+
+def apply_figure_cache(document: str, book_dir, jobs: int = 1,
+                       profiler: Optional[Profiler] = None) -> Tuple[str, int]:
+    """Replace cacheable figures in document with their cached PDFs.
+
+    Returns the new document and the number of figures replaced.
+    """
+    start = document.find('\\begin{document}')
+    if start < 0 or ('\\includestandalone' not in document and '\\begin{tikzpicture}' not in document):
+        return document, 0
+    cache = FigureCache(book_dir, document, jobs, profiler)
+    head, body = document[:start], document[start:]
+
+    # (start, end, key, \includegraphics options) of each cacheable figure in body
+    found: List[Tuple[int, int, str, str]] = []
+    bodies: Dict[str, str] = {}
+    for m in STANDALONE_RE.finditer(body):
+        path = cache.resolver.resolve('includestandalone', m.group(2).strip())
+        if not path or not path.endswith('.tex'):
+            continue
+        source = _standalone_body(cache.book_dir / path)
+        if not source or any(s in source for s in DOCUMENT_DEPENDENT):
+            continue
+        key = cache.key(source)
+        bodies[key] = source
+        found.append((m.start(), m.end(), key, _graphics_options(m.group(1))))
+    for m in TIKZ_RE.finditer(body):
+        source = m.group(2)
+        if any(s in source for s in DOCUMENT_DEPENDENT):
+            continue
+        key = cache.key(source)
+        bodies[key] = source
+        found.append((m.start(2), m.end(2), key, ''))
+    if not found:
+        return document, 0
+
+    pdfs = cache.render(bodies)
+    replaced = 0
+    for begin, end, key, options in sorted(found, reverse=True):
+        if key not in pdfs:
+            continue
+        rel = os.path.relpath(pdfs[key], cache.book_dir)
+        body = f"{body[:begin]}\\includegraphics{options}{{{rel}}}{body[end:]}"
+        replaced += 1
+    return head + body, replaced
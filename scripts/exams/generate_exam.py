@@ -29,19 +29,113 @@ Date: 2024
 
 import argparse
 import re
-import yaml
 import os
 import sys
-import subprocess
-import shutil
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 
+from assets import AssetResolver, rewrite_asset_paths
+from bblcache import bbl_key, biber_succeeded, restore_bbl, store_bbl
+from depfile import document_dependencies, write_depfile
+from latexcheck import CheckContext, check_document, preamble_of, print_issues
+from mdexercises import FragmentConverter, MarkdownExercise, parse_markdown_exercises
+from profiling import Profiler, profiling_requested
+from xraux import external_document
+
+# yaml, subprocess and shutil are imported where they are used so that
+# listing, validation and statistics start without loading them.
+
+
+def yaml_loader():
+    """Return the fastest available safe YAML loader (libyaml's C loader if built)."""
+    import yaml
+    return getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# Pattern to match exercise blocks and the solution that immediately follows
+EXERCISE_BLOCK_RE = re.compile(r'\\begin\{exercise\}\[([^\]]+)\](.*?)\\end\{exercise\}', re.DOTALL)
+SOLUTION_BLOCK_RE = re.compile(r'\s*\\begin\{solution\}(.*?)\\end\{solution\}', re.DOTALL)
+EXERCISE_ID_RE = re.compile(r'ID=([^,\]]+)')
+EXERCISE_HASH_RE = re.compile(r'hash=([^,\]]+)')
+
+
+def parse_exercise_text(content: str, file_name: str, rel_path: Optional[str] = None) -> Tuple[List[Dict], List[Dict]]:
+    """Parse the text of one exercise file.
+
+    Args:
+        content: Full text of the exercise file
+        file_name: File name recorded in each exercise record
+        rel_path: Path relative to the book root (defaults to file_name)
+
+    Returns:
+        (records, issues): every exercise record in file order, including
+        repeated IDs, and any parse-level problems such as exercise blocks
+        without an ``ID=`` option.
+    """
+    rel_path = rel_path or file_name
+    records = []
+    issues = []
+    line = 1
+    last_pos = 0
+
+    for match in EXERCISE_BLOCK_RE.finditer(content):
+        # Track line numbers incrementally so the whole file is scanned once
+        line += content.count('\n', last_pos, match.start())
+        last_pos = match.start()
+
+        options = match.group(1)
+        exercise_content = match.group(2).strip()
+
+        # Extract ID and hash from options
+        id_match = EXERCISE_ID_RE.search(options)
+        hash_match = EXERCISE_HASH_RE.search(options)
+
+        if not id_match:
+            issues.append({
+                'code': 'missing_id',
+                'file': rel_path,
+                'line': line,
+                'message': f'Exercise block without ID= option ({options})',
+            })
+            continue
+
+        exercise_id = id_match.group(1)
+        exercise_hash = hash_match.group(1) if hash_match else exercise_id
+
+        # Look for solution immediately after the exercise
+        solution_match = SOLUTION_BLOCK_RE.match(content, match.end())
+        solution_content = solution_match.group(1).strip() if solution_match else ""
+
+        records.append({
+            'id': exercise_id,
+            'hash': exercise_hash,
+            'file': file_name,
+            'path': rel_path,
+            'line': line,
+            'options': options,
+            'content': exercise_content,
+            'solution': solution_content,
+            'has_solution': bool(solution_match),
+            'has_hash': bool(hash_match),
+            'full_exercise': match.group(0),
+            'full_solution': solution_match.group(0) if solution_match else ""
+        })
+
+    return records, issues
+
+
+def _parse_exercise_path(file_path: Path, file_name: str, rel_path: str) -> Tuple[List[Dict], List[Dict]]:
+    """Read and parse one exercise file (process pool worker)."""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    return parse_exercise_text(content, file_name, rel_path)
+
+
 class ExerciseExtractor:
     """Extract exercises from chapter exercise files."""
 
-    def __init__(self, base_path: str = "..", exercise_pattern: str = "ch*_exercises.tex"):
+    def __init__(self, base_path: str = "..", exercise_pattern: str = "ch*_exercises.tex", jobs: int = 1,
+                 resolve_assets: bool = True, pandoc_args: Optional[str] = None):
         """
         Initialize the exercise extractor.
         
@@ -49,6 +143,13 @@ class ExerciseExtractor:
             base_path: Base path to the book directory containing exercise files
             exercise_pattern: Glob pattern(s) for exercise files (default: "ch*_exercises.tex")
                              Multiple patterns can be separated by commas
+            jobs: Number of worker processes used to parse files (default: 1)
+            resolve_assets: Resolve each exercise's figures/inputs/cite keys
+                            into record['assets'] (default: True)
+            pandoc_args: pandoc arguments of the book's source.md -> index.tex
+                         rule (default: $PANDOC_TEX_ARGS). If set, the exercise
+                         divs of a source.md newer than its index.tex override
+                         that file's exercises (see mdexercises.py)
         """
         self.base_path = Path(base_path)
         # Support multiple patterns separated by commas
@@ -56,15 +157,33 @@ class ExerciseExtractor:
             self.exercise_patterns = [p.strip() for p in exercise_pattern.split(',')]
         else:
             self.exercise_patterns = [exercise_pattern]
+        self.jobs = max(1, jobs or 1)
         self.exercises_db = {}
+        # Every parsed occurrence in load order, keyed by ID and by hash.
+        # exercises_db keeps only the last definition of an ID; these keep all.
+        self.occurrences: Dict[str, List[Dict]] = {}
+        self.hash_occurrences: Dict[str, List[Dict]] = {}
+        self.parse_issues: List[Dict] = []
+        self.file_counts: Dict[str, int] = {}
+        self._hash_index: Dict[str, Dict] = {}
+        self.asset_resolver = AssetResolver(self.base_path) if resolve_assets else None
+        if pandoc_args is None:
+            pandoc_args = os.environ.get('PANDOC_TEX_ARGS')
+        self.converter = FragmentConverter(self.base_path, pandoc_args) if pandoc_args else None
+        if self.converter and not self.converter.available:
+            print("Warning: pandoc not found; reading versioned exercises from index.tex")
+            self.converter = None
         self._load_exercises()
 
-    def _load_exercises(self):
-        """Load all exercises from chapter files into memory."""
-        # Find all exercise files matching the patterns
+    def _find_exercise_files(self) -> List[Path]:
+        """Return the files matching the exercise patterns, without duplicates."""
         exercise_files = []
         for pattern in self.exercise_patterns:
             matched_files = sorted(self.base_path.glob(pattern))
+            if self.converter and pattern.endswith('/index.tex'):
+                # Sections whose index.tex has not been built yet
+                matched_files = sorted(set(matched_files) | {
+                    p.with_name('index.tex') for p in self.base_path.glob(pattern[:-len('index.tex')] + 'source.md')})
             exercise_files.extend(matched_files)
         
         # Remove duplicates while preserving order
@@ -74,62 +193,117 @@ class ExerciseExtractor:
             if f not in seen:
                 seen.add(f)
                 unique_files.append(f)
-        exercise_files = unique_files
+        return unique_files
+
+    def _markdown_source(self, file_path: Path) -> Optional[Path]:
+        """The source.md to read on top of file_path, if it is newer (or file_path is missing)."""
+        if not self.converter or file_path.name != 'index.tex':
+            return None
+        source = file_path.with_name('source.md')
+        try:
+            source_mtime = source.stat().st_mtime
+        except OSError:
+            return None
+        try:
+            if source_mtime <= file_path.stat().st_mtime:
+                return None
+        except OSError:
+            return source
+        return None if self.converter.index_current(source, file_path) else source
+
+    def _relative_path(self, file_path: Path) -> str:
+        try:
+            return str(file_path.relative_to(self.base_path))
+        except ValueError:
+            return file_path.name
+
+    def _load_exercises(self):
+        """Load all exercises from chapter files into memory."""
+        exercise_files = self._find_exercise_files()
         
         if not exercise_files:
             print(f"Warning: No exercise files found matching patterns {self.exercise_patterns} in {self.base_path}")
             return
-        
-        for file_path in exercise_files:
-            self._parse_exercise_file(file_path, file_path.name)
+
+        # Stale versioned files: the exercise divs of source.md, converted on demand, override theirs
+        markdown_sources = {f: self._markdown_source(f) for f in exercise_files}
+        latex_files = [f for f in exercise_files if not markdown_sources[f] or f.exists()]
+
+        if self.jobs > 1 and len(latex_files) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=min(self.jobs, len(latex_files))) as pool:
+                parsed = dict(zip(latex_files, pool.map(
+                    _parse_exercise_path,
+                    latex_files,
+                    [f.name for f in latex_files],
+                    [self._relative_path(f) for f in latex_files],
+                )))
+            for file_path in exercise_files:
+                if markdown_sources[file_path]:
+                    self._parse_markdown_file(markdown_sources[file_path], *parsed.get(file_path, ([], [])))
+                else:
+                    self._add_records(file_path, *parsed[file_path])
+        else:
+            for file_path in exercise_files:
+                if markdown_sources[file_path]:
+                    stale = self._read_exercise_file(file_path) if file_path.exists() else ([], [])
+                    self._parse_markdown_file(markdown_sources[file_path], *stale)
+                else:
+                    self._parse_exercise_file(file_path, file_path.name)
+
+        # Hash lookups resolve to the surviving definition of each ID
+        for exercise in self.exercises_db.values():
+            self._hash_index.setdefault(exercise['hash'], exercise)
+
+        if self.asset_resolver:
+            for records in self.occurrences.values():
+                for record in records:
+                    if isinstance(record, MarkdownExercise):
+                        continue  # scanned when converted
+                    record['assets'] = self.asset_resolver.scan(record['content'], record['solution'])
+
+    def _read_exercise_file(self, file_path: Path) -> Tuple[List[Dict], List[Dict]]:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        return parse_exercise_text(content, file_path.name, self._relative_path(file_path))
 
     def _parse_exercise_file(self, file_path: Path, file_name: str):
         """Parse a single exercise file and extract exercises."""
         if not file_path.exists():
             print(f"Warning: {file_name} not found at {file_path}")
             return
-            
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
 
-        # Pattern to match exercise blocks
-        exercise_pattern = r'\\begin\{exercise\}\[([^\]]+)\](.*?)\\end\{exercise\}'
-        solution_pattern = r'\\begin\{solution\}(.*?)\\end\{solution\}'
-
-        # Find all exercises
-        exercise_matches = re.finditer(exercise_pattern, content, re.DOTALL)
-
-        for match in exercise_matches:
-            options = match.group(1)
-            exercise_content = match.group(2).strip()
-
-            # Extract ID and hash from options
-            id_match = re.search(r'ID=([^,\]]+)', options)
-            hash_match = re.search(r'hash=([^,\]]+)', options)
-
-            if id_match:
-                exercise_id = id_match.group(1)
-                exercise_hash = hash_match.group(1) if hash_match else exercise_id
-
-                # Find corresponding solution
-                solution_content = ""
-                # Look for solution immediately after the exercise
-                remaining_content = content[match.end():]
-                solution_match = re.match(r'\s*\\begin\{solution\}(.*?)\\end\{solution\}',
-                                        remaining_content, re.DOTALL)
-                if solution_match:
-                    solution_content = solution_match.group(1).strip()
-
-                self.exercises_db[exercise_id] = {
-                    'id': exercise_id,
-                    'hash': exercise_hash,
-                    'file': file_name,
-                    'options': options,
-                    'content': exercise_content,
-                    'solution': solution_content,
-                    'full_exercise': match.group(0),
-                    'full_solution': solution_match.group(0) if solution_match else ""
-                }
+        self._add_records(file_path, *self._read_exercise_file(file_path))
+
+    def _parse_markdown_file(self, source: Path, stale_records: List[Dict] = (), stale_issues: List[Dict] = ()):
+        """Read the exercise divs of a versioned source.md; each is converted when first used.
+
+        The records of the stale index.tex are kept for the IDs the markdown
+        does not define as divs, and stand in for a div that fails to convert.
+        """
+        with open(source, 'r', encoding='utf-8') as f:
+            text = f.read()
+        fallback = {record['id']: record for record in stale_records}
+        records, issues = parse_markdown_exercises(text, source.name, self._relative_path(source), self.converter,
+                                                   parse_exercise_text, self.asset_resolver, fallback)
+        defined = {record['id'] for record in records}
+        kept = [record for record in stale_records if record['id'] not in defined]
+        self._add_records(source, kept + records, list(stale_issues) + issues)
+
+    def _add_records(self, file_path: Path, records: List[Dict], issues: List[Dict]):
+        """Merge one file's parse results into the database.
+
+        Records are counted under the path they carry: a source.md read on
+        top of its index.tex also brings records of the index.tex.
+        """
+        if not records:
+            self.file_counts[self._relative_path(file_path)] = 0
+        self.parse_issues.extend(issues)
+        for record in records:
+            self.file_counts[record['path']] = self.file_counts.get(record['path'], 0) + 1
+            self.exercises_db[record['id']] = record
+            self.occurrences.setdefault(record['id'], []).append(record)
+            self.hash_occurrences.setdefault(record['hash'], []).append(record)
 
     def get_exercise(self, identifier: str) -> Optional[Dict]:
         """Get exercise by ID or hash."""
@@ -138,11 +312,17 @@ class ExerciseExtractor:
             return self.exercises_db[identifier]
 
         # Then try by hash
-        for exercise in self.exercises_db.values():
-            if exercise['hash'] == identifier:
-                return exercise
-
-        return None
+        return self._hash_index.get(identifier)
+
+    def select(self, problem_specs: List) -> List[Dict]:
+        """Exercise records for a config's problem list (IDs, hashes or dicts with 'id')."""
+        selected = []
+        for spec in problem_specs:
+            identifier = spec.get('id') if isinstance(spec, dict) else spec
+            exercise = self.get_exercise(identifier) if identifier else None
+            if exercise:
+                selected.append(exercise)
+        return selected
 
     def list_exercises(self) -> Dict:
         """Return all available exercises."""
@@ -152,6 +332,51 @@ class ExerciseExtractor:
         """Get all exercises from a specific file."""
         return [ex for ex in self.exercises_db.values() if ex['file'] == file_name]
 
+def resolve_assets_in(text: str, exercise: Dict) -> str:
+    """Point the exercise's figure/input references at their resolved files."""
+    return rewrite_asset_paths(text, exercise.get('assets', {}).get('resolved'))
+
+LATEX_SPECIAL = {'\\': r'\textbackslash{}', '&': r'\&', '%': r'\%', '$': r'\$', '#': r'\#',
+                 '_': r'\_', '{': r'\{', '}': r'\}', '~': r'\textasciitilde{}', '^': r'\textasciicircum{}'}
+LIST_ENV_RE = re.compile(r'\\(begin|end)\{(?:enumerate|itemize|description)\}|\\item\b')
+
+def latex_escape(text: str) -> str:
+    """Escape plain text (e.g. a student name) for LaTeX."""
+    return ''.join(LATEX_SPECIAL.get(c, c) for c in str(text))
+
+def shuffle_parts(text: str, seed) -> str:
+    """Shuffle the items of the first top-level list in text (a problem's parts).
+
+    Nested lists move with their item. The permutation depends only on the
+    seed and the number of items, so a problem and its solution shuffled
+    with the same seed stay aligned.
+    """
+    import random
+
+    depth = 0
+    start = None
+    items = []
+    for m in LIST_ENV_RE.finditer(text):
+        if m.group(1) == 'begin':
+            depth += 1
+            if depth == 1 and start is None:
+                start = m.end()
+        elif m.group(1) == 'end':
+            depth -= 1
+            if depth == 0 and start is not None:
+                end = m.start()
+                break
+        elif depth == 1 and start is not None:
+            items.append(m.start())
+    else:
+        return text
+    if len(items) < 2:
+        return text
+    bounds = items + [end]
+    parts = [text[bounds[i]:bounds[i + 1]].rstrip() for i in range(len(items))]
+    random.Random(seed).shuffle(parts)
+    return text[:items[0]] + '\n'.join(parts) + '\n' + text[end:]
+
 class ExamGenerator:
     """Generate exam LaTeX files from selected exercises."""
 
@@ -186,6 +411,11 @@ class ExamGenerator:
     def _get_template_header(self) -> str:
         """Get the LaTeX header template."""
         return r"""\documentclass[11pt,letterpaper]{article}
+% The preamble up to the end-of-dump marker below depends only on the config
+% (styles path, bibliography), not on the problems, so it can be dumped into
+% a format with mylatexformat (see roster.py). Anything that varies with the
+% problems, like the xr external document, goes after the marker.
+\expandafter\providecommand\csname endofdump\endcsname{}
 
 % Required packages
 \usepackage[margin=1in]{geometry}
@@ -198,7 +428,6 @@ class ExamGenerator:
 <<BIBLATEX_PACKAGE>>
 \usepackage{xr}        % For external references to main book
 \usepackage{hyperref}  % For href links
-<<XR_EXTERNAL>>
 \usepackage[draft=false,newfloat]{minted}  % For code highlighting
 
 % Unicode character support: the exam is compiled with pdflatex, which
@@ -320,6 +549,11 @@ class ExamGenerator:
 \renewcommand{\headrulewidth}{0.4pt}
 \renewcommand{\footrulewidth}{0.4pt}
 
+\endofdump
+
+% Labels of the book referenced by the problems (pruned per exam, see xraux.py)
+<<XR_EXTERNAL>>
+
 % Exam-specific information
 \newcommand{\examtitle}{<<EXAM_TITLE>>}
 \newcommand{\examdate}{<<EXAM_DATE>>}
@@ -342,11 +576,11 @@ class ExamGenerator:
     {\Large \textbf{\examtitle}} \\[0.3cm]
     {\large \coursename\ --- Version \examversion} \\[0.2cm]
     {\normalsize \examdate\ \examtime} \\[0.2cm]
-    {\normalsize \instructorname}
+    {\normalsize \instructorname}<<VARIANT_LINE>>
   \end{center}
   \vspace{0.3cm}
 
-  \noindent\textbf{Name:} \rule{3in}{0.5pt}
+  \noindent\textbf{Name:} <<STUDENT_NAME>>
   \vspace{0.5cm}
 
   \noindent\textbf{Instructions:} <<EXAM_INSTRUCTIONS>>
@@ -402,12 +636,13 @@ class ExamGenerator:
         else:
             output_dir = Path('.')
 
+        # Generate problems section (first, so that xr only loads the labels it references)
+        problems_section = self._generate_problems(config['problems'],
+                                                 config.get('include_solutions', False))
+
         # XR external document linking (relative to compile root/base path)
         compile_root = Path(config.get('base_path_resolved', self.extractor.base_path)).resolve()
-        aux_rel = self._find_book_aux(compile_root)
-        if aux_rel and aux_rel.endswith('.aux'):
-            aux_rel = aux_rel[:-4]
-        xr_external = f"\\externaldocument{{{aux_rel}}}" if aux_rel else ''
+        xr_external = external_document(self._find_book_aux(compile_root), problems_section, compile_root)
 
         # Handle bibliography
         bib_file = config.get('bibliography')
@@ -425,7 +660,9 @@ class ExamGenerator:
             '<<EXAM_INSTRUCTIONS>>': config.get('instructions', 'Show all work for full credit. Clearly indicate your final answers. Use appropriate units in your calculations.'),
             '<<STYLES_PATH>>': self.styles_path,
             '<<BIBLATEX_PACKAGE>>': biblatex_package,
-            '<<XR_EXTERNAL>>': xr_external
+            '<<XR_EXTERNAL>>': xr_external,
+            '<<STUDENT_NAME>>': latex_escape(config['student']) if config.get('student') else '\\rule{3in}{0.5pt}',
+            '<<VARIANT_LINE>>': f" \\\\[0.2cm]\n    {{\\small Variant {config['variant_seed']}}}" if config.get('variant_seed') else ''
         }
         if config.get('time_limit'):
             replacements['<<EXAM_TIME>>'] = ' --- ' + config['time_limit']
@@ -437,10 +674,6 @@ class ExamGenerator:
         for placeholder, value in replacements.items():
             header = header.replace(placeholder, value)
 
-        # Generate problems section
-        problems_section = self._generate_problems(config['problems'],
-                                                 config.get('include_solutions', False))
-        
         # Generate footer with optional bibliography
         footer = self.template_footer
         if config.get('bibliography'):
@@ -459,12 +692,15 @@ class ExamGenerator:
                 points = None
                 custom_instructions = None
                 page_break_after = False
+                part_seed = None
             elif isinstance(problem_spec, dict):
                 # Dictionary with additional options
                 identifier = problem_spec['id']
                 points = problem_spec.get('points')
                 custom_instructions = problem_spec.get('instructions')
                 page_break_after = problem_spec.get('page_break', False)
+                # Seed for shuffling the problem's parts (set per student by roster.py)
+                part_seed = problem_spec.get('part_seed')
             else:
                 print(f"Warning: Invalid problem specification: {problem_spec}")
                 continue
@@ -497,7 +733,9 @@ class ExamGenerator:
             # Remove enumerate label definitions (so exam defaults are used)
             # Match lines like: \def\labelenumi{\arabic{enumi}.}
             content = re.sub(r'^\\def\\labelenum.*\n', '', content, flags=re.MULTILINE)
-            problems_latex += content
+            if part_seed is not None:
+                content = shuffle_parts(content, part_seed)
+            problems_latex += resolve_assets_in(content, exercise)
 
             # Add solution if requested
             if include_solutions and exercise['solution']:
@@ -506,7 +744,10 @@ class ExamGenerator:
                 # Remove any \begin{solution} and \end{solution} from the content
                 solution = re.sub(r'\\begin\{solution\}.*?\n', '', solution)
                 solution = re.sub(r'\\end\{solution\}', '', solution)
-                problems_latex += solution
+                if part_seed is not None:
+                    # Same seed, so solution parts follow the shuffled problem parts
+                    solution = shuffle_parts(solution, part_seed)
+                problems_latex += resolve_assets_in(solution, exercise)
 
             # Add page break if requested
             if page_break_after:
@@ -519,8 +760,9 @@ class ExamGenerator:
 
 def load_config(config_file: str) -> Dict:
     """Load exam configuration from YAML file."""
+    import yaml
     with open(config_file, 'r') as f:
-        return yaml.safe_load(f)
+        return yaml.load(f, Loader=yaml_loader())
 
 def create_sample_config():
     """Create a sample configuration file."""
@@ -542,6 +784,7 @@ def create_sample_config():
         ]
     }
 
+    import yaml
     with open('exam_config_sample.yaml', 'w') as f:
         yaml.dump(sample_config, f, default_flow_style=False, indent=2)
 
@@ -565,70 +808,147 @@ def list_available_exercises(extractor: ExerciseExtractor):
         for ex in file_exercises:
             print(f"  ID: {ex['id']:<15} Hash: {ex['hash']:<15}")
 
-def compile_pdf(tex_file: str, base_path: str = "..") -> bool:
+def preflight_check(document: str, extractor: ExerciseExtractor, problem_specs: List,
+                    parts=('exercise', 'solution')) -> int:
+    """Statically check a generated document and the parts of its exercises it includes; return the error count."""
+    context = CheckContext(preamble_of(document), extractor.base_path)
+    issues = check_document(document, context, extractor.select(problem_specs), parts=parts)
+    return print_issues(issues, sys.stdout)
+
+def find_tex_tool(name: str) -> Optional[str]:
+    """Locate a TeX tool: $NAME env var (e.g. PDFLATEX), then PATH, then the TeX Live bin directories.
+
+    Those are the MacTeX link (/Library/TeX/texbin) and the newest
+    /usr/local/texlive/<year>/bin/<platform>, for shells whose PATH lacks them.
+    """
+    import shutil
+
+    found = os.environ.get(name.upper()) or shutil.which(name)
+    if found:
+        return found
+    candidates = [Path('/Library/TeX/texbin') / name]
+    candidates += sorted(Path('/usr/local/texlive').glob(f'[0-9]*/bin/*/{name}'), reverse=True)
+    return next((str(p) for p in candidates if p.exists()), None)
+
+def bisect_failure(problems: List, render, base_path: str, jobs: int, profiler: Optional[Profiler] = None):
+    """Bisect a failing compile over its problems and print which ones break it."""
+    from bisect_compile import bisect_problems, print_bisect_report
+
+    print(f"Bisecting {len(problems)} problem(s) with up to {jobs} concurrent compile(s)...")
+    try:
+        report = bisect_problems(problems, render, base_path, jobs, profiler)
+    except RuntimeError as e:
+        print(f"Cannot bisect: {e}")
+        return
+    print_bisect_report(report)
+
+def compile_pdf(tex_file: str, base_path: str = "..", profiler: Optional[Profiler] = None,
+                figure_cache: bool = False, jobs: int = 1) -> bool:
     """Compile the LaTeX file to PDF.
 
     Strategy:
       1) Prefer latexmk if available (env LATEXMK or PATH)
       2) Fall back to pdflatex (env PDFLATEX or PATH), run twice
+         (plus biber and a third pass for a biblatex document)
       3) If no toolchain is available, fail gracefully with guidance
+
+    The document is compiled from the book root (so figures, styles and
+    the book .aux resolve), with its .aux, .log, .bbl, minted files and PDF
+    in a private temporary build directory. Concurrent compiles, e.g.
+    ``make -j exams/midterm.pdf psets/midterm.pdf``, never share them.
+
+    The .bbl of a biblatex document is cached by its cited keys, .bib
+    contents and options (see bblcache.py); on a hit biber is not run and
+    two passes suffice.
+
+    With ``figure_cache``, standalone and TikZ figures are first rendered
+    (``jobs`` at a time) into the shared figure cache and the compiled copy
+    includes the cached PDFs instead (see figcache.py).
+
+    Each TeX/biber invocation is timed through ``profiler`` when one is given.
     """
+    import shutil
+    import tempfile
+
+    profiler = profiler or Profiler('compile_pdf')
     original_dir = os.getcwd()
+    build_dir = None
     try:
         # Normalize paths
         tex_path = Path(tex_file)
 
-        # Change to the book directory for compilation
+        # Compile from the book directory
         book_dir = Path(base_path).resolve()
         os.chdir(book_dir)
 
         # Determine exam file location (absolute vs relative)
         exam_file = tex_path if tex_path.is_absolute() else Path(original_dir) / tex_path
-        target_file = book_dir / tex_path.name
+        build_dir = Path(tempfile.mkdtemp(prefix=f'exam-{tex_path.stem}-'))
+        target_file = build_dir / tex_path.name
+        stem = tex_path.stem
 
         if exam_file.exists():
             shutil.copy2(exam_file, target_file)
 
+        if figure_cache and target_file.exists():
+            from figcache import apply_figure_cache
+            with profiler.phase('figures'):
+                document = target_file.read_text(encoding='utf-8')
+                document, replaced = apply_figure_cache(document, book_dir, jobs, profiler)
+                if replaced:
+                    target_file.write_text(document, encoding='utf-8')
+                    print(f"Using {replaced} pre-rendered figure(s) from the figure cache")
+
+        # Reuse the bibliography of an earlier compile citing the same keys
+        bbl_file = build_dir / f"{stem}.bbl"
+        bib_key = bbl_key(target_file.read_text(encoding='utf-8', errors='replace'), book_dir) \
+            if target_file.exists() else None
+        bbl_cached = bool(bib_key) and restore_bbl(bib_key, book_dir, bbl_file)
+        if bbl_cached:
+            print("Using cached bibliography (biber skipped)")
+
+        # minted writes its cache next to the other outputs, not in the book root
+        tex_input = f"\\PassOptionsToPackage{{outputdir={build_dir}}}{{minted}}\\input{{{target_file}}}"
+
         # Resolve toolchain; also check common macOS TeX bin if PATH lacks it
-        latexmk_cmd = (
-            os.environ.get('LATEXMK')
-            or shutil.which('latexmk')
-            or (str(Path('/Library/TeX/texbin/latexmk')) if Path('/Library/TeX/texbin/latexmk').exists() else None)
-        )
-        pdflatex_cmd = (
-            os.environ.get('PDFLATEX')
-            or shutil.which('pdflatex')
-            or (str(Path('/Library/TeX/texbin/pdflatex')) if Path('/Library/TeX/texbin/pdflatex').exists() else None)
-        )
+        latexmk_cmd = find_tex_tool('latexmk')
+        pdflatex_cmd = find_tex_tool('pdflatex')
 
         # Prefer latexmk
         if latexmk_cmd:
-            cmd = [latexmk_cmd, '-pdf', '-f', '-interaction=batchmode', '-shell-escape', tex_path.name]
-            result = subprocess.run(cmd, capture_output=True, text=True, cwd=book_dir)
+            cmd = [latexmk_cmd, '-pdf', '-f', '-interaction=batchmode', '-shell-escape',
+                   f'-jobname={stem}', f'-outdir={build_dir}',
+                   f"-pdflatex={pdflatex_cmd or 'pdflatex'} %O '{tex_input}'", str(target_file)]
+            if bbl_cached:
+                cmd.insert(1, '-bibtex-')
+            with profiler.phase('latex'):
+                result = profiler.run(cmd, capture_output=True, text=True, cwd=book_dir)
+            # With -f latexmk carries on past biber errors; only a clean run leaves a .bbl to reuse
+            bbl_ok = result.returncode == 0
         elif pdflatex_cmd:
             # Fallback to pdflatex - need to run biber if bibliography is present
-            biber_cmd = (
-                os.environ.get('BIBER')
-                or shutil.which('biber')
-                or (str(Path('/Library/TeX/texbin/biber')) if Path('/Library/TeX/texbin/biber').exists() else None)
-            )
-            
-            cmd1 = [pdflatex_cmd, '-interaction=batchmode', '-shell-escape', tex_path.name]
-            r1 = subprocess.run(cmd1, capture_output=True, text=True, cwd=book_dir)
+            biber_cmd = find_tex_tool('biber')
             
-            # Check if .bcf file was created (indicates biblatex is used)
-            bcf_file = book_dir / tex_path.with_suffix('.bcf').name
-            if bcf_file.exists() and biber_cmd:
-                # Run biber for bibliography processing
-                biber_result = subprocess.run(
-                    [biber_cmd, tex_path.stem],
-                    capture_output=True, text=True, cwd=book_dir
-                )
-            
-            r2 = subprocess.run(cmd1, capture_output=True, text=True, cwd=book_dir)
-            r3 = subprocess.run(cmd1, capture_output=True, text=True, cwd=book_dir)  # Third run to resolve citations
-            # Combine outputs for diagnostics
-            result = r3
+            cmd1 = [pdflatex_cmd, '-interaction=batchmode', '-shell-escape', f'-jobname={stem}',
+                    f'-output-directory={build_dir}', tex_input]
+            with profiler.phase('latex'):
+                r1 = profiler.run(cmd1, capture_output=True, text=True, cwd=book_dir)
+
+                # Check if .bcf file was created (indicates biblatex is used)
+                bcf_file = build_dir / f"{stem}.bcf"
+                run_biber = bcf_file.exists() and biber_cmd and not bbl_cached
+                if run_biber:
+                    # Run biber for bibliography processing
+                    biber_result = profiler.run(
+                        [biber_cmd, f'--input-directory={build_dir}', f'--output-directory={build_dir}', stem],
+                        capture_output=True, text=True, cwd=book_dir
+                    )
+
+                result = profiler.run(cmd1, capture_output=True, text=True, cwd=book_dir)
+                if run_biber:
+                    # Third run to resolve citations
+                    result = profiler.run(cmd1, capture_output=True, text=True, cwd=book_dir)
+            bbl_ok = bool(run_biber) and biber_succeeded(biber_result, build_dir / f"{stem}.blg")
         else:
             print("No LaTeX toolchain found (latexmk or pdflatex). Skipping PDF compilation.")
             print("To enable PDF compilation on macOS:")
@@ -638,7 +958,7 @@ def compile_pdf(tex_file: str, base_path: str = "..") -> bool:
             return False
 
         # Check if PDF was created
-        pdf_file = book_dir / tex_path.with_suffix('.pdf').name
+        pdf_file = build_dir / f"{stem}.pdf"
         if pdf_file.exists():
             # Copy PDF back next to the .tex file
             dest_pdf = (
@@ -646,36 +966,17 @@ def compile_pdf(tex_file: str, base_path: str = "..") -> bool:
                 if tex_path.is_absolute()
                 else Path(original_dir) / tex_path.with_suffix('.pdf').name
             )
-            try:
-                if pdf_file.resolve() != dest_pdf.resolve():
-                    shutil.copy2(pdf_file, dest_pdf)
-            except FileNotFoundError:
-                # If resolve fails for dest (doesn't exist yet), just copy
-                shutil.copy2(pdf_file, dest_pdf)
+            shutil.copy2(pdf_file, dest_pdf)
             print(f"PDF compiled successfully: {dest_pdf}")
             compile_ok = True
+            if bib_key and not bbl_cached and bbl_ok:
+                store_bbl(bib_key, book_dir, bbl_file)
         else:
             print("PDF compilation did not produce an output file.")
             if result and getattr(result, 'stderr', None):
                 print("LaTeX errors:", result.stderr[-500:])
             compile_ok = False
 
-        # Clean up build artifacts from book_dir (the .tex was copied there for compilation)
-        stem = tex_path.stem
-        for ext in ('.tex', '.aux', '.log', '.out', '.bcf', '.bbl', '.blg',
-                     '.fls', '.fdb_latexmk', '.run.xml', '.synctex.gz',
-                     '.pdf', '.toc', '.nav', '.snm'):
-            artifact = book_dir / f"{stem}{ext}"
-            if artifact.exists():
-                try:
-                    artifact.unlink()
-                except Exception:
-                    pass
-        # Also clean minted cache directory if present
-        minted_dir = book_dir / f"_minted-{stem}"
-        if minted_dir.is_dir():
-            shutil.rmtree(minted_dir, ignore_errors=True)
-
         return compile_ok
 
     except Exception as e:
@@ -683,8 +984,12 @@ def compile_pdf(tex_file: str, base_path: str = "..") -> bool:
         return False
     finally:
         os.chdir(original_dir)
+        # Build artifacts (.aux, .log, .bbl, _minted-*, ...) go with the build directory
+        if build_dir is not None:
+            with profiler.phase('cleanup'):
+                shutil.rmtree(build_dir, ignore_errors=True)
 
-def main():
+def main(argv: Optional[List[str]] = None):
     parser = argparse.ArgumentParser(description='Generate exams from exercise database')
     parser.add_argument('--config', help='YAML configuration file')
     parser.add_argument('--problems', help='Comma-separated list of problem IDs/hashes')
@@ -703,16 +1008,32 @@ def main():
                        help='Glob pattern(s) for exercise files (comma-separated for multiple patterns)')
     parser.add_argument('--styles-path', default='common/styles-tex', help='Path to book style files (relative to book root)')
     parser.add_argument('--no-quick', action='store_true', help='Skip PDF compilation (default: compile PDF)')
-
-    args = parser.parse_args()
+    parser.add_argument('--no-depfile', action='store_true',
+                        help='Do not write the make dependency file (<output>.d)')
+    parser.add_argument('--no-check', action='store_true',
+                        help='Skip the static LaTeX checks run before compiling')
+    parser.add_argument('--bisect', action='store_true',
+                        help='If compilation fails, find the failing problem(s) by compiling subsets in parallel')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                        help='Concurrent compiles for --bisect and figure rendering (default: CPU count)')
+    parser.add_argument('--no-figure-cache', action='store_true',
+                        help='Compile standalone/TikZ figures in place instead of using pre-rendered PDFs')
+    parser.add_argument('--profile', action='store_true',
+                        help='Record per-phase and per-subprocess timings as a JSON trace (also EXAM_PROFILE=1)')
+    parser.add_argument('--cprofile', metavar='FILE', help='Also dump Python cProfile stats to FILE')
+
+    args = parser.parse_args(argv)
 
     # Handle special commands
     if args.sample_config:
         create_sample_config()
         return
 
+    profiler = Profiler('generate_exam', profiling_requested(args.profile), args.cprofile)
+
     # Initialize extractor
-    extractor = ExerciseExtractor(Path(args.base_path).resolve(), args.exercise_pattern)
+    with profiler.phase('extractor_load'):
+        extractor = ExerciseExtractor(Path(args.base_path).resolve(), args.exercise_pattern)
 
     if args.list:
         list_available_exercises(extractor)
@@ -723,7 +1044,8 @@ def main():
 
     if args.config:
         # Load from config file
-        config = load_config(args.config)
+        with profiler.phase('config_load'):
+            config = load_config(args.config)
         # Determine base name from config file
         config_path = Path(args.config).resolve()
         base_name = config_path.stem
@@ -750,7 +1072,8 @@ def main():
         parser.error('Either --config or --problems must be specified')
 
     # Generate the exam
-    exam_latex = generator.generate_exam(config)
+    with profiler.phase('render'):
+        exam_latex = generator.generate_exam(config)
 
     # Determine output filename and directory
     if args.output:
@@ -772,6 +1095,8 @@ def main():
             output_dir = Path('.').resolve()
             output_file = str(output_dir / f"{base_name}.tex")
 
+    profiler.document = Path(output_file).stem
+
     # Write the exam file
     with open(output_file, 'w', encoding='utf-8') as f:
         f.write(exam_latex)
@@ -779,9 +1104,11 @@ def main():
     print(f"Exam generated: {output_file}")
 
     # Optionally generate solutions file
+    exam_config = dict(config)
     if args.solutions:
         config['include_solutions'] = True
-        solutions_latex = generator.generate_exam(config)
+        with profiler.phase('render_solutions'):
+            solutions_latex = generator.generate_exam(config)
         if args.config:
             solutions_file = str(output_dir / f"{base_name}_solutions.tex")
         else:
@@ -790,14 +1117,51 @@ def main():
             f.write(solutions_latex)
         print(f"Solutions generated: {solutions_file}")
 
+    if not args.no_depfile:
+        targets = [output_file, Path(output_file).with_suffix('.pdf')]
+        if args.solutions:
+            targets += [Path(solutions_file).resolve(), Path(solutions_file).resolve().with_suffix('.pdf')]
+        deps = document_dependencies(extractor, config['problems'], args.styles_path,
+                                     [config.get('config_path'), config.get('bibliography'),
+                                      generator._find_book_aux(extractor.base_path)])
+        write_depfile(Path(output_file).with_suffix('.d'), targets, deps, extractor.base_path)
+
+    if not args.no_check:
+        with profiler.phase('check'):
+            check_errors = preflight_check(solutions_latex if args.solutions else exam_latex,
+                                           extractor, config['problems'],
+                                           ('exercise', 'solution') if config.get('include_solutions')
+                                           else ('exercise',))
+        if check_errors and not args.no_quick:
+            print(f"✗ {check_errors} error(s) found before compiling; fix them or pass --no-check")
+            profiler.write(Path(output_file).parent / '.profile')
+            return 1
+
     # Compile PDF by default unless --no-quick is specified
+    status = 0
     if not args.no_quick:
         print("Compiling PDF...")
-        compile_success = compile_pdf(output_file, args.base_path)
+        with profiler.phase('compile'):
+            compile_success = compile_pdf(output_file, args.base_path, profiler,
+                                          figure_cache=not args.no_figure_cache, jobs=args.jobs)
+        failed_config = None if compile_success else exam_config
 
         if args.solutions and compile_success:
             print("Compiling solutions PDF...")
-            compile_pdf(solutions_file, args.base_path)
+            with profiler.phase('compile_solutions'):
+                if not compile_pdf(solutions_file, args.base_path, profiler,
+                                   figure_cache=not args.no_figure_cache, jobs=args.jobs):
+                    failed_config = config
+
+        if failed_config is not None and args.bisect:
+            with profiler.phase('bisect'):
+                bisect_failure(failed_config['problems'],
+                               lambda subset: generator.generate_exam(dict(failed_config, problems=subset)),
+                               args.base_path, args.jobs, profiler)
+            status = 1
+
+    profiler.write(Path(output_file).parent / '.profile')
+    return status
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
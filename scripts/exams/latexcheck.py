@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+Static pre-flight checks for generated exams/psets and their exercises.
+
+Catches the content errors that otherwise cost a full latexmk run, in
+milliseconds and with the exercise ID attached:
+
+    unbalanced_brace        error    unmatched { or }
+    unbalanced_environment  error    \\begin/\\end that do not pair up
+    missing_asset           error    figure/input that does not resolve (assets.py)
+    undefined_macro         warning  macro not defined by the preamble, the
+                                     book style files or a known package
+    unknown_cite            warning  cite key not found in the bibliography
+
+Comments and verbatim material (verbatim, minted, lstlisting, \\verb,
+\\mintinline) are ignored. The macro check knows the preamble's own
+definitions, everything defined in local style files it loads, and the
+commands of common packages it (or those style files) load; it is a
+warning because that list can never be complete.
+
+Per-exercise results are cached by content hash under the shared cache
+directory (see cache.py), so re-checking an unchanged book is a hash
+lookup per exercise.
+
+Usage:
+    latexcheck.py exam.tex [--base-path PATH]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from cache import cache_dir, content_key, load_json, write_json
+
+CHECK_VERSION = 1
+# Parts of an exercise record a document can include
+PARTS = ('exercise', 'solution')
+
+SEVERITY = {
+    'unbalanced_brace': 'error',
+    'unbalanced_environment': 'error',
+    'missing_asset': 'error',
+    'undefined_macro': 'warning',
+    'unknown_cite': 'warning',
+}
+
+# TeX/LaTeX2e kernel commands commonly found in exercise text
+KERNEL_MACROS = frozenset("""
+    begin end item label ref pageref eqref cite nocite footnote footnotemark footnotetext
+    section subsection subsubsection paragraph subparagraph part chapter caption centering
+    raggedright raggedleft par newline linebreak pagebreak newpage clearpage cleardoublepage
+    noindent indent vspace hspace vfill hfill smallskip medskip bigskip quad qquad enspace
+    textbf textit texttt textrm textsf textsc textsl textup textnormal emph underline
+    bfseries itshape ttfamily rmfamily sffamily scshape mdseries upshape normalfont
+    tiny scriptsize footnotesize small normalsize large Large LARGE huge Huge
+    mathrm mathbf mathit mathsf mathtt mathcal mathnormal boldsymbol mathbb mathfrak mathscr
+    frac dfrac tfrac sqrt sum prod int iint iiint oint lim limsup liminf sup inf max min
+    arg det exp log ln sin cos tan sec csc cot sinh cosh tanh arcsin arccos arctan deg dim
+    ker hom gcd Pr mod bmod pmod left right big Big bigg Bigg bigl bigr Bigl Bigr biggl biggr
+    middle cdot cdots ldots dots vdots ddots times div pm mp ast star circ bullet oplus otimes
+    leq geq le ge neq ne approx sim simeq cong equiv propto ll gg subset supset subseteq
+    supseteq in notin ni cup cap setminus emptyset varnothing forall exists nexists neg lnot
+    land lor wedge vee to rightarrow leftarrow Rightarrow Leftarrow leftrightarrow
+    Leftrightarrow mapsto longrightarrow longleftarrow Longrightarrow Longleftrightarrow
+    implies iff uparrow downarrow updownarrow infty partial nabla prime hbar ell Re Im angle
+    alpha beta gamma delta epsilon varepsilon zeta eta theta vartheta iota kappa lambda mu
+    nu xi pi varpi rho varrho sigma varsigma tau upsilon phi varphi chi psi omega Gamma Delta
+    Theta Lambda Xi Pi Sigma Upsilon Phi Psi Omega hat widehat tilde widetilde bar overline
+    underbrace overbrace vec dot ddot acute grave breve check mathring text mbox makebox
+    fbox framebox parbox raisebox rule hline cline multicolumn tabularnewline arraystretch
+    phantom hphantom vphantom displaystyle textstyle scriptstyle limits nolimits operatorname
+    stackrel overset underset binom tbinom dbinom choose not perp parallel mid nmid vert Vert
+    lvert rvert lVert rVert langle rangle lceil rceil lfloor rfloor backslash colon
+    today LaTeX TeX ldots textbackslash textasciitilde textasciicircum textbar textless
+    textgreater textendash textemdash S P dag ddag copyright pounds degree
+    url href hyperref hypertarget hyperlink texorpdfstring
+    newcommand renewcommand providecommand def let edef gdef xdef relax protect
+    setlength addtolength setcounter addtocounter stepcounter refstepcounter value arabic
+    roman Roman alph Alph fnsymbol the thepage theequation input include includegraphics
+    graphicspath appendix tableofcontents listoffigures maketitle title author date and
+    thanks verb enskip thinspace negthinspace allowbreak nobreak nopagebreak kern hskip vskip
+    hbox vbox color textcolor colorbox definecolor pagecolor tag notag nonumber intertext
+    shortintertext substack boxed cfrac leqslant geqslant lesssim gtrsim triangleq coloneqq
+    eqqcolon dim mathop mathrel mathbin mathord mathopen mathclose mathpunct mathstrut strut
+    iff ell wp aleph beth top bot measuredangle varkappa digamma jmath imath
+""".split())
+
+# Commands provided by packages the templates and book styles load
+PACKAGE_MACROS = {
+    'amsmath': 'align equation gather multline split cases eqref tag DeclareMathOperator '
+               'numberwithin allowdisplaybreaks text boxed xrightarrow xleftarrow',
+    'amssymb': 'mathbb mathfrak varnothing lesssim gtrsim blacksquare square checkmark',
+    'graphicx': 'includegraphics graphicspath rotatebox scalebox resizebox reflectbox',
+    'hyperref': 'href url nolinkurl hyperref hypertarget hyperlink texorpdfstring autoref phantomsection',
+    'cleveref': 'cref Cref crefname Crefname crefrange Crefrange labelcref namecref',
+    'xr': 'externaldocument',
+    'biblatex': 'cite Cite textcite Textcite parencite Parencite autocite Autocite footcite '
+                'fullcite citeauthor citeyear citetitle printbibliography addbibresource '
+                'smartcite citet citep',
+    'natbib': 'citet citep citealt citealp citeauthor citeyear',
+    'standalone': 'includestandalone',
+    'minted': 'mintinline inputminted setminted mint newminted usemintedstyle',
+    'booktabs': 'toprule midrule bottomrule cmidrule addlinespace specialrule',
+    'subcaption': 'subcaption subcaptionbox subref',
+    'enumitem': 'setlist',
+    'fancyhdr': 'pagestyle thispagestyle fancyhf fancyhead fancyfoot lhead chead rhead lfoot cfoot rfoot',
+    'lastpage': 'pageref',
+    'xparse': 'NewDocumentCommand RenewDocumentCommand ProvideDocumentCommand '
+              'DeclareDocumentCommand NewDocumentEnvironment IfNoValueTF IfValueT IfBooleanTF',
+    'tikz': 'tikz tikzset usetikzlibrary draw node path fill filldraw shade clip coordinate '
+            'foreach pgfmathsetmacro pgfmathparse pgfmathresult pgfkeys pgfimage pgftext '
+            'pgfpathmoveto pgfpathlineto pgfusepath pgfsetlinewidth pgfqpoint pgfpoint',
+    'pgfplots': 'addplot addlegendentry legend pgfplotsset',
+    'siunitx': 'SI si num qty unit ang SIrange numrange sisetup ohm volt ampere watt farad '
+               'henry hertz second meter kilogram newton joule radian micro milli kilo mega',
+    'xcolor': 'color textcolor colorbox fcolorbox definecolor colorlet',
+    'bookmark': 'bookmark',
+    'textcomp': 'textdegree textmu textohm textcelsius',
+    'float': 'floatstyle restylefloat',
+    'tabularx': 'tabularx',
+    'mathtools': 'coloneqq eqqcolon mathclap mathllap mathrlap DeclarePairedDelimiter '
+                 'shortintertext prescript',
+    'physics': 'dv pdv abs norm qty bra ket braket expval dd',
+    'bm': 'bm',
+    'cancel': 'cancel bcancel xcancel cancelto',
+    'geometry': 'newgeometry restoregeometry',
+}
+
+DEF_RE = re.compile(
+    r'\\(?:(?:re)?newcommand|providecommand|DeclareRobustCommand|DeclareMathOperator'
+    r'|(?:New|Renew|Provide|Declare)DocumentCommand|newlength|newsavebox)\*?\s*\{?\s*\\([A-Za-z@]+)'
+    r'|\\(?:[gex]?def|let|global\\def|global\\let)\s*\\([A-Za-z@]+)'
+    r'|\\newif\s*\\if([A-Za-z@]+)'
+    r'|\\newcounter\s*\{([A-Za-z@]+)\}'
+    r'|\\definecolor\s*\{([A-Za-z@]+)\}'
+)
+PACKAGE_RE = re.compile(r'\\(?:usepackage|RequirePackage)\s*(?:\[[^\]]*\])?\s*\{([^}]+)\}')
+LOCAL_INPUT_RE = re.compile(r'\\input\s*\{([^}]+\.sty)\}')
+MACRO_RE = re.compile(r'\\([A-Za-z]+)')
+BRACE_RE = re.compile(r'\\.|[{}]', re.DOTALL)
+ESCAPE_RE = re.compile(r'\\.', re.DOTALL)
+GROUP_RE = re.compile(r'\{[^{}]*\}')
+ENV_RE = re.compile(r'\\(begin|end)\s*\{([^}]+)\}')
+VERBATIM_RE = re.compile(
+    r'(\\begin\{(verbatim\*?|Verbatim|minted|lstlisting|comment)\}(?:\{[^}]*\})?)(.*?)(\\end\{\2\})', re.DOTALL)
+VERB_RE = re.compile(r'\\verb\*?([^A-Za-z\s])(.*?)\1|\\mintinline\{[^}]*\}(?:\{([^}]*)\}|([|!])(.*?)\4)')
+COMMENT_RE = re.compile(r'(?<!\\)%.*$', re.MULTILINE)
+BIB_KEY_RE = re.compile(r'@\w+\s*\{\s*([^,\s]+)\s*,')
+
+
+def _blank(text: str) -> str:
+    """Replace text with spaces, keeping newlines so line numbers survive."""
+    return re.sub(r'[^\n]', ' ', text)
+
+
+def strip_ignored(text: str) -> str:
+    """Blank out comments and verbatim material."""
+    text = VERBATIM_RE.sub(lambda m: m.group(1) + _blank(m.group(3)) + m.group(4), text)
+    text = VERB_RE.sub(lambda m: _blank(m.group(0)), text)
+    return COMMENT_RE.sub(lambda m: _blank(m.group(0)), text)
+
+
+def _issue(code: str, message: str, line: Optional[int] = None) -> Dict:
+    return {'severity': SEVERITY[code], 'code': code, 'line': line, 'message': message}
+
+
+def check_braces(text: str) -> List[Dict]:
+    """Unmatched braces in (already stripped) text."""
+    # Fast path: peel off innermost {...} groups with C-level regex passes
+    # (one per nesting level); only unbalanced text needs the token walk.
+    rest = ESCAPE_RE.sub('', text)
+    while True:
+        peeled = GROUP_RE.sub('', rest)
+        if peeled == rest:
+            break
+        rest = peeled
+    if '{' not in rest and '}' not in rest:
+        return []
+
+    issues = []
+    stack: List[int] = []
+    for m in BRACE_RE.finditer(text):
+        c = m.group(0)
+        if c == '{':
+            stack.append(m.start())
+        elif c == '}':
+            if stack:
+                stack.pop()
+            else:
+                issues.append(_issue('unbalanced_brace', "Unmatched '}'", text.count('\n', 0, m.start()) + 1))
+    for pos in stack:
+        issues.append(_issue('unbalanced_brace', "'{' is never closed", text.count('\n', 0, pos) + 1))
+    return issues
+
+
+def check_environments(text: str) -> List[Dict]:
+    """\\begin/\\end pairs that do not match in (already stripped) text."""
+    issues = []
+    stack: List[tuple] = []
+    for m in ENV_RE.finditer(text):
+        kind, name = m.group(1), m.group(2).strip()
+        line = text.count('\n', 0, m.start()) + 1
+        if kind == 'begin':
+            stack.append((name, line))
+        elif stack and stack[-1][0] == name:
+            stack.pop()
+        elif any(open_name == name for open_name, _ in stack):
+            while stack[-1][0] != name:
+                open_name, open_line = stack.pop()
+                issues.append(_issue('unbalanced_environment',
+                                     f"\\begin{{{open_name}}} is closed by \\end{{{name}}}", open_line))
+            stack.pop()
+        else:
+            issues.append(_issue('unbalanced_environment', f"\\end{{{name}}} without \\begin{{{name}}}", line))
+    for name, line in stack:
+        issues.append(_issue('unbalanced_environment', f"\\begin{{{name}}} is never ended", line))
+    return issues
+
+
+def defined_macros(text: str) -> set:
+    """Macros defined in a preamble or style file."""
+    names = set()
+    for m in DEF_RE.finditer(text):
+        name = next(g for g in m.groups() if g)
+        if m.group(3):
+            names.update({'if' + name, name + 'true', name + 'false'})
+        elif m.group(4):
+            names.add('the' + name)
+        elif not m.group(5):
+            names.add(name)
+    return names
+
+
+class CheckContext:
+    """What a document defines: macros (preamble, local styles, packages) and cite keys.
+
+    Args:
+        preamble: Document text up to \\begin{document}
+        base_path: Book root; local packages and bibliographies resolve against it
+        bib_files: Bibliography files (relative to base_path); None = look in the preamble
+    """
+
+    def __init__(self, preamble: str, base_path, bib_files: Optional[Iterable[str]] = None):
+        self.base_path = Path(base_path).resolve()
+        self.macros = set(KERNEL_MACROS)
+        self.packages: set = set()
+        self._load_definitions(preamble, depth=0)
+
+        if bib_files is None:
+            bib_files = re.findall(r'\\addbibresource\{([^}]+)\}', preamble)
+        self.bib_files = [f for f in bib_files if f and (self.base_path / f).exists()]
+        self.cite_keys = set()
+        for f in self.bib_files:
+            text = (self.base_path / f).read_text(encoding='utf-8', errors='replace')
+            self.cite_keys.update(BIB_KEY_RE.findall(text))
+
+        self.fingerprint = content_key(CHECK_VERSION, *sorted(self.macros), '|', *sorted(self.cite_keys),
+                                       '|', *self.bib_files)
+
+    def _load_definitions(self, text: str, depth: int):
+        text = strip_ignored(text)
+        self.macros |= defined_macros(text)
+        local = [m.group(1) for m in LOCAL_INPUT_RE.finditer(text)]
+        for m in PACKAGE_RE.finditer(text):
+            for name in (p.strip() for p in m.group(1).split(',')):
+                if name in PACKAGE_MACROS and name not in self.packages:
+                    self.packages.add(name)
+                    self.macros.update(PACKAGE_MACROS[name].split())
+                elif '/' in name or (self.base_path / f"{name}.sty").exists():
+                    local.append(f"{name}.sty")
+        if depth > 3:
+            return
+        for rel in local:
+            path = self.base_path / rel
+            if path.exists():
+                self._load_definitions(path.read_text(encoding='utf-8', errors='replace'), depth + 1)
+
+
+def check_text(text: str, context: CheckContext, assets: Optional[Dict] = None) -> List[Dict]:
+    """All checks on one piece of LaTeX (an exercise body/solution or a document body)."""
+    stripped = strip_ignored(text)
+    issues = check_braces(stripped) + check_environments(stripped)
+
+    local = defined_macros(stripped)
+    undefined = {}
+    for m in MACRO_RE.finditer(stripped):
+        name = m.group(1)
+        if name not in context.macros and name not in local and name not in undefined:
+            undefined[name] = stripped.count('\n', 0, m.start()) + 1
+    for name, line in undefined.items():
+        issues.append(_issue('undefined_macro', f"\\{name} is not defined in the preamble or style files", line))
+
+    for ref in (assets or {}).get('missing', []):
+        issues.append(_issue('missing_asset', f"Referenced file not found: {ref}"))
+
+    if assets and assets.get('cite_keys'):
+        if not context.bib_files:
+            issues.append(_issue('unknown_cite', "Cites " + ', '.join(assets['cite_keys'])
+                                 + " but no bibliography is configured"))
+        else:
+            for key in assets['cite_keys']:
+                if key not in context.cite_keys:
+                    issues.append(_issue('unknown_cite', f"Cite key {key} not found in {', '.join(context.bib_files)}"))
+    return sorted(issues, key=lambda i: (i['line'] or 0))
+
+
+class ExerciseChecker:
+    """Check exercise records against a CheckContext, caching results by content."""
+
+    def __init__(self, context: CheckContext, cache_path: Optional[Path] = None):
+        self.context = context
+        self.cache_path = cache_path or cache_dir(context.base_path) / 'latexcheck.json'
+        data = load_json(self.cache_path, {}) or {}
+        self._cache: Dict[str, list] = data.get('entries', {}) if data.get('version') == CHECK_VERSION else {}
+        self._used: set = set()
+        self._dirty = False
+
+    def check(self, record: Dict, parts: Iterable[str] = PARTS) -> List[Dict]:
+        """Issues for the given parts of one exercise; line numbers are relative to its exercise file.
+
+        A document that leaves out a part (a student exam without solutions,
+        a solutions-only pset) is not blocked by errors in that part.
+        """
+        parts = tuple(p for p in PARTS if p in parts)
+        # full_solution starts with the whitespace that follows \end{exercise}
+        text = ''.join(record[f'full_{part}'] for part in parts)
+        assets = record.get('assets') or {}
+        if parts != PARTS:
+            # Assets are resolved for the whole record; keep those the checked text refers to
+            assets = dict(assets, missing=[r for r in assets.get('missing', []) if r in text],
+                          cite_keys=[k for k in assets.get('cite_keys', []) if k in text])
+        key = content_key(self.context.fingerprint, *parts, '|', text,
+                          *assets.get('missing', []), '|', *assets.get('cite_keys', []))
+        issues = self._cache.get(key)
+        if issues is None:
+            issues = check_text(text, self.context, assets)
+            self._cache[key] = issues
+            self._dirty = True
+        self._used.add(key)
+        offset = record['line'] - 1
+        if 'exercise' not in parts:
+            offset += record['full_exercise'].count('\n')
+        return [dict(i, line=i['line'] + offset) if i['line'] else dict(i) for i in issues]
+
+    def save(self, prune: bool = False):
+        """Write the cache; with prune, keep only the entries used in this run."""
+        if prune and len(self._used) != len(self._cache):
+            self._cache = {k: v for k, v in self._cache.items() if k in self._used}
+            self._dirty = True
+        if self._dirty:
+            write_json(self.cache_path, {'version': CHECK_VERSION, 'entries': self._cache})
+            self._dirty = False
+
+
+def check_document(text: str, context: CheckContext, exercises: Iterable[Dict],
+                   checker: Optional[ExerciseChecker] = None, parts: Iterable[str] = PARTS) -> List[Dict]:
+    """Check a generated document: each selected exercise (cached) plus the document as a whole.
+
+    ``parts`` are the parts of each exercise the document includes
+    (``'exercise'``, ``'solution'``); only those are checked.
+
+    Returns issues carrying the exercise ``id`` (None for the template) and
+    a ``where`` location (exercise file:line, or line in the document).
+    """
+    checker = checker or ExerciseChecker(context)
+    issues = []
+    for record in exercises:
+        for issue in checker.check(record, parts):
+            where = f"{record['path']}:{issue['line']}" if issue['line'] else record['path']
+            issues.append(dict(issue, id=record['id'], where=where))
+    checker.save()
+
+    # Structural problems the generator itself may introduce (e.g. solution cleanup)
+    if not any(i['severity'] == 'error' for i in issues):
+        stripped = strip_ignored(text)
+        for issue in check_braces(stripped) + check_environments(stripped):
+            issues.append(dict(issue, id=_exercise_at(text, issue['line'], exercises),
+                               where=f"line {issue['line']}"))
+    return issues
+
+
+def _exercise_at(text: str, line: Optional[int], exercises: Iterable[Dict]) -> Optional[str]:
+    """ID of the problem whose heading (\\label{hash}) precedes line in a generated document."""
+    if not line:
+        return None
+    by_hash = {r['hash']: r['id'] for r in exercises}
+    found = None
+    for m in re.finditer(r'\\label\{([^}]+)\}', text):
+        if text.count('\n', 0, m.start()) + 1 > line:
+            break
+        found = by_hash.get(m.group(1), found)
+    return found
+
+
+def print_issues(issues: List[Dict], stream=sys.stderr) -> int:
+    """Print issues (errors first) and return the number of errors."""
+    errors = 0
+    for issue in sorted(issues, key=lambda i: i['severity'] != 'error'):
+        mark = '✗ Error' if issue['severity'] == 'error' else '⚠ Warning'
+        errors += issue['severity'] == 'error'
+        who = f"{issue['id']}: " if issue.get('id') else ''
+        print(f"{mark}: {who}{issue['message']} [{issue.get('where', '')}]", file=stream)
+    return errors
+
+
+def find_bibliography(base_path) -> Optional[str]:
+    """The book's bibliography file (relative to base_path), if one can be found."""
+    base_path = Path(base_path)
+    # Check preamble files for \addbibresource
+    for preamble in sorted(base_path.glob("0-*.tex")):
+        try:
+            m = re.search(r'\\addbibresource\{([^}]+)\}', preamble.read_text(encoding='utf-8'))
+        except OSError:
+            continue
+        if m and (base_path / m.group(1)).exists():
+            return m.group(1)
+    # Fallback: check common locations
+    for candidate in ["common/book.bib", "book.bib", "references.bib"]:
+        if (base_path / candidate).exists():
+            return candidate
+    return None
+
+
+def preamble_of(text: str) -> str:
+    end = text.find('\\begin{document}')
+    return text if end < 0 else text[:end]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('document', help='Generated .tex file')
+    ap.add_argument('--base-path', default=os.environ.get('BASE_PATH', '../..'), help='Book root')
+    args = ap.parse_args(argv)
+
+    text = Path(args.document).read_text(encoding='utf-8')
+    context = CheckContext(preamble_of(text), args.base_path)
+    issues = [dict(i, where=f"line {i['line']}") for i in check_text(text, context)]
+    errors = print_issues(issues)
+    if not issues:
+        print("✓ No problems found", file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Exercises read directly from versioned ``source.md`` files.
+
+The generators read exercises from ``common/versioned/<v>/index.tex``,
+which make builds by running pandoc (with the book's Lua filters) over
+the whole ``source.md``. When a ``source.md`` is newer than its
+``index.tex`` (and pandoc_batch.py's cache does not show the ``index.tex``
+to be its current conversion), the extractor also reads the exercise
+divs from the markdown:
+
+    ::: {#madrid .exercise h="madrid"}
+    Problem text ...
+    ::: solution
+    Solution text ...
+    :::
+    :::
+
+The markdown only overrides the exercises it defines as divs. The other
+exercises of the ``index.tex`` (e.g. ones written as raw
+``\\begin{exercise}`` LaTeX in the markdown) are still read from it, and
+a div that fails to convert falls back to the ``index.tex`` record with
+the same ID.
+
+Each div is converted on its own, only when a field that needs LaTeX
+(``content``, ``solution``, ``options``, ``assets``, ...) is first read.
+Generating an exam converts just its problems; editing one problem
+converts one fragment. Conversions are cached under
+``<cache root>/md-exercises/`` (see cache.py) by a hash of the fragment,
+the pandoc version and arguments, and the files the arguments name, so an
+unchanged fragment is never converted again.
+
+Pandoc runs from the book root as ``pandoc <args> -o <fragment>.tex``
+with the fragment on stdin. The arguments are those of the book's
+``source.md`` -> ``index.tex`` rule, from ``PANDOC_TEX_ARGS``.
+
+Author: meta-book project
+Date: 2024
+"""
+from __future__ import annotations
+
+import os
+import re
+import shlex
+import sys
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from cache import cache_dir, content_key
+
+# Opening fence of a div (with attributes) and the bare fence closing one
+DIV_OPEN_RE = re.compile(r'^(:{3,})\s*(\{[^}]*\}|[\w-]+)\s*:*\s*$')
+DIV_CLOSE_RE = re.compile(r'^:{3,}\s*$')
+DIV_ID_RE = re.compile(r'#([^\s}]+)')
+DIV_HASH_RE = re.compile(r'\bh=(?:"([^"]*)"|(\S+?))(?=[\s}]|$)')
+# Record fields filled by converting the fragment
+CONVERTED_FIELDS = ('options', 'content', 'solution', 'has_solution', 'full_exercise', 'full_solution',
+                    'assets')
+
+
+def _is_exercise_div(attributes: str) -> bool:
+    if attributes.startswith('{'):
+        return '.exercise' in attributes.strip('{}').split()
+    return attributes == 'exercise'
+
+
+def exercise_blocks(text: str) -> List[Tuple[int, str, str]]:
+    """(line, attributes, fragment) of every top-level exercise div in text."""
+    blocks = []
+    lines = text.splitlines(keepends=True)
+    depth = 0
+    start = None
+    attributes = ''
+    for number, line in enumerate(lines, 1):
+        opening = DIV_OPEN_RE.match(line)
+        if opening:
+            if depth == 0 and _is_exercise_div(opening.group(2)):
+                start, attributes = number, opening.group(2)
+            depth += 1
+        elif DIV_CLOSE_RE.match(line) and depth:
+            depth -= 1
+            if depth == 0 and start is not None:
+                blocks.append((start, attributes, ''.join(lines[start - 1:number])))
+                start = None
+    return blocks
+
+
+class FragmentConverter:
+    """Cached pandoc conversion of markdown fragments to LaTeX.
+
+    Args:
+        base_path: Book root (pandoc runs there, so filter paths resolve)
+        pandoc_args: pandoc arguments of the book's source.md -> index.tex rule
+        pandoc: pandoc executable
+    """
+
+    def __init__(self, base_path, pandoc_args: str, pandoc: str = "pandoc"):
+        import shutil  # imported here, like subprocess below, to keep generate_exam's startup light
+
+        self.base_path = Path(base_path)
+        self.args = shlex.split(pandoc_args)
+        self.pandoc = shutil.which(pandoc)
+        self._config_key: Optional[str] = None
+        self._batch = None
+
+    @property
+    def available(self) -> bool:
+        return self.pandoc is not None
+
+    def config_key(self) -> str:
+        """Hash of the pandoc version, the arguments and the files they name."""
+        if self._config_key is None:
+            import subprocess
+            result = subprocess.run([self.pandoc, '--version'], capture_output=True, text=True)
+            parts = [result.stdout.splitlines()[0] if result.stdout else '', '\0'.join(self.args)]
+            for arg in self.args:
+                value = arg.split('=', 1)[1] if arg.startswith('-') and '=' in arg else arg
+                path = self.base_path / value
+                if not value.startswith('-') and path.is_file():
+                    parts += [value, path.read_bytes()]
+            self._config_key = content_key(*parts)
+        return self._config_key
+
+    def index_current(self, source: Path, index: Path) -> bool:
+        """True if index is pandoc_batch.py's cached conversion of the current source.
+
+        The batch leaves an unchanged index.tex alone, so after a checkout it
+        can be older than a source.md it is still the conversion of.
+        """
+        scripts_dir = str(Path(__file__).resolve().parent.parent)
+        if scripts_dir not in sys.path:
+            sys.path.insert(0, scripts_dir)
+        from pandoc_batch import CACHE_DIR, PandocBatch
+        try:
+            if self._batch is None:
+                self._batch = PandocBatch(self.args, self.pandoc, self.base_path)
+            key = self._batch.key(source.relative_to(self.base_path))
+            cached = self.base_path / CACHE_DIR / key[:2] / f'{key}.tex'
+            return cached.read_bytes() == index.read_bytes()
+        except (OSError, ValueError):
+            return False
+
+    def convert(self, fragment: str) -> Tuple[Optional[str], str]:
+        """(LaTeX or None, pandoc's error output)."""
+        key = content_key(self.config_key(), fragment)
+        cached = cache_dir(self.base_path, 'md-exercises', key[:2]) / f'{key}.tex'
+        if cached.exists():
+            return cached.read_text(encoding='utf-8'), ''
+        tmp = cached.with_name(f'{key}.{os.getpid()}.tmp.tex')
+        import subprocess
+        result = subprocess.run([self.pandoc] + self.args + ['-o', str(tmp.resolve())], input=fragment,
+                                capture_output=True, text=True, cwd=self.base_path)
+        if result.returncode != 0 or not tmp.exists():
+            tmp.unlink(missing_ok=True)
+            return None, result.stderr.strip()
+        os.replace(tmp, cached)
+        return cached.read_text(encoding='utf-8'), ''
+
+
+class MarkdownExercise(dict):
+    """Exercise record whose LaTeX fields are converted on first access.
+
+    ``id``, ``hash``, ``file``, ``path``, ``line`` and ``has_hash`` come
+    from the div itself; reading any of CONVERTED_FIELDS (or iterating the
+    record, e.g. to serialize it) converts the fragment.
+    """
+
+    def __init__(self, fields: Dict, fragment: str, load: Callable[['MarkdownExercise'], Dict]):
+        super().__init__(fields)
+        self.fragment = fragment
+        self._load = load
+        self.converted = False
+
+    def convert(self) -> 'MarkdownExercise':
+        if not self.converted:
+            self.converted = True
+            self.update(self._load(self))
+        return self
+
+    def __getitem__(self, key):
+        if key in CONVERTED_FIELDS:
+            self.convert()
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        if key in CONVERTED_FIELDS:
+            self.convert()
+        return super().get(key, default)
+
+    def __contains__(self, key):
+        if key in CONVERTED_FIELDS:
+            self.convert()
+        return super().__contains__(key)
+
+    def __iter__(self):
+        return super(MarkdownExercise, self.convert()).__iter__()
+
+    def keys(self):
+        return super(MarkdownExercise, self.convert()).keys()
+
+    def values(self):
+        return super(MarkdownExercise, self.convert()).values()
+
+    def items(self):
+        return super(MarkdownExercise, self.convert()).items()
+
+    def copy(self):
+        return dict(self.items())
+
+
+def parse_markdown_exercises(text: str, file_name: str, rel_path: str, converter: FragmentConverter,
+                             parse_latex: Callable, asset_resolver=None,
+                             fallback: Optional[Dict[str, Dict]] = None) -> Tuple[List[Dict], List[Dict]]:
+    """Parse the exercise divs of a source.md, like parse_exercise_text does for LaTeX.
+
+    Args:
+        text: Full text of the source.md
+        file_name: File name recorded in each exercise record
+        rel_path: Path relative to the book root
+        converter: Converts each fragment when it is first needed
+        parse_latex: parse_exercise_text, applied to the converted fragment
+        asset_resolver: AssetResolver filling record['assets'] after conversion
+        fallback: Records of the stale index.tex by ID, used for a div that
+                  fails to convert
+
+    Returns:
+        (records, issues), as parse_exercise_text
+    """
+    def load(record: MarkdownExercise) -> Dict:
+        latex, error = converter.convert(record.fragment)
+        parsed = parse_latex(latex, file_name, rel_path)[0] if latex is not None else []
+        if not parsed:
+            stale = (fallback or {}).get(record['id'])
+            print(f"Warning: could not convert exercise {record['id']} ({rel_path}:{record['line']})"
+                  + (f": {error}" if error else "")
+                  + (f"; using the version in {stale['path']}" if stale else ""), file=sys.stderr)
+            if stale:
+                fields = {k: stale[k] for k in CONVERTED_FIELDS if k != 'assets'}
+            else:
+                fields = {'options': f"ID={record['id']}", 'content': '', 'solution': '', 'has_solution': False,
+                          'full_exercise': '', 'full_solution': ''}
+        else:
+            fields = {k: parsed[0][k] for k in CONVERTED_FIELDS if k != 'assets'}
+        if asset_resolver:
+            fields['assets'] = asset_resolver.scan(fields['content'], fields['solution'])
+        return fields
+
+    records = []
+    issues = []
+    for line, attributes, fragment in exercise_blocks(text):
+        id_match = DIV_ID_RE.search(attributes)
+        if not id_match:
+            issues.append({
+                'code': 'missing_id',
+                'file': rel_path,
+                'line': line,
+                'message': f'Exercise div without an #id ({attributes})',
+            })
+            continue
+        hash_match = DIV_HASH_RE.search(attributes)
+        exercise_id = id_match.group(1)
+        records.append(MarkdownExercise({
+            'id': exercise_id,
+            'hash': (hash_match.group(1) or hash_match.group(2)) if hash_match else exercise_id,
+            'file': file_name,
+            'path': rel_path,
+            'line': line,
+            'has_hash': bool(hash_match),
+        }, fragment, load))
+    return records, issues
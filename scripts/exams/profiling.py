@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Phase timing and profiling hooks for the exam/pset generators.
+
+A Profiler records wall-clock time for named phases (config load, extractor
+load, template render, compile, cleanup, ...) and for every subprocess it
+runs (latexmk, pdflatex, biber, ...). When enabled it writes a JSON trace
+per run; ``show_stats.py --profiles DIR`` summarizes traces across runs.
+A disabled Profiler costs nothing: phases are no-ops and ``run`` is
+``subprocess.run``.
+
+Profiling is enabled with ``--profile`` on the generators or by setting
+``EXAM_PROFILE=1``. Traces go to ``EXAM_PROFILE_DIR`` (default: a
+``.profile/`` directory next to the generated document). ``--cprofile FILE``
+additionally dumps Python-level cProfile stats.
+
+Trace format (version 1):
+    {"version": 1, "tool": "generate_exam", "document": "midterm",
+     "started": "2024-03-15T10:00:00", "total_s": 12.3, "cprofile": null,
+     "phases": [{"name": "extractor_load", "parent": null,
+                 "start_s": 0.01, "duration_s": 0.4}, ...],
+     "subprocesses": [{"name": "latexmk", "argv": [...], "phase": "compile",
+                       "start_s": 1.2, "duration_s": 9.8, "returncode": 0}]}
+"""
+from __future__ import annotations
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, Optional
+
+TRACE_VERSION = 1
+
+
+def profiling_requested(flag: bool = False) -> bool:
+    """True if profiling was asked for on the command line or via EXAM_PROFILE."""
+    return flag or os.environ.get("EXAM_PROFILE", "").lower() in ("1", "true", "yes")
+
+
+class Profiler:
+    """Record per-phase and per-subprocess wall-clock timings."""
+
+    def __init__(self, tool: str, enabled: bool = False, cprofile_path: Optional[str] = None):
+        self.tool = tool
+        self.enabled = enabled or bool(cprofile_path)
+        self.cprofile_path = cprofile_path
+        self.document: Optional[str] = None
+        self.phases: list[dict] = []
+        self.subprocesses: list[dict] = []
+        self._stack: list[str] = []
+        self._t0 = time.perf_counter()
+        self._started = datetime.now().isoformat(timespec="seconds")
+        self._cprofile = None
+        if cprofile_path:
+            import cProfile
+
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def _now(self) -> float:
+        return time.perf_counter() - self._t0
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time the enclosed block as a named phase (nested phases record their parent)."""
+        if not self.enabled:
+            yield
+            return
+        record = {
+            "name": name,
+            "parent": self._stack[-1] if self._stack else None,
+            "start_s": round(self._now(), 4),
+        }
+        self._stack.append(name)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            record["duration_s"] = round(self._now() - record["start_s"], 4)
+            self.phases.append(record)
+
+    def run(self, cmd: list, **kwargs) -> "subprocess.CompletedProcess":
+        """subprocess.run() that records the command's duration and exit status."""
+        import subprocess
+
+        if not self.enabled:
+            return subprocess.run(cmd, **kwargs)
+        start = self._now()
+        result = subprocess.run(cmd, **kwargs)
+        self.subprocesses.append({
+            "name": Path(str(cmd[0])).name,
+            "argv": [str(c) for c in cmd],
+            "phase": self._stack[-1] if self._stack else None,
+            "start_s": round(start, 4),
+            "duration_s": round(self._now() - start, 4),
+            "returncode": result.returncode,
+        })
+        return result
+
+    def trace(self) -> dict:
+        return {
+            "version": TRACE_VERSION,
+            "tool": self.tool,
+            "document": self.document,
+            "started": self._started,
+            "total_s": round(self._now(), 4),
+            "cprofile": self.cprofile_path,
+            "phases": sorted(self.phases, key=lambda p: p["start_s"]),
+            "subprocesses": self.subprocesses,
+        }
+
+    def write(self, default_dir: Path) -> Optional[Path]:
+        """Write the JSON trace (and cProfile dump) and return the trace path."""
+        if not self.enabled:
+            return None
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.cprofile_path)
+        out_dir = Path(os.environ.get("EXAM_PROFILE_DIR") or default_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        path = out_dir / f"{self.document or self.tool}-{stamp}-{os.getpid()}.json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.trace(), f, indent=2)
+        print(f"Profile trace written: {path}", file=sys.stderr)
+        return path
+
+
+def load_traces(paths: list) -> list[dict]:
+    """Load trace files; directories contribute every *.json they contain."""
+    traces = []
+    for p in map(Path, paths):
+        files = sorted(p.glob("*.json")) if p.is_dir() else [p]
+        for f in files:
+            try:
+                with open(f, encoding="utf-8") as fh:
+                    data = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            if isinstance(data, dict) and data.get("version") == TRACE_VERSION and "phases" in data:
+                traces.append(data)
+    return traces
+
+
+def summarize_traces(traces: list[dict]) -> dict:
+    """Aggregate phase and subprocess durations across traces."""
+
+    def agg(values: list[float]) -> dict:
+        values = sorted(values)
+        n = len(values)
+        return {
+            "count": n,
+            "total_s": round(sum(values), 3),
+            "mean_s": round(sum(values) / n, 3),
+            "median_s": round(values[n // 2], 3),
+            "max_s": round(values[-1], 3),
+        }
+
+    phases: dict[str, list[float]] = {}
+    commands: dict[str, list[float]] = {}
+    for t in traces:
+        for p in t["phases"]:
+            phases.setdefault(p["name"], []).append(p["duration_s"])
+        for s in t.get("subprocesses", []):
+            commands.setdefault(s["name"], []).append(s["duration_s"])
+    return {
+        "runs": len(traces),
+        "total": agg([t["total_s"] for t in traces]) if traces else {"count": 0},
+        "phases": {k: agg(v) for k, v in phases.items()},
+        "subprocesses": {k: agg(v) for k, v in commands.items()},
+    }
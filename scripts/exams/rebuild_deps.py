@@ -20,27 +20,24 @@ from __future__ import annotations
 
 import argparse
 import json
-import subprocess
 import sys
 from pathlib import Path
-from typing import Iterable
-
-try:
-    import yaml  # type: ignore
-except ImportError:  # pragma: no cover
-    yaml = None
+from typing import Iterable, Optional
 
 
 def load_problem_ids_from_config(config_path: Path) -> list[str]:
     """Extract the list of problem IDs from an exam/pset YAML config."""
-    if yaml is None:
+    try:
+        import yaml  # type: ignore
+    except ImportError:  # pragma: no cover
         print(
             "rebuild_deps: PyYAML not installed; cannot parse config",
             file=sys.stderr,
         )
         return []
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
     with open(config_path) as f:
-        cfg = yaml.safe_load(f) or {}
+        cfg = yaml.load(f, Loader=loader) or {}
     problems = cfg.get("problems", []) or []
     ids: list[str] = []
     for p in problems:
@@ -83,60 +80,29 @@ def resolve_targets(
     return sorted(targets), unknown
 
 
-def main() -> int:
-    ap = argparse.ArgumentParser(description=__doc__)
-    group = ap.add_mutually_exclusive_group(required=True)
-    group.add_argument("--config", type=Path, help="Exam/pset YAML config")
-    group.add_argument(
-        "--problems", help="Comma-separated problem IDs"
-    )
-    ap.add_argument(
-        "--base-path",
-        type=Path,
-        required=True,
-        help="Book root directory (where the Makefile lives)",
-    )
-    ap.add_argument(
-        "--deps-file",
-        default="common/source-dependencies.json",
-        help="Path to source-dependencies.json, relative to --base-path",
-    )
-    ap.add_argument(
-        "--print-only",
-        action="store_true",
-        help="Print the resolved make targets and exit (no make invoked)",
-    )
-    ap.add_argument(
-        "--dry-run",
-        action="store_true",
-        help="Pass -n to make (show what would be rebuilt, don't build)",
-    )
-    ap.add_argument(
-        "--quiet",
-        action="store_true",
-        help="Suppress informational output",
-    )
-    args = ap.parse_args()
-
-    base_path = args.base_path.resolve()
-    deps_path = (base_path / args.deps_file).resolve()
+def rebuild(
+    ids: list[str],
+    base_path: Path,
+    deps_file: str = "common/source-dependencies.json",
+    print_only: bool = False,
+    dry_run: bool = False,
+    quiet: bool = False,
+) -> int:
+    """Run make on the versioned index.tex targets holding ``ids``; return make's status."""
+    base_path = base_path.resolve()
+    deps_path = (base_path / deps_file).resolve()
 
     if not deps_path.exists():
         # Be permissive: repos without a deps file just skip the optimization.
-        if not args.quiet:
+        if not quiet:
             print(
                 f"rebuild_deps: {deps_path} not found; skipping",
                 file=sys.stderr,
             )
         return 0
 
-    if args.config:
-        ids = load_problem_ids_from_config(args.config)
-    else:
-        ids = parse_problem_ids(args.problems or "")
-
     if not ids:
-        if not args.quiet:
+        if not quiet:
             print("rebuild_deps: no problem IDs to resolve", file=sys.stderr)
         return 0
 
@@ -146,7 +112,7 @@ def main() -> int:
 
     targets, unknown = resolve_targets(ids, id_to_version)
 
-    if unknown and not args.quiet:
+    if unknown and not quiet:
         print(
             "rebuild_deps: no entry in source-dependencies.json for: "
             + ", ".join(unknown),
@@ -154,27 +120,79 @@ def main() -> int:
         )
 
     if not targets:
-        if not args.quiet:
+        if not quiet:
             print("rebuild_deps: no make targets resolved", file=sys.stderr)
         return 0
 
-    if args.print_only:
+    if print_only:
         for t in targets:
             print(t)
         return 0
 
     cmd = ["make"]
-    if args.dry_run:
+    if dry_run:
         cmd.append("-n")
     cmd.extend(targets)
 
-    if not args.quiet:
+    if not quiet:
         print(
             f"rebuild_deps: running `{' '.join(cmd)}` in {base_path}",
             file=sys.stderr,
         )
+    import subprocess
+
     return subprocess.call(cmd, cwd=str(base_path))
 
 
+def main(argv: Optional[list[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__)
+    group = ap.add_mutually_exclusive_group(required=True)
+    group.add_argument("--config", type=Path, help="Exam/pset YAML config")
+    group.add_argument(
+        "--problems", help="Comma-separated problem IDs"
+    )
+    ap.add_argument(
+        "--base-path",
+        type=Path,
+        required=True,
+        help="Book root directory (where the Makefile lives)",
+    )
+    ap.add_argument(
+        "--deps-file",
+        default="common/source-dependencies.json",
+        help="Path to source-dependencies.json, relative to --base-path",
+    )
+    ap.add_argument(
+        "--print-only",
+        action="store_true",
+        help="Print the resolved make targets and exit (no make invoked)",
+    )
+    ap.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Pass -n to make (show what would be rebuilt, don't build)",
+    )
+    ap.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Suppress informational output",
+    )
+    args = ap.parse_args(argv)
+
+    if args.config:
+        ids = load_problem_ids_from_config(args.config)
+    else:
+        ids = parse_problem_ids(args.problems or "")
+
+    return rebuild(
+        ids,
+        args.base_path,
+        args.deps_file,
+        print_only=args.print_only,
+        dry_run=args.dry_run,
+        quiet=args.quiet,
+    )
+
+
 if __name__ == "__main__":
     sys.exit(main())
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Generate one personalized exam per student from a roster.
+
+Each student gets their own variant of an exam config: the problems in a
+shuffled order and, optionally, each problem's parts shuffled too. The
+student's name and the variant seed are printed on the cover. A
+student's seed is derived from the base seed and their ID, so rerunning
+with the same roster reproduces every variant.
+
+Everything is done in one process: the exercise database is loaded
+once, the variants are rendered from it, and the PDFs are compiled by a
+pool of ``--jobs`` concurrent pdflatex runs, each in its own build
+directory. The preamble up to ``\\endofdump`` depends only on the
+config, so it is compiled into a format with mylatexformat (once per
+worker, since minted's output directory is part of it), and each variant
+starts from that format instead of loading every package again. A
+document whose dumped preamble differs from the format's, or any
+document when the format cannot be built, is compiled without it.
+
+The roster is a CSV file with a header. The student ID comes from the
+first of the columns ``id``, ``student_id``, ``sid`` or ``email``. The
+name comes from ``name``, or from ``first`` and ``last``. Student IDs
+must be unique, since the ID determines the variant.
+
+A ``manifest.json`` in the output directory maps each student to their
+seed, problem order and files.
+
+Usage:
+    python roster.py --config midterm.yaml --roster students.csv
+    python roster.py --config midterm.yaml --roster students.csv --shuffle-parts -j 8
+    python roster.py --config midterm.yaml --roster students.csv --solutions --no-quick
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import queue
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from bblcache import bbl_key, biber_succeeded, restore_bbl, store_bbl
+from cache import content_key
+from generate_exam import ExamGenerator, ExerciseExtractor, find_tex_tool, load_config, preflight_check
+from profiling import Profiler, profiling_requested
+
+ID_COLUMNS = ("id", "student_id", "sid", "email")
+DUMP_MARKER = "\n\\endofdump\n"
+
+
+def read_roster(path) -> List[Dict[str, str]]:
+    """Students in the roster CSV, as {'id', 'name'} dicts."""
+    students = []
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row_number, row in enumerate(csv.DictReader(f), 1):
+            row = {k.strip().lower(): (v or "").strip() for k, v in row.items() if k}
+            student_id = next((row[c] for c in ID_COLUMNS if row.get(c)), str(row_number))
+            name = row.get("name") or " ".join(filter(None, (row.get("first"), row.get("last"))))
+            students.append({"id": student_id, "name": name or student_id})
+    return students
+
+
+def student_seed(base_seed, student_id: str) -> int:
+    """Six-digit seed for a student, stable for a given base seed."""
+    return int(content_key(base_seed, student_id)[:12], 16) % 1000000
+
+
+def variant_config(config: Dict, student: Dict, seed: int, shuffle_problems: bool = True,
+                   shuffle_parts: bool = False) -> Dict:
+    """The config for one student's variant."""
+    problems = [dict(p) if isinstance(p, dict) else {"id": p} for p in config["problems"]]
+    rng = random.Random(seed)
+    if shuffle_problems:
+        rng.shuffle(problems)
+    for i, problem in enumerate(problems):
+        if shuffle_parts or problem.pop("shuffle_parts", False):
+            problem["part_seed"] = seed * 1000 + i
+    return dict(config, problems=problems, student=student["name"], variant_seed=f"{seed:06d}")
+
+
+def _safe_name(text: str) -> str:
+    return re.sub(r"[^\w-]+", "_", text).strip("_") or "student"
+
+
+def _write_if_changed(path: Path, text: str) -> None:
+    try:
+        if path.read_text(encoding="utf-8") == text:
+            return
+    except OSError:
+        pass
+    path.write_text(text, encoding="utf-8")
+
+
+class VariantCompiler:
+    """Compile variants concurrently, each in its own build directory.
+
+    Each of the ``jobs`` workers reuses one build directory (a slot) under a
+    temporary root. minted is loaded in the dumped preamble, so its
+    ``outputdir`` must be set when the format is built; every slot gets a
+    format built for its own directory.
+
+    Args:
+        book_dir: Book root (compile working directory)
+        profiler: Times every TeX/biber run
+        figure_cache: Use pre-rendered figures (see figcache.py)
+        jobs: Number of concurrent compiles (build slots)
+    """
+
+    def __init__(self, book_dir, profiler: Profiler, figure_cache: bool = True, jobs: int = 1):
+        self.book_dir = Path(book_dir).resolve()
+        self.profiler = profiler
+        self.figure_cache = figure_cache
+        self.pdflatex = find_tex_tool("pdflatex")
+        self.latexmk = find_tex_tool("latexmk")
+        self.biber = find_tex_tool("biber")
+        self._tmp = tempfile.TemporaryDirectory(prefix="roster-")
+        self.root = Path(self._tmp.name)
+        self.slots = [self.root / f"slot{i}" for i in range(max(1, jobs))]
+        self._free: "queue.Queue[Path]" = queue.Queue()
+        for slot in self.slots:
+            self._free.put(slot)
+        self.formats: Dict[Path, str] = {}
+        self.dumped: Optional[str] = None
+        self.env = dict(os.environ)
+        self.env["TEXFORMATS"] = f"{self.root}{os.pathsep}{self.env.get('TEXFORMATS', '')}"
+
+    @property
+    def available(self) -> bool:
+        return bool(self.pdflatex or self.latexmk)
+
+    @staticmethod
+    def _dumped_part(document: str) -> Optional[str]:
+        return document[:document.index(DUMP_MARKER)] if DUMP_MARKER in document else None
+
+    @staticmethod
+    def _tex_input(build: Path, tex: Path) -> str:
+        # minted writes its cache next to the other outputs, as in compile_pdf
+        return f"\\PassOptionsToPackage{{outputdir={build}}}{{minted}}\\input{{{tex}}}"
+
+    def _build_slot_format(self, document: str, slot: Path) -> bool:
+        name = f"roster-{slot.name}"
+        slot.mkdir(parents=True, exist_ok=True)
+        tex = slot / "preamble.tex"
+        tex.write_text(f"\\PassOptionsToPackage{{outputdir={slot}}}{{minted}}\n{document}", encoding="utf-8")
+        cmd = [self.pdflatex, "-ini", "-interaction=nonstopmode", "-halt-on-error", "-shell-escape",
+               f"-jobname={name}", f"-output-directory={self.root}", "&pdflatex", "mylatexformat.ltx", str(tex)]
+        result = self.profiler.run(cmd, capture_output=True, text=True, cwd=self.book_dir,
+                                   stdin=subprocess.DEVNULL)
+        if result.returncode != 0 or not (self.root / f"{name}.fmt").exists():
+            return False
+        self.formats[slot] = name
+        return True
+
+    def build_format(self, document: str) -> bool:
+        """Dump the shared part of the preamble of document into a format per build slot."""
+        dumped = self._dumped_part(document)
+        if not self.pdflatex or dumped is None:
+            return False
+        with ThreadPoolExecutor(max_workers=len(self.slots)) as pool:
+            built = list(pool.map(lambda slot: self._build_slot_format(document, slot), self.slots))
+        if not all(built):
+            self.formats.clear()
+            return False
+        self.dumped = dumped
+        return True
+
+    def _latex(self, build: Path, tex: Path, fmt: Optional[str]):
+        cmd = [self.pdflatex, "-interaction=batchmode", "-shell-escape", f"-jobname={tex.stem}",
+               f"-output-directory={build}"]
+        if fmt:
+            cmd.append(f"-fmt={fmt}")
+        return self.profiler.run(cmd + [self._tex_input(build, tex)], capture_output=True, text=True,
+                                 cwd=self.book_dir, env=self.env, stdin=subprocess.DEVNULL)
+
+    def compile(self, tex_file: Path, jobs: int = 1) -> bool:
+        """Compile tex_file; the PDF is written next to it."""
+        document = tex_file.read_text(encoding="utf-8")
+        # A failed compile must not leave the previous run's PDF looking current
+        tex_file.with_suffix(".pdf").unlink(missing_ok=True)
+        tex_file.with_suffix(".log").unlink(missing_ok=True)
+        same_preamble = self.dumped is not None and self._dumped_part(document) == self.dumped
+        if self.figure_cache:
+            from figcache import apply_figure_cache
+            document, _ = apply_figure_cache(document, self.book_dir, jobs, self.profiler)
+        build = self._free.get()
+        try:
+            # Clear the slot's previous variant (the format lives in the root, not the slot)
+            shutil.rmtree(build, ignore_errors=True)
+            build.mkdir(parents=True)
+            fmt = self.formats.get(build) if same_preamble else None
+            tex = build / tex_file.name
+            tex.write_text(document, encoding="utf-8")
+            pdf = tex.with_suffix(".pdf")
+            if not self.pdflatex:
+                self.profiler.run([self.latexmk, "-pdf", "-f", "-interaction=batchmode", "-shell-escape",
+                                   f"-jobname={tex.stem}", f"-outdir={build}",
+                                   f"-pdflatex=pdflatex %O '{self._tex_input(build, tex)}'", str(tex)],
+                                  capture_output=True, text=True, cwd=self.book_dir, stdin=subprocess.DEVNULL)
+            else:
+                key = bbl_key(document, self.book_dir)
+                bbl = tex.with_suffix(".bbl")
+                bbl_cached = bool(key) and restore_bbl(key, self.book_dir, bbl)
+                self._latex(build, tex, fmt)
+                run_biber = tex.with_suffix(".bcf").exists() and self.biber and not bbl_cached
+                if run_biber:
+                    biber = self.profiler.run([self.biber, f"--input-directory={build}",
+                                               f"--output-directory={build}", tex.stem],
+                                              capture_output=True, text=True, cwd=self.book_dir)
+                self._latex(build, tex, fmt)
+                if run_biber:
+                    self._latex(build, tex, fmt)
+                    if key and pdf.exists() and biber_succeeded(biber, tex.with_suffix(".blg")):
+                        store_bbl(key, self.book_dir, bbl)
+            if not pdf.exists():
+                log = tex.with_suffix(".log")
+                if log.exists():
+                    shutil.copyfile(log, tex_file.with_suffix(".log"))
+                return False
+            shutil.copyfile(pdf, tex_file.with_suffix(".pdf"))
+            return True
+        finally:
+            self._free.put(build)
+
+    def cleanup(self):
+        self._tmp.cleanup()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generate one exam variant per student from a roster CSV")
+    parser.add_argument("--config", required=True, help="Exam YAML configuration file")
+    parser.add_argument("--roster", required=True, help="CSV file with one row per student")
+    parser.add_argument("--out-dir", help="Output directory (default: <config name>_variants next to the config)")
+    parser.add_argument("--seed", help="Base seed (default: config 'seed', else the config file name)")
+    parser.add_argument("--keep-order", action="store_true", help="Do not shuffle the problem order")
+    parser.add_argument("--shuffle-parts", action="store_true",
+                        help="Shuffle the parts of every problem (per problem: 'shuffle_parts: true' in the config)")
+    parser.add_argument("--solutions", action="store_true", help="Also write each student's solution key")
+    parser.add_argument("--base-path", default=os.environ.get("BASE_PATH", "../.."), help="Base path to exercise files")
+    parser.add_argument("--exercise-pattern", default=os.environ.get("EXERCISE_PATTERN", "ch*_exercises.tex"),
+                        help="Glob pattern(s) for exercise files (comma-separated for multiple patterns)")
+    parser.add_argument("--styles-path", default="common/styles-tex", help="Path to book style files (relative to book root)")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1, help="Concurrent compiles (default: CPU count)")
+    parser.add_argument("--no-quick", action="store_true", help="Skip PDF compilation")
+    parser.add_argument("--no-check", action="store_true", help="Skip the static LaTeX checks run before compiling")
+    parser.add_argument("--no-format", action="store_true", help="Do not build a preamble format")
+    parser.add_argument("--no-figure-cache", action="store_true",
+                        help="Compile standalone/TikZ figures in place instead of using pre-rendered PDFs")
+    parser.add_argument("--profile", action="store_true",
+                        help="Record per-phase and per-subprocess timings as a JSON trace (also EXAM_PROFILE=1)")
+    args = parser.parse_args(argv)
+
+    profiler = Profiler("roster", profiling_requested(args.profile))
+    with profiler.phase("extractor_load"):
+        extractor = ExerciseExtractor(Path(args.base_path).resolve(), args.exercise_pattern)
+    generator = ExamGenerator(extractor, args.styles_path)
+
+    config_path = Path(args.config).resolve()
+    config = load_config(str(config_path))
+    config["config_path"] = str(config_path)
+    config["base_path_resolved"] = str(extractor.base_path)
+    base_seed = args.seed or config.get("seed") or config_path.stem
+    out_dir = Path(args.out_dir or config_path.parent / f"{config_path.stem}_variants").resolve()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    students = read_roster(args.roster)
+    if not students:
+        print(f"✗ Error: no students in {args.roster}")
+        return 1
+    ids = Counter(student["id"] for student in students)
+    duplicates = sorted(i for i, n in ids.items() if n > 1)
+    if duplicates:
+        print(f"✗ Error: duplicate student ID(s) in {args.roster}: {', '.join(duplicates)} "
+              "(each ID gets its own variant)")
+        return 1
+
+    if not args.no_check:
+        with profiler.phase("check"):
+            errors = preflight_check(generator.generate_exam(dict(config, include_solutions=args.solutions)),
+                                     extractor, config["problems"],
+                                     ("exercise", "solution") if args.solutions else ("exercise",))
+        if errors and not args.no_quick:
+            print(f"✗ {errors} error(s) found before compiling; fix them or pass --no-check")
+            return 1
+
+    entries = []
+    documents = []
+    used_names = set()
+    with profiler.phase("render"):
+        for student in students:
+            seed = student_seed(base_seed, student["id"])
+            variant = variant_config(config, student, seed, not args.keep_order, args.shuffle_parts)
+            stem = f"{config_path.stem}_{_safe_name(student['id'])}"
+            while stem in used_names:
+                stem += "_"
+            used_names.add(stem)
+            tex_file = out_dir / f"{stem}.tex"
+            _write_if_changed(tex_file, generator.generate_exam(dict(variant, include_solutions=False)))
+            documents.append(tex_file)
+            entry = {"id": student["id"], "name": student["name"], "seed": variant["variant_seed"],
+                     "problems": [p["id"] for p in variant["problems"]],
+                     "tex": tex_file.name, "pdf": tex_file.with_suffix(".pdf").name}
+            if args.solutions:
+                key_file = out_dir / f"{stem}_solutions.tex"
+                _write_if_changed(key_file, generator.generate_exam(dict(variant, include_solutions=True)))
+                documents.append(key_file)
+                entry["solutions_tex"] = key_file.name
+                entry["solutions_pdf"] = key_file.with_suffix(".pdf").name
+            entries.append(entry)
+    print(f"Generated {len(documents)} document(s) for {len(students)} student(s) in {out_dir}")
+
+    status = 0
+    if not args.no_quick:
+        compiler = VariantCompiler(extractor.base_path, profiler, not args.no_figure_cache, args.jobs)
+        if not compiler.available:
+            print("No LaTeX toolchain found (latexmk or pdflatex). Skipping PDF compilation.")
+            compiler.cleanup()
+            return 1
+        if not args.no_format:
+            with profiler.phase("format"):
+                if compiler.build_format(documents[0].read_text(encoding="utf-8")):
+                    print(f"Using a preamble format ({len(compiler.formats)} build slot(s))")
+                else:
+                    print("⚠ Warning: could not build a preamble format (is mylatexformat installed?); "
+                          "compiling without one")
+        if compiler.figure_cache:
+            # Render the shared figures once, with all workers, before the variants need them
+            from figcache import apply_figure_cache
+            with profiler.phase("figures"):
+                apply_figure_cache(documents[0].read_text(encoding="utf-8"), extractor.base_path, args.jobs, profiler)
+        print(f"Compiling {len(documents)} document(s), {args.jobs} at a time...")
+        with profiler.phase("compile"):
+            try:
+                with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+                    results = dict(zip(documents, pool.map(compiler.compile, documents)))
+            finally:
+                compiler.cleanup()
+        failed = [d for d, ok in results.items() if not ok]
+        for entry in entries:
+            files = [entry["tex"]] + ([entry["solutions_tex"]] if "solutions_tex" in entry else [])
+            entry["compiled"] = all(results[out_dir / name] for name in files)
+        for document in failed:
+            print(f"✗ Error: {document.name} failed to compile (see {document.with_suffix('.log').name})")
+        print(f"{len(documents) - len(failed)} of {len(documents)} document(s) compiled")
+        status = 1 if failed else 0
+
+    manifest = {"config": str(config_path), "roster": str(Path(args.roster).resolve()),
+                "base_seed": str(base_seed), "students": entries}
+    with open(out_dir / "manifest.json", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Manifest written: {out_dir / 'manifest.json'}")
+    profiler.write(out_dir / ".profile")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
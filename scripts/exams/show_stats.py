@@ -6,78 +6,204 @@ Exercise Database Statistics Script
 Shows statistics about the exercise database.
 Part of the meta-book exam generation system.
 
+All numbers come from a single ExerciseExtractor load: per-file and
+per-chapter counts, solution coverage, body-size distribution and ID/hash
+collision counts. Nothing is rescanned.
+
+With --profiles, summarizes the JSON timing traces written by the
+generators' --profile mode instead of reading the exercise files.
+
 Usage:
     python3 show_stats.py [--base-path PATH] [--exercise-pattern PATTERN]
+    python3 show_stats.py --format json
+    python3 show_stats.py --profiles ../../exams/.profile
 
 Author: meta-book project
 Date: 2024
 """
 
-import sys
+import os
 import re
+import sys
+import json
 import argparse
-from pathlib import Path
+from typing import Dict, List
 
-def count_exercises_in_file(file_path):
-    """Count exercises in a single file."""
-    if not file_path.exists():
-        return 0
-    
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        return len(re.findall(r'\\begin\{exercise\}', content))
-    except Exception:
-        return 0
+CHAPTER_RE = re.compile(r'\b(ch(?:apter)?[-_]?\d+)', re.IGNORECASE)
 
-def main():
-    """Show exercise database statistics."""
-    parser = argparse.ArgumentParser(description='Show exercise database statistics')
-    parser.add_argument('--base-path', default='../..', help='Base path to exercise files')
-    parser.add_argument('--exercise-pattern', default='ch*_exercises.tex', help='Glob pattern for exercise files')
-    
-    args = parser.parse_args()
-    
+
+def chapter_of(path: str) -> str:
+    """Best-effort chapter name for an exercise file path."""
+    m = CHAPTER_RE.search(path)
+    return m.group(1) if m else 'other'
+
+
+def distribution(values: List[int]) -> Dict:
+    """Summarize a list of sizes (min, quartiles, p90, max, mean)."""
+    if not values:
+        return {'count': 0}
+    values = sorted(values)
+    n = len(values)
+
+    def pct(p):
+        return values[min(n - 1, int(p * (n - 1) + 0.5))]
+
+    return {
+        'count': n,
+        'min': values[0],
+        'p25': pct(0.25),
+        'median': pct(0.5),
+        'p75': pct(0.75),
+        'p90': pct(0.9),
+        'max': values[-1],
+        'mean': round(sum(values) / n, 1),
+    }
+
+
+def collect_stats(extractor) -> Dict:
+    """Compute database statistics from an already-loaded extractor."""
+    files: Dict[str, Dict] = {}
+    for path, count in extractor.file_counts.items():
+        files[path] = {'chapter': chapter_of(path), 'exercises': count, 'with_solution': 0}
+
+    body_sizes = []
+    solution_sizes = []
+    for records in extractor.occurrences.values():
+        for r in records:
+            body_sizes.append(len(r['content']))
+            if r['solution']:
+                solution_sizes.append(len(r['solution']))
+                files[r['path']]['with_solution'] += 1
+
+    chapters: Dict[str, Dict] = {}
+    for info in files.values():
+        ch = chapters.setdefault(info['chapter'], {'files': 0, 'exercises': 0, 'with_solution': 0})
+        ch['files'] += 1
+        ch['exercises'] += info['exercises']
+        ch['with_solution'] += info['with_solution']
+
+    occurrences = sum(len(r) for r in extractor.occurrences.values())
+    with_solution = len(solution_sizes)
+    return {
+        'base_path': str(extractor.base_path),
+        'patterns': extractor.exercise_patterns,
+        'totals': {
+            'files': len(files),
+            'exercises': len(extractor.exercises_db),
+            'definitions': occurrences,
+            'with_solution': with_solution,
+            'solution_coverage': round(with_solution / occurrences, 3) if occurrences else 0.0,
+            'duplicate_ids': sum(1 for r in extractor.occurrences.values() if len(r) > 1),
+            'hash_collisions': sum(1 for r in extractor.hash_occurrences.values()
+                                   if len({x['id'] for x in r}) > 1),
+            'blocks_without_id': sum(1 for i in extractor.parse_issues if i['code'] == 'missing_id'),
+        },
+        'body_chars': distribution(body_sizes),
+        'solution_chars': distribution(solution_sizes),
+        'chapters': chapters,
+        'files': files,
+    }
+
+
+def _coverage(with_solution: int, total: int) -> str:
+    return f"{100 * with_solution / total:.0f}%" if total else "-"
+
+
+def print_table(stats: Dict):
+    """Print statistics as plain-text tables."""
     print("Exercise Database Statistics:")
     print("=============================")
-    
-    # Check each file matching pattern
-    base_path = Path(args.base_path)
-    exercise_files = sorted(base_path.glob(args.exercise_pattern))
-    
-    total_exercises = 0
-    files_found = 0
-    
-    for file_path in exercise_files:
-        count = count_exercises_in_file(file_path)
-        total_exercises += count
-        
-        if file_path.exists():
-            files_found += 1
-            status = "✓"
+
+    width = max([len(p) for p in stats['files']] + [4])
+    print(f"{'File':<{width}}  {'Exercises':>9}  {'Solutions':>9}  {'Coverage':>8}")
+    for path, info in sorted(stats['files'].items()):
+        print(f"{path:<{width}}  {info['exercises']:>9}  {info['with_solution']:>9}  "
+              f"{_coverage(info['with_solution'], info['exercises']):>8}")
+
+    if len(stats['chapters']) > 1:
+        print()
+        print(f"{'Chapter':<12}  {'Files':>5}  {'Exercises':>9}  {'Coverage':>8}")
+        for name, info in sorted(stats['chapters'].items()):
+            print(f"{name:<12}  {info['files']:>5}  {info['exercises']:>9}  "
+                  f"{_coverage(info['with_solution'], info['exercises']):>8}")
+
+    totals = stats['totals']
+    print()
+    print(f"Total exercises: {totals['exercises']}")
+    print(f"Definitions found: {totals['definitions']}")
+    print(f"Files found: {totals['files']}")
+    print(f"Solution coverage: {_coverage(totals['with_solution'], totals['definitions'])}")
+    for label, key in (('Body size (chars)', 'body_chars'), ('Solution size (chars)', 'solution_chars')):
+        d = stats[key]
+        if d['count']:
+            print(f"{label}: min {d['min']}, median {d['median']}, p90 {d['p90']}, max {d['max']}")
+
+    if totals['duplicate_ids']:
+        print(f"⚠ Warning: {totals['duplicate_ids']} exercise ID(s) defined more than once")
+    if totals['hash_collisions']:
+        print(f"⚠ Warning: {totals['hash_collisions']} hash(es) shared by different exercise IDs")
+    if totals['blocks_without_id']:
+        print(f"⚠ Warning: {totals['blocks_without_id']} exercise block(s) without an ID")
+
+
+def print_profile_summary(summary: Dict):
+    """Print aggregated timing traces, slowest phases first."""
+    print(f"Profile Summary ({summary['runs']} runs):")
+    print("=============================")
+    if not summary['runs']:
+        return
+    total = summary['total']
+    print(f"Total wall time: mean {total['mean_s']}s, median {total['median_s']}s, max {total['max_s']}s")
+    for title, key in (('Phase', 'phases'), ('Subprocess', 'subprocesses')):
+        rows = sorted(summary[key].items(), key=lambda kv: -kv[1]['total_s'])
+        if not rows:
+            continue
+        width = max(len(name) for name, _ in rows + [(title, None)])
+        print()
+        print(f"{title:<{width}}  {'Count':>5}  {'Mean s':>8}  {'Median s':>8}  {'Max s':>8}  {'Total s':>8}")
+        for name, a in rows:
+            print(f"{name:<{width}}  {a['count']:>5}  {a['mean_s']:>8}  {a['median_s']:>8}  "
+                  f"{a['max_s']:>8}  {a['total_s']:>8}")
+
+
+def main(argv: List[str] = None):
+    """Show exercise database statistics."""
+    parser = argparse.ArgumentParser(description='Show exercise database statistics')
+    parser.add_argument('--base-path', default=os.environ.get('BASE_PATH', '../..'), help='Base path to exercise files')
+    parser.add_argument('--exercise-pattern', default=os.environ.get('EXERCISE_PATTERN', 'ch*_exercises.tex'),
+                        help='Glob pattern(s) for exercise files (comma-separated for multiple patterns)')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='Number of processes used to parse exercise files')
+    parser.add_argument('--format', choices=['table', 'json'], default='table', help='Output format')
+    parser.add_argument('--profiles', nargs='+', metavar='PATH',
+                        help='Summarize --profile timing traces (files or directories) instead')
+
+    args = parser.parse_args(argv)
+
+    if args.profiles:
+        from profiling import load_traces, summarize_traces
+        summary = summarize_traces(load_traces(args.profiles))
+        if args.format == 'json':
+            json.dump(summary, sys.stdout, indent=2)
+            print()
         else:
-            status = "✗"
-        
-        print(f"{file_path.name}: {count} exercises {status}")
-    
-    print(f"Total exercises: {total_exercises}")
-    print(f"Files found: {files_found}")
-    
-    # Try to load with the extractor for comparison
+            print_profile_summary(summary)
+        return 0
+
     try:
         from generate_exam import ExerciseExtractor
-        extractor = ExerciseExtractor(args.base_path, args.exercise_pattern)
-        exercises = extractor.list_exercises()
-        
-        print(f"Exercises loaded by extractor: {len(exercises)}")
-        
-        if len(exercises) != total_exercises:
-            print(f"⚠ Warning: Mismatch between file count ({total_exercises}) and extractor count ({len(exercises)})")
-    
     except ImportError:
-        print("Note: Could not import exercise extractor for verification")
-    except Exception as e:
-        print(f"Note: Error loading exercise extractor: {e}")
+        print("Note: Could not import exercise extractor")
+        return 1
+
+    extractor = ExerciseExtractor(args.base_path, args.exercise_pattern, jobs=args.jobs)
+    stats = collect_stats(extractor)
+
+    if args.format == 'json':
+        json.dump(stats, sys.stdout, indent=2)
+        print()
+    else:
+        print_table(stats)
+    return 0
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
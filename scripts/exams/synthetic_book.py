@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Generate a synthetic xsim exercise book for benchmarking.
+
+Writes N chapter exercise files (``chNN_exercises.tex``) holding M exercises
+in total, each with a solution of realistic size (prose, display math,
+enumerated parts and pandoc-style ``\\# Part x \\{-\\}`` headers), plus a
+``.xsim`` file carrying the ID and counter lines that
+generate_pset_solutions.parse_xsim_numbering reads. Output is deterministic
+for a given seed.
+
+Usage:
+    synthetic_book.py OUTDIR --chapters 12 --exercises 1000 [--seed 1]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+from pathlib import Path
+
+WORDS = (
+    "voltage current resistor capacitor inductor circuit node mesh source "
+    "signal system response transfer function frequency damping mass spring "
+    "state input output gain phase time constant steady transient energy"
+).split()
+
+
+def _sentence(rng: random.Random, n: int) -> str:
+    words = [rng.choice(WORDS) for _ in range(n)]
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraph(rng: random.Random, sentences: int) -> str:
+    return " ".join(_sentence(rng, rng.randint(8, 18)) for _ in range(sentences))
+
+
+def _exercise_id(i: int) -> str:
+    # Letters only, like the book's IDs (e.g. "madrid", "playmate")
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    s = ""
+    i += 26 * 26  # at least three letters
+    while i:
+        i, r = divmod(i, 26)
+        s = letters[r] + s
+    return "ex" + s
+
+
+def _exercise(rng: random.Random, ex_id: str, ex_hash: str) -> str:
+    parts = rng.randint(2, 4)
+    items = "\n".join(f"  \\item {_sentence(rng, rng.randint(6, 14))}" for _ in range(parts))
+    body = (
+        f"{_paragraph(rng, rng.randint(2, 4))}\n"
+        f"\\begin{{equation}}\n  v(t) = V_0 e^{{-t/\\tau}} + \\int_0^t i(s)\\, ds\n\\end{{equation}}\n"
+        f"See \\cref{{fig:{ex_hash}}} and \\cite{{ref{rng.randint(1, 40)}}}.\n"
+        f"\\begin{{enumerate}}\n{items}\n\\end{{enumerate}}"
+    )
+    solution_parts = []
+    for p in range(parts):
+        solution_parts.append(
+            f"\\# Part {chr(ord('a') + p)} \\{{-\\}}\n\n"
+            f"{_paragraph(rng, rng.randint(3, 8))}\n"
+            f"\\begin{{align}}\n  x_{p} &= {rng.randint(1, 99)} \\\\\n  y_{p} &= \\frac{{x_{p}}}{{{rng.randint(2, 9)}}}\n\\end{{align}}"
+        )
+    solution = "\n\n".join(solution_parts)
+    return (
+        f"\\begin{{exercise}}[ID={ex_id},hash={ex_hash}]\n{body}\n\\end{{exercise}}\n"
+        f"\\begin{{solution}}\n{solution}\n\\end{{solution}}\n"
+    )
+
+
+def generate_book(out_dir: Path, chapters: int, exercises: int, seed: int = 1) -> list[str]:
+    """Write the synthetic book into out_dir and return the exercise IDs."""
+    rng = random.Random(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    per_chapter = [exercises // chapters + (1 if c < exercises % chapters else 0) for c in range(chapters)]
+
+    ids: list[str] = []
+    xsim_ids = []
+    xsim_counters = []
+    n = 0
+    for c, count in enumerate(per_chapter, 1):
+        blocks = []
+        for k in range(1, count + 1):
+            ex_id = _exercise_id(n)
+            ex_hash = f"h{n:x}"
+            n += 1
+            ids.append(ex_id)
+            blocks.append(_exercise(rng, ex_id, ex_hash))
+            xsim_ids.append(f"exercise-{n}=={{{ex_id}}}")
+            xsim_counters.append(f"exercise-{n}=={{{c}.{k}}}")
+        (out_dir / f"ch{c:02d}_exercises.tex").write_text("\n".join(blocks), encoding="utf-8")
+
+    (out_dir / "book.xsim").write_text(
+        "\\XSIM{ID}{" + "||".join(xsim_ids) + "}\n"
+        "\\XSIM{counter}{" + "||".join(xsim_counters) + "}\n",
+        encoding="utf-8",
+    )
+    return ids
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("out_dir", type=Path, help="Directory to write the book into")
+    ap.add_argument("--chapters", type=int, default=12, help="Number of chapter exercise files")
+    ap.add_argument("--exercises", type=int, default=1000, help="Total number of exercises")
+    ap.add_argument("--seed", type=int, default=1, help="Random seed")
+    args = ap.parse_args()
+
+    ids = generate_book(args.out_dir, args.chapters, args.exercises, args.seed)
+    print(f"Wrote {len(ids)} exercises in {args.chapters} chapters to {args.out_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,161 @@
+"""
+Tests for reading exercises from versioned source.md files (mdexercises.py).
+
+The markdown is the syntax scripts/latex-to-md-filter.lua writes. pandoc is
+replaced by a small script that converts one exercise div the way the
+book's filters would, and fails on a fragment containing BAD.
+
+Run with: python -m pytest scripts/exams/test_mdexercises.py
+"""
+import os
+import sys
+import textwrap
+import time
+from pathlib import Path
+
+from generate_exam import ExerciseExtractor
+from mdexercises import exercise_blocks
+from show_stats import collect_stats
+from validate_exercises import validate_extractor
+
+FAKE_PANDOC = '''\
+import re, sys
+if sys.argv[1:] == ['--version']:
+    print('pandoc 3.1')
+    sys.exit(0)
+out = sys.argv[sys.argv.index('-o') + 1]
+md = sys.stdin.read()
+if 'BAD' in md:
+    print('conversion failed', file=sys.stderr)
+    sys.exit(3)
+m = re.match(r':::+ \\{#(\\S+) \\.exercise h="([^"]+)"\\}\\n(.*?):::+ solution\\n(.*?):::+\\n:::+', md, re.S)
+with open(out, 'w') as f:
+    f.write(f"\\\\begin{{exercise}}[ID={m[1]},hash={m[2]}]\\n{m[3].strip()}\\n\\\\end{{exercise}}\\n"
+            f"\\\\begin{{solution}}\\n{m[4].strip()}\\n\\\\end{{solution}}\\n")
+'''
+
+SOURCE_MD = textwrap.dedent('''\
+    # Section
+
+    \\begin{exercise}[ID=madrid,hash=madrid]
+    Raw LaTeX exercise.
+    \\end{exercise}
+
+    ::: {#paris .exercise h="paris"}
+    New text of paris.
+
+    ::: solution
+    New solution of paris.
+    :::
+    :::
+
+    ::: {#rome .exercise h="rome"}
+    BAD markup.
+
+    ::: solution
+    Rome solution.
+    :::
+    :::
+    ''')
+
+INDEX_TEX = textwrap.dedent('''\
+    \\begin{exercise}[ID=madrid,hash=madrid]
+    Raw LaTeX exercise.
+    \\end{exercise}
+    \\begin{solution}
+    Madrid solution.
+    \\end{solution}
+    \\begin{exercise}[ID=paris,hash=paris]
+    Old text of paris.
+    \\end{exercise}
+    \\begin{solution}
+    Old solution of paris.
+    \\end{solution}
+    \\begin{exercise}[ID=rome,hash=rome]
+    Old text of rome.
+    \\end{exercise}
+    ''')
+
+
+def _book(tmp_path, monkeypatch, index=True):
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    pandoc = bin_dir / 'pandoc'
+    pandoc.write_text(f'#!{sys.executable}\n{FAKE_PANDOC}')
+    pandoc.chmod(0o755)
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}")
+    monkeypatch.setenv('EXAM_CACHE_DIR', str(tmp_path / 'cache'))
+
+    section = tmp_path / 'book' / 'common' / 'versioned' / 'v1'
+    section.mkdir(parents=True)
+    if index:
+        (section / 'index.tex').write_text(INDEX_TEX)
+        stale = time.time() - 60
+        os.utime(section / 'index.tex', (stale, stale))
+    (section / 'source.md').write_text(SOURCE_MD)
+    return ExerciseExtractor(tmp_path / 'book', 'common/versioned/*/index.tex', resolve_assets=False,
+                             pandoc_args='--to=latex')
+
+
+def test_exercise_blocks_reads_filter_syntax():
+    blocks = exercise_blocks(SOURCE_MD)
+    assert [(line, attributes) for line, attributes, _ in blocks] == [
+        (7, '{#paris .exercise h="paris"}'), (15, '{#rome .exercise h="rome"}')]
+    assert blocks[0][2].startswith('::: {#paris') and blocks[0][2].endswith(':::\n:::\n')
+    assert 'New solution of paris.' in blocks[0][2]
+
+
+def test_markdown_overrides_only_the_exercises_it_defines(tmp_path, monkeypatch, capsys):
+    extractor = _book(tmp_path, monkeypatch)
+    assert set(extractor.list_exercises()) == {'madrid', 'paris', 'rome'}
+
+    madrid = extractor.get_exercise('madrid')
+    assert madrid['path'].endswith('index.tex')
+    assert 'Raw LaTeX exercise.' in madrid['content']
+
+    paris = extractor.get_exercise('paris')
+    assert paris['path'].endswith('source.md')
+    assert 'New text of paris.' in paris['content']
+    assert 'New solution of paris.' in paris['solution']
+
+    rome = extractor.get_exercise('rome')
+    assert 'Old text of rome.' in rome['content']
+    assert 'using the version in common/versioned/v1/index.tex' in capsys.readouterr().err
+
+
+def test_counts_follow_each_record_path(tmp_path, monkeypatch):
+    # madrid and its solution come from index.tex, paris and rome from source.md
+    extractor = _book(tmp_path, monkeypatch)
+    assert extractor.file_counts == {'common/versioned/v1/index.tex': 1, 'common/versioned/v1/source.md': 2}
+
+    stats = collect_stats(extractor)
+    assert stats['files']['common/versioned/v1/index.tex']['with_solution'] == 1
+    assert stats['files']['common/versioned/v1/source.md']['with_solution'] == 1  # rome's stand-in has none
+    assert stats['totals']['files'] == 2
+
+    report = validate_extractor(extractor)
+    assert report['files'] == extractor.file_counts
+    assert not [i for i in report['issues'] if i['code'] == 'empty_file']
+
+
+def test_markdown_alone_without_index(tmp_path, monkeypatch):
+    extractor = _book(tmp_path, monkeypatch, index=False)
+    assert set(extractor.list_exercises()) == {'paris', 'rome'}
+    assert 'New text of paris.' in extractor.get_exercise('paris')['content']
+    assert extractor.get_exercise('rome')['content'] == ''
+
+
+def test_index_current_in_pandoc_batch_cache_is_used(tmp_path, monkeypatch):
+    # After a checkout the batch leaves an unchanged index.tex older than its source.md
+    _book(tmp_path, monkeypatch)
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    from pandoc_batch import CACHE_DIR, PandocBatch
+    book = tmp_path / 'book'
+    key = PandocBatch(['--to=latex'], 'pandoc', book).key(Path('common/versioned/v1/source.md'))
+    cached = book / CACHE_DIR / key[:2] / f'{key}.tex'
+    cached.parent.mkdir(parents=True)
+    cached.write_text(INDEX_TEX)
+
+    extractor = ExerciseExtractor(book, 'common/versioned/*/index.tex', resolve_assets=False,
+                                  pandoc_args='--to=latex')
+    assert 'Old text of paris.' in extractor.get_exercise('paris')['content']
@@ -6,88 +6,214 @@ Exercise Database Validation Script
 Validates the exercise database for completeness and consistency.
 Part of the meta-book exam generation system.
 
+Validation runs on the records collected by ExerciseExtractor while it
+parses the exercise files, so every occurrence of an ID or hash is seen,
+including definitions that the extractor's dict would otherwise shadow.
+All checks are a single linear sweep over those occurrences; file parsing
+can be spread over several processes with --jobs. Each exercise is also
+run through the static LaTeX checks in latexcheck.py (braces,
+environments, undefined macros, missing assets, unknown cite keys)
+against the exam preamble; those results are cached by content, so only
+changed exercises are re-checked.
+
 Usage:
     python3 validate_exercises.py [--base-path PATH] [--exercise-pattern PATTERN]
+    python3 validate_exercises.py --json [--report report.json]
 
 Author: meta-book project
 Date: 2024
 """
 
+import os
 import sys
+import json
 import argparse
-from pathlib import Path
+import contextlib
+from typing import Dict, List
+
+REPORT_VERSION = 1
+
+# Severity of each issue code reported by validate_extractor()
+SEVERITY = {
+    'missing_id': 'error',
+    'duplicate_id': 'error',
+    'hash_collision': 'error',
+    'empty_body': 'warning',
+    'missing_solution': 'warning',
+    'empty_solution': 'warning',
+    'empty_file': 'warning',
+}
+
+
+def _issue(code: str, message: str, ex_id: str = None, file: str = None, line: int = None) -> Dict:
+    return {
+        'severity': SEVERITY[code],
+        'code': code,
+        'id': ex_id,
+        'file': file,
+        'line': line,
+        'message': message,
+    }
+
+
+def _where(record: Dict) -> str:
+    return f"{record['path']}:{record['line']}"
+
+
+def latex_issues(extractor, styles_path: str = 'common/styles-tex') -> List[Dict]:
+    """Static LaTeX check of every parsed occurrence against the exam preamble."""
+    from generate_exam import ExamGenerator
+    from latexcheck import CheckContext, ExerciseChecker, find_bibliography, preamble_of
+
+    preamble = preamble_of(ExamGenerator(extractor, styles_path).template_header)
+    context = CheckContext(preamble.replace('<<STYLES_PATH>>', styles_path), extractor.base_path,
+                           [find_bibliography(extractor.base_path)])
+    checker = ExerciseChecker(context)
+    issues = []
+    for records in extractor.occurrences.values():
+        for r in records:
+            for problem in checker.check(r):
+                issues.append({
+                    'severity': problem['severity'],
+                    'code': problem['code'],
+                    'id': r['id'],
+                    'file': r['path'],
+                    'line': problem['line'] or r['line'],
+                    'message': f"Exercise {r['id']}: {problem['message']}",
+                })
+    checker.save(prune=True)
+    return issues
+
+
+def validate_extractor(extractor, latex_check: bool = False, styles_path: str = 'common/styles-tex') -> Dict:
+    """Check a loaded ExerciseExtractor and return a machine-readable report."""
+    issues: List[Dict] = []
+
+    for problem in extractor.parse_issues:
+        issues.append(_issue(problem['code'], problem['message'],
+                             file=problem['file'], line=problem['line']))
+
+    # IDs defined more than once, in the same file or across files
+    for ex_id, records in extractor.occurrences.items():
+        if len(records) > 1:
+            places = ', '.join(_where(r) for r in records)
+            for r in records:
+                issues.append(_issue('duplicate_id',
+                                     f"Duplicate exercise ID {ex_id} ({len(records)} definitions: {places})",
+                                     ex_id, r['path'], r['line']))
+
+    # Hashes shared by different IDs (selection by hash becomes ambiguous)
+    for ex_hash, records in extractor.hash_occurrences.items():
+        ids = sorted({r['id'] for r in records})
+        if len(ids) > 1:
+            for r in records:
+                issues.append(_issue('hash_collision',
+                                     f"Hash {ex_hash} is shared by exercises {', '.join(ids)}",
+                                     r['id'], r['path'], r['line']))
+
+    # Per-record content checks
+    for records in extractor.occurrences.values():
+        for r in records:
+            if not r['content']:
+                issues.append(_issue('empty_body', f"Exercise {r['id']} has empty content",
+                                     r['id'], r['path'], r['line']))
+            if not r['has_solution']:
+                issues.append(_issue('missing_solution', f"Exercise {r['id']} has no solution",
+                                     r['id'], r['path'], r['line']))
+            elif not r['solution']:
+                issues.append(_issue('empty_solution', f"Exercise {r['id']} has empty solution",
+                                     r['id'], r['path'], r['line']))
 
-def main():
+    for path, count in extractor.file_counts.items():
+        if count == 0:
+            issues.append(_issue('empty_file', f"No exercises found in {path}", file=path))
+
+    if latex_check:
+        issues.extend(latex_issues(extractor, styles_path))
+
+    errors = sum(1 for i in issues if i['severity'] == 'error')
+    warnings = sum(1 for i in issues if i['severity'] == 'warning')
+    return {
+        'version': REPORT_VERSION,
+        'base_path': str(extractor.base_path),
+        'patterns': extractor.exercise_patterns,
+        'summary': {
+            'exercises': len(extractor.exercises_db),
+            'occurrences': sum(len(r) for r in extractor.occurrences.values()),
+            'files': len(extractor.file_counts),
+            'errors': errors,
+            'warnings': warnings,
+        },
+        'files': extractor.file_counts,
+        'issues': issues,
+    }
+
+
+def print_report(report: Dict):
+    """Print a validation report in the human-readable format."""
+    summary = report['summary']
+    print(f"✓ Successfully loaded {summary['exercises']} exercises")
+
+    for issue in report['issues']:
+        where = issue['file'] or ''
+        if issue['line']:
+            where += f":{issue['line']}"
+        mark = '✗ Error' if issue['severity'] == 'error' else '⚠ Warning'
+        print(f"{mark}: {issue['message']}" + (f" [{where}]" if where else ''))
+
+    print()
+    print("Validation Summary:")
+    print(f"  Total exercises: {summary['exercises']}")
+    print(f"  Definitions found: {summary['occurrences']}")
+    print(f"  Files processed: {summary['files']}")
+    print(f"  Warnings: {summary['warnings']}")
+    print(f"  Errors: {summary['errors']}")
+
+    if summary['errors'] == 0 and summary['warnings'] == 0:
+        print("✓ All validation checks passed!")
+    elif summary['errors'] == 0:
+        print("✓ Validation completed with warnings only")
+    else:
+        print("✗ Validation failed with errors")
+
+
+def main(argv: List[str] = None):
     """Validate the exercise database."""
     parser = argparse.ArgumentParser(description='Validate exercise database')
-    parser.add_argument('--base-path', default='../..', help='Base path to exercise files')
-    parser.add_argument('--exercise-pattern', default='ch*_exercises.tex', help='Glob pattern for exercise files')
-    
-    args = parser.parse_args()
-    
+    parser.add_argument('--base-path', default=os.environ.get('BASE_PATH', '../..'), help='Base path to exercise files')
+    parser.add_argument('--exercise-pattern', default=os.environ.get('EXERCISE_PATTERN', 'ch*_exercises.tex'),
+                        help='Glob pattern(s) for exercise files (comma-separated for multiple patterns)')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                        help='Number of processes used to parse exercise files (default: CPU count)')
+    parser.add_argument('--styles-path', default=os.environ.get('STYLES_PATH', 'common/styles-tex'),
+                        help='Path to book style files (relative to book root), for the macro check')
+    parser.add_argument('--no-check', action='store_true', help='Skip the static LaTeX checks')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    parser.add_argument('--report', help='Also write the JSON report to this file')
+
+    args = parser.parse_args(argv)
+
     try:
         from generate_exam import ExerciseExtractor
-        
-        print("Validating exercise database...")
-        extractor = ExerciseExtractor(args.base_path, args.exercise_pattern)
-        exercises = extractor.list_exercises()
-        
-        print(f'✓ Successfully loaded {len(exercises)} exercises')
-        
-        warnings = 0
-        errors = 0
-        
-        # Check each exercise
-        for ex_id, ex in exercises.items():
-            # Check for empty content
-            if not ex['content'].strip():
-                print(f'⚠ Warning: Exercise {ex_id} has empty content')
-                warnings += 1
-            
-            # Check for empty solutions that should have content
-            if ex['solution'] and not ex['solution'].strip():
-                print(f'⚠ Warning: Exercise {ex_id} has empty solution')
-                warnings += 1
-            
-            # Check for duplicate IDs (should not happen with dict structure, but check anyway)
-            id_count = sum(1 for other_ex in exercises.values() if other_ex['id'] == ex['id'])
-            if id_count > 1:
-                print(f'✗ Error: Duplicate exercise ID: {ex_id}')
-                errors += 1
-            
-            # Check that ID and hash are valid
-            if not ex['id'] or not ex['hash']:
-                print(f'✗ Error: Exercise {ex_id} has missing ID or hash')
-                errors += 1
-        
-        # Check file coverage
-        base_path = Path(args.base_path)
-        exercise_files = sorted(base_path.glob(args.exercise_pattern))
-        files_with_exercises = set(ex['file'] for ex in exercises.values())
-        
-        for expected_file in exercise_files:
-            if expected_file.name not in files_with_exercises:
-                print(f'⚠ Warning: No exercises found in {expected_file.name}')
-                warnings += 1
-        
-        # Summary
-        print()
-        print("Validation Summary:")
-        print(f"  Total exercises: {len(exercises)}")
-        print(f"  Files processed: {len(files_with_exercises)}")
-        print(f"  Warnings: {warnings}")
-        print(f"  Errors: {errors}")
-        
-        if errors == 0 and warnings == 0:
-            print("✓ All validation checks passed!")
-            return 0
-        elif errors == 0:
-            print("✓ Validation completed with warnings only")
-            return 0
+
+        if not args.json:
+            print("Validating exercise database...")
+        # The extractor prints its warnings; keep them out of the JSON on stdout
+        with contextlib.redirect_stdout(sys.stderr) if args.json else contextlib.nullcontext():
+            extractor = ExerciseExtractor(args.base_path, args.exercise_pattern, jobs=args.jobs)
+            report = validate_extractor(extractor, not args.no_check, args.styles_path)
+
+        if args.report:
+            with open(args.report, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+        if args.json:
+            json.dump(report, sys.stdout, indent=2)
+            print()
         else:
-            print("✗ Validation failed with errors")
-            return 1
-            
+            print_report(report)
+
+        return 1 if report['summary']['errors'] else 0
+
     except ImportError:
         print("✗ Error: Cannot import generate_exam module")
         return 1
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Pruned book .aux files for xr cross-references.
+
+The generated exams and psets load the book's labels with
+``\\externaldocument`` so that ``\\ref{eq:foo}`` in an exercise prints the
+book's equation number. xr reads the whole book ``.aux`` (and every
+chapter ``.aux`` it ``\\@input``s) on every pass, although a document
+references a handful of labels. ``pruned_aux`` writes an ``.aux`` that
+holds only the ``\\newlabel`` entries a document references, including
+the ``<label>@cref`` entries cleveref reads, to the shared cache
+(``.exam-cache/xr/``). The file name is a hash of the book ``.aux``
+contents followed by a hash of the label set, so each pruned file is
+built once and rebuilt when the book is recompiled. Building one for a
+recompiled book deletes those made from its earlier ``.aux``, which no
+document can use any more.
+
+Usage:
+    python xraux.py ../../main.aux exams/midterm.tex
+"""
+from __future__ import annotations
+
+import os
+import re
+import sys
+from pathlib import Path
+from typing import Iterable, List, Optional, Set
+
+from cache import cache_dir, content_key
+
+# \ref{a}, \cref{a,b}, \eqref{a}, \hyperref[a]{...}, \crefrange{a}{b}, ...
+REF_RE = re.compile(
+    r'\\(?:[cC]ref|[vV]ref|ref|eqref|autoref|pageref|nameref|labelcref|namecref|[cC]pageref)\*?\s*\{([^}]*)\}'
+    r'|\\hyperref\s*\[([^\]]*)\]'
+    r'|\\(?:[cC]ref|[cC]pageref)range\*?\s*\{([^}]*)\}\s*\{([^}]*)\}')
+LABEL_RE = re.compile(r'\\label\s*(?:\[[^\]]*\])?\s*\{([^}]*)\}')
+INPUT_RE = re.compile(r'^\\@input\{([^}]*)\}', re.MULTILINE)
+NEWLABEL_PREFIX = '\\newlabel{'
+
+
+def referenced_labels(text: str) -> Set[str]:
+    """Labels referenced in text and not defined by it."""
+    if 'ref' not in text:
+        return set()
+    labels = set()
+    for m in REF_RE.finditer(text):
+        for group in m.groups():
+            if group:
+                labels.update(label.strip() for label in group.split(',') if label.strip())
+    return labels - {m.group(1).strip() for m in LABEL_RE.finditer(text)}
+
+
+def aux_files(aux_path: Path) -> List[Path]:
+    """The book .aux and the chapter .aux files it \\@inputs, recursively."""
+    files: List[Path] = []
+    pending = [aux_path]
+    while pending:
+        path = pending.pop(0)
+        if path in files or not path.exists():
+            continue
+        files.append(path)
+        text = path.read_text(encoding='utf-8', errors='replace')
+        # \@input paths are relative to the directory the book was compiled in
+        pending.extend(aux_path.parent / m.group(1) for m in INPUT_RE.finditer(text))
+    return files
+
+
+def _label_of(line: str) -> str:
+    end = line.find('}', len(NEWLABEL_PREFIX))
+    return line[len(NEWLABEL_PREFIX):end] if end >= 0 else ''
+
+
+def pruned_aux(aux_path, labels: Iterable[str], base_path) -> Path:
+    """Path of an .aux holding only the entries for labels (built if not cached)."""
+    files = aux_files(Path(aux_path))
+    contents = [f.read_bytes() for f in files]
+    wanted = sorted(set(labels))
+    book_key = content_key(*contents)[:16]
+    xr_dir = cache_dir(base_path, 'xr')
+    target = xr_dir / f"{book_key}-{content_key(*wanted)[:16]}.aux"
+    if target.exists():
+        return target
+
+    keep = set(wanted)
+    keep.update(f"{label}@cref" for label in wanted)
+    lines = ['\\relax']
+    for data in contents:
+        for line in data.decode('utf-8', errors='replace').splitlines():
+            if line.startswith(NEWLABEL_PREFIX) and _label_of(line) in keep:
+                lines.append(line)
+    tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    tmp.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    os.replace(tmp, target)
+    prune(xr_dir, book_key)
+    return target
+
+
+def prune(xr_dir: Path, book_key: str) -> None:
+    """Delete pruned files made from any other book .aux than the one hashed to book_key."""
+    for path in xr_dir.glob('*.aux'):
+        if not path.name.startswith(f"{book_key}-"):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+def external_document(aux_path: Optional[str], text: str, compile_root: Path) -> str:
+    """The \\externaldocument line for a document body, or '' if it references no labels.
+
+    Args:
+        aux_path: Book .aux relative to compile_root (as found by _find_book_aux), or None
+        text: Generated LaTeX whose references should resolve
+        compile_root: Directory the document is compiled in
+    """
+    if not aux_path:
+        return ''
+    labels = referenced_labels(text)
+    if not labels:
+        return ''
+    try:
+        aux = pruned_aux(compile_root / aux_path, labels, compile_root)
+    except OSError as e:
+        print(f"⚠ Warning: could not prune {aux_path} ({e}); using the full book .aux")
+        aux = compile_root / aux_path
+    rel = os.path.relpath(aux, compile_root)
+    if rel.endswith('.aux'):
+        rel = rel[:-4]
+    return f"\\externaldocument{{{rel}}}"
+
+
+def main(argv=None) -> int:
+    args = sys.argv[1:] if argv is None else argv
+    if len(args) != 2:
+        print(__doc__.split('Usage:')[1].rstrip())
+        return 2
+    aux_path, tex_path = Path(args[0]), Path(args[1])
+    labels = referenced_labels(tex_path.read_text(encoding='utf-8', errors='replace'))
+    aux = pruned_aux(aux_path, labels, aux_path.parent)
+    kept = sum(1 for line in aux.read_text(encoding='utf-8').splitlines() if line.startswith(NEWLABEL_PREFIX))
+    print(f"{len(labels)} label(s) referenced; {kept} entries kept in {aux}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Write manifest.mk: the book's file lists for the Makefile, from one walk.
+
+The Makefile used to run a ``find`` over the tree for every file list
+(chapters, versionless/versioned sources, book-json, and five rounds of
+sub-Makefile discovery) on every invocation. This script walks the tree
+once and writes all of them to ``manifest.mk`` as ``manifest_*``
+variables, formatted exactly as the ``find`` commands printed them.
+
+``manifest_dirs`` lists every directory walked below the root (as
+``dir/``), and the Makefile makes ``manifest.mk`` depend on them and the
+root: a directory's mtime changes only when an
+entry is added, removed or renamed, so make itself notices when the lists
+may be stale and only then runs this script (and restarts).
+
+Usage:
+    python3 scripts/make_manifest.py [manifest.mk]
+"""
+from __future__ import annotations
+
+import os
+import sys
+from fnmatch import fnmatch
+from typing import Dict, List
+
+MANIFEST_FILE = "manifest.mk"
+SKIPPED_DIRS = {".git"}
+
+# variable -> (directory it is searched in, name pattern, excluded path prefixes, path prefix printed)
+LISTS = {
+    "chapters": ("", "ch*.tex", ("exams/",), "./"),
+    "versionless_sources": ("versionless/", "*source.md", (), ""),
+    "versioned_sources": ("common/versioned/", "*source.md", (), ""),
+    "book_json_sources": ("common/book-json/", "*raw.json", (), "./"),
+    "lua_filters": ("common/lua-filters/", "*Makefile", (), "./"),
+    "engcom_makes": ("source/engcom/", "*Makefile", (), "./"),
+    "source_makes": ("source/", "*Makefile", (), "./"),
+    "statemint_makes": ("source/StateMint/", "*Makefile", (), "./"),
+    "meta_book_makes": ("meta-book/", "*Makefile", (), "./"),
+    "meta_common_makes": ("common/meta-common/", "*Makefile", (), "./"),
+    # sub-Makefiles: at least one directory deep
+    "makefiles": ("", "*Makefile", ("common/source/matlab/matlab2tikz/", "exams/"), "./"),
+}
+
+
+def walk(root: str = "."):
+    """(directories, files) under root, as paths relative to it; symlinks are not followed."""
+    dirs: List[str] = []
+    files: List[str] = []
+    stack = [""]
+    while stack:
+        rel = stack.pop()
+        dirs.append(rel or ".")
+        try:
+            entries = list(os.scandir(os.path.join(root, rel) if rel else root))
+        except OSError:
+            continue
+        for entry in entries:
+            path = f"{rel}{entry.name}"
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in SKIPPED_DIRS:
+                    stack.append(f"{path}/")
+            elif entry.is_file(follow_symlinks=False):
+                files.append(path)
+    return sorted(dirs), sorted(files)
+
+
+def file_lists(files: List[str]) -> Dict[str, List[str]]:
+    lists: Dict[str, List[str]] = {name: [] for name in LISTS}
+    for path in files:
+        name = path.rsplit("/", 1)[-1]
+        for var, (base, pattern, excluded, prefix) in LISTS.items():
+            if (path.startswith(base) and fnmatch(name, pattern)
+                    and not any(path.startswith(e) for e in excluded)):
+                if var == "makefiles" and "/" not in path:
+                    continue
+                lists[var].append(prefix + path)
+    return lists
+
+
+def _make_words(paths: List[str]) -> str:
+    return " ".join(p.replace(" ", "\\ ") for p in paths)
+
+
+def write_manifest(target: str = MANIFEST_FILE, root: str = ".") -> Dict[str, List[str]]:
+    dirs, files = walk(root)
+    lists = file_lists(files)
+    lines = ["# Generated by scripts/make_manifest.py; regenerated by make when a directory changes"]
+    for var, paths in lists.items():
+        lines.append(f"manifest_{var} := {_make_words(paths)}")
+    # with a trailing slash, so that no directory is mistaken for a target of the same name (exams, source)
+    lines.append(f"manifest_dirs := {_make_words([d for d in dirs if d != '.'])}")
+    path = os.path.join(root, target)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)
+    # Replacing the file bumps its directory's mtime; keep manifest.mk the newer one
+    os.utime(path)
+    return lists
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    target = argv[0] if argv else MANIFEST_FILE
+    lists = write_manifest(target)
+    print(f"Wrote {target} ({sum(len(v) for v in lists.values())} files)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
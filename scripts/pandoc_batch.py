@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Convert versionless/versioned ``source.md`` files to ``index.tex`` in parallel, with a cache.
+
+Make converts each ``source.md`` with its own pandoc process. This driver
+converts a batch of them through a worker pool and keeps every output in
+a content-addressed cache (``.pandoc-cache/``). The key is a hash of
+
+  - the pandoc version and the conversion arguments,
+  - the contents of every file the arguments name (Lua filters,
+    templates, defaults and metadata files, ...),
+  - the source's path (filters may depend on the section's directory) and
+    contents,
+
+so switching branches or checking out old commits reuses earlier
+conversions instead of running pandoc again. An ``index.tex`` whose
+content would not change is not rewritten, which keeps its mtime, and
+so everything built from it, up to date.
+
+Pandoc runs from the book root as
+``pandoc <args> -o <dir>/index.tex <dir>/source.md``.
+
+Usage:
+    python3 scripts/pandoc_batch.py --args '--lua-filter=common/lua-filters/x.lua ...' versionless/*/source.md
+    python3 scripts/pandoc_batch.py --args '...' --jobs 8 --stamp .pandoc-cache/batch.stamp FILES...
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List
+
+CACHE_DIR = Path(".pandoc-cache")
+
+
+def _pandoc_version(pandoc: str) -> str:
+    result = subprocess.run([pandoc, "--version"], capture_output=True, text=True)
+    return result.stdout.splitlines()[0] if result.stdout else ""
+
+
+def _referenced_files(args: List[str], root=".") -> List[Path]:
+    """Files named by the arguments, as --opt=FILE, --opt FILE or a bare path (relative to root)."""
+    paths = []
+    for arg in args:
+        value = arg.split("=", 1)[1] if arg.startswith("-") and "=" in arg else arg
+        if not value.startswith("-") and os.path.isfile(os.path.join(root, value)):
+            paths.append(Path(value))
+    return paths
+
+
+class PandocBatch:
+    """Cached source.md -> index.tex conversions.
+
+    Args:
+        args: pandoc arguments (everything but -o and the input)
+        pandoc: pandoc executable
+        root: Book root, which file paths are relative to (keys do not depend on it)
+    """
+
+    def __init__(self, args: List[str], pandoc: str = "pandoc", root="."):
+        self.args = args
+        self.pandoc = pandoc
+        self.root = Path(root)
+        digest = hashlib.sha256()
+        digest.update(_pandoc_version(pandoc).encode("utf-8"))
+        digest.update(b"\0" + "\0".join(args).encode("utf-8"))
+        for path in _referenced_files(args, root):
+            digest.update(b"\0" + str(path).encode("utf-8") + b"\0" + (self.root / path).read_bytes())
+        self.config_key = digest.hexdigest()
+
+    def key(self, source: Path) -> str:
+        digest = hashlib.sha256(self.config_key.encode("utf-8"))
+        digest.update(b"\0" + str(source).encode("utf-8") + b"\0" + (self.root / source).read_bytes())
+        return digest.hexdigest()
+
+    def convert(self, source: Path) -> dict:
+        """Convert one source; 'status' is 'cached', 'converted', 'unchanged' or 'failed'."""
+        start = time.time()
+        target = source.with_name("index.tex")
+        key = self.key(source)
+        cached = CACHE_DIR / key[:2] / f"{key}.tex"
+        status = "cached"
+        if not cached.exists():
+            cached.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cached.with_name(f"{cached.name}.{os.getpid()}.{id(source)}.tmp")
+            result = subprocess.run([self.pandoc] + self.args + ["-o", str(tmp), str(source)],
+                                    capture_output=True, text=True)
+            if result.returncode != 0 or not tmp.exists():
+                tmp.unlink(missing_ok=True)
+                return {"source": source, "status": "failed", "error": result.stderr.strip(),
+                        "seconds": time.time() - start}
+            os.replace(tmp, cached)
+            status = "converted"
+        data = cached.read_bytes()
+        if target.exists() and target.read_bytes() == data:
+            if status == "cached":
+                status = "unchanged"
+        else:
+            tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, target)
+        return {"source": source, "status": status, "seconds": time.time() - start}
+
+    def run(self, sources: List[Path], jobs: int) -> List[dict]:
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+            return list(pool.map(self.convert, sources))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Convert source.md files to index.tex with a cache")
+    parser.add_argument("sources", nargs="*", help="source.md files")
+    parser.add_argument("--args", default="", help="pandoc arguments (PANDOC_TEX_ARGS), as one string")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1,
+                        help="Concurrent pandoc processes (default: number of CPUs)")
+    parser.add_argument("--pandoc", default="pandoc", help="pandoc executable")
+    parser.add_argument("--stamp", help="File to touch when every conversion succeeded")
+    args = parser.parse_args(argv)
+
+    if not shutil.which(args.pandoc):
+        print(f"✗ Error: {args.pandoc} not found")
+        return 1
+    sources = [Path(s) for s in dict.fromkeys(args.sources) if s.endswith("source.md")]
+    batch = PandocBatch(shlex.split(args.args), args.pandoc)
+    results = batch.run(sources, args.jobs)
+
+    failed: List[dict] = []
+    counts = {"converted": 0, "cached": 0, "unchanged": 0}
+    for result in results:
+        if result["status"] == "failed":
+            failed.append(result)
+            print(f"✗ Error: pandoc failed for {result['source']}:\n{result['error']}")
+        else:
+            counts[result["status"]] += 1
+            if result["status"] == "converted":
+                print(f"pandoc {result['source']} [{result['seconds']:.1f}s]")
+    print(f"{len(results)} source(s): {counts['converted']} converted, {counts['cached']} from cache, "
+          f"{counts['unchanged']} unchanged, {len(failed)} failed")
+    if failed:
+        return 1
+    if args.stamp:
+        stamp = Path(args.stamp)
+        stamp.parent.mkdir(parents=True, exist_ok=True)
+        stamp.touch()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
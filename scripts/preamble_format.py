@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Precompiled LuaLaTeX format of the book preamble for section builds.
+
+Every LuaLaTeX pass of a section build loads the class, the
+``common/styles-tex`` packages and ``0-preamble.tex`` again. This script
+dumps that static part (``0-documentclass.tex``, ``0-xr.tex`` and
+``0-preamble.tex``, the parts build-alone.py puts before ``\\endofdump``)
+into a format with mylatexformat, so each pass starts after the
+preamble.
+
+minted is loaded in the dumped part, so its ``outputdir`` option (the
+section's ``build-sections/<h>/``, passed with ``\\PassOptionsToPackage``
+before the document) must be given when the format is built; a later
+``\\PassOptionsToPackage`` has no effect. Each section output directory
+therefore gets its own format.
+
+The formats live in ``build-sections/.formats/`` and are named
+``preamble-<defs>-<key>``: ``<defs>`` hashes the LaTeX definitions passed
+on the command line (``\\nocropmarks``, ``\\nowrite``, ..., which the class
+reads while loading) and the minted output directory, and ``<key>`` hashes
+
+  - those definitions,
+  - the preamble parts and every file in ``common/styles-tex``,
+  - the ``.aux`` files ``\\externaldocument`` reads during the preamble,
+  - the LuaLaTeX version,
+
+so any change builds a new one, which replaces the older formats with
+the same ``<defs>`` only. If a format cannot be built (e.g.
+mylatexformat is not installed or a package refuses to be dumped), a
+``.failed`` marker is left and builds run without a format until an
+input changes or ``build`` is run explicitly.
+
+Usage:
+    python scripts/preamble_format.py build [--defs '\\def\\nowrite{1}'] [--outputdir build-sections/qv/]
+    python scripts/preamble_format.py option [--defs ...] [--outputdir ...]   # "-fmt=<name>" or nothing
+    python scripts/preamble_format.py clean
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+FORMAT_DIR = Path("build-sections/.formats")
+PREAMBLE_PARTS = ("0-documentclass.tex", "0-xr.tex", "0-preamble.tex")
+STYLES_DIR = Path("common/styles-tex")
+DUMP_MARKER = "\n\\endofdump\n"
+# Makes \endofdump a no-op when a document is compiled without the format
+ENDOFDUMP = "\\expandafter\\providecommand\\csname endofdump\\endcsname{}" + DUMP_MARKER
+DEFAULT_DEFS = "\\def\\nowrite{1}\\def\\nocropmarks{1}"
+EXTERNAL_RE = re.compile(r"\\externaldocument(?:\[[^\]]*\])?\{([^}]+)\}")
+
+
+def preamble_text(root=".") -> str:
+    """The dumped part of a section document (see build-alone.py)."""
+    text = ""
+    for part in PREAMBLE_PARTS:
+        with open(Path(root) / part, encoding="utf-8") as f:
+            text += f.read()
+    return text
+
+
+def _engine_version(lualatex: str) -> str:
+    try:
+        result = subprocess.run([lualatex, "--version"], capture_output=True, text=True)
+    except OSError:
+        return ""
+    return result.stdout.splitlines()[0] if result.stdout else ""
+
+
+def format_key(defs: str, lualatex: str, root=".") -> str:
+    """Hash of everything the dumped format depends on."""
+    root = Path(root)
+    digest = hashlib.sha256()
+    preamble = preamble_text(root)
+    for text in (defs, _engine_version(lualatex), preamble):
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+    for dirpath, dirnames, filenames in os.walk(root / STYLES_DIR):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = Path(dirpath) / filename
+            digest.update(str(path.relative_to(root)).encode("utf-8"))
+            digest.update(path.read_bytes())
+    for external in EXTERNAL_RE.findall(preamble):
+        aux = root / f"{external}.aux"
+        digest.update(str(aux).encode("utf-8"))
+        if aux.exists():
+            digest.update(aux.read_bytes())
+    return digest.hexdigest()
+
+
+class PreambleFormat:
+    """The preamble format for one set of command-line definitions.
+
+    Args:
+        defs: LaTeX definitions run before the document (as in tex_cmd)
+        root: Book root
+        outputdir: minted output directory of the section build (as in tex_cmd)
+    """
+
+    def __init__(self, defs: str = DEFAULT_DEFS, root=".", outputdir: Optional[str] = None):
+        self.root = Path(root)
+        self.defs = defs
+        if outputdir:
+            self.defs += f"\\PassOptionsToPackage{{outputdir={outputdir}}}{{minted}}"
+        self.lualatex = shutil.which("lualatex")
+        self.dir = self.root / FORMAT_DIR
+        self.prefix = f"preamble-{hashlib.sha256(self.defs.encode('utf-8')).hexdigest()[:8]}"
+        self.name: Optional[str] = None
+        if self.lualatex and all((self.root / part).exists() for part in PREAMBLE_PARTS):
+            self.name = f"{self.prefix}-{format_key(self.defs, self.lualatex, self.root)[:16]}"
+
+    @property
+    def path(self) -> Path:
+        return self.dir / f"{self.name}.fmt"
+
+    @property
+    def failed_marker(self) -> Path:
+        return self.dir / f"{self.name}.failed"
+
+    def ensure(self, force: bool = False) -> Optional[str]:
+        """Build the format if it is missing; its name, or None if unavailable."""
+        if not self.name:
+            return None
+        if self.path.exists():
+            return self.name
+        if self.failed_marker.exists() and not force:
+            return None
+        return self.name if self.build() else None
+
+    def build(self) -> bool:
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.failed_marker.unlink(missing_ok=True)
+        with tempfile.TemporaryDirectory(prefix="preamble-fmt-") as tmp:
+            tex = Path(tmp) / f"{self.name}.tex"
+            tex.write_text(f"{self.defs}\n{preamble_text(self.root)}{ENDOFDUMP}"
+                           "\\begin{document}\n\\end{document}\n", encoding="utf-8")
+            cmd = [self.lualatex, "-ini", "-interaction=nonstopmode", "-halt-on-error", "-shell-escape",
+                   f"-jobname={self.name}", f"-output-directory={tmp}", "&lualatex", "mylatexformat.ltx",
+                   str(tex)]
+            result = subprocess.run(cmd, capture_output=True, text=True, cwd=self.root,
+                                    stdin=subprocess.DEVNULL)
+            built = Path(tmp) / f"{self.name}.fmt"
+            if result.returncode != 0 or not built.exists():
+                log = Path(tmp) / f"{self.name}.log"
+                self.failed_marker.write_text(log.read_text(errors="replace") if log.exists() else result.stdout)
+                return False
+            shutil.copyfile(built, self.path)
+        # Formats for other definitions (e.g. other sections) are still current
+        for old in self.dir.glob(f"{self.prefix}-*"):
+            if old != self.path:
+                old.unlink()
+        return True
+
+    def env(self, environ=None) -> dict:
+        """environ with the format directory on TEXFORMATS."""
+        env = dict(os.environ if environ is None else environ)
+        env["TEXFORMATS"] = f"{self.dir}{os.pathsep}{env.get('TEXFORMATS', '')}"
+        return env
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Precompiled preamble format for section builds")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("build", "Build the format (even after a failed attempt)"),
+                            ("option", "Print the -fmt option for the current format, building it if needed")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--defs", default=DEFAULT_DEFS,
+                       help="LaTeX definitions passed before the document (default: section build's)")
+        p.add_argument("--outputdir", help="Output directory of the section build (minted's outputdir)")
+    sub.add_parser("clean", help="Remove all formats")
+    args = parser.parse_args(argv)
+
+    if args.command == "clean":
+        shutil.rmtree(FORMAT_DIR, ignore_errors=True)
+        return 0
+
+    fmt = PreambleFormat(args.defs, outputdir=args.outputdir)
+    if args.command == "option":
+        if fmt.ensure():
+            print(f"-fmt={fmt.name}")
+        return 0
+
+    if not fmt.name:
+        print("✗ Error: lualatex or the 0-*.tex preamble parts not found")
+        return 1
+    if fmt.ensure(force=True):
+        print(f"Preamble format {fmt.path} is up to date")
+        return 0
+    print(f"✗ Error: could not build the preamble format (is mylatexformat installed?); see {fmt.failed_marker}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
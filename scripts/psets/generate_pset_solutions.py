@@ -21,10 +21,8 @@ Date: 2026
 
 import argparse
 import re
-import yaml
 import os
 import sys
-import shutil
 from pathlib import Path
 from typing import List, Dict, Optional
 from datetime import datetime
@@ -33,7 +31,12 @@ from datetime import datetime
 _exams_dir = str(Path(__file__).resolve().parent.parent / "exams")
 if _exams_dir not in sys.path:
     sys.path.insert(0, _exams_dir)
-from generate_exam import ExerciseExtractor, compile_pdf, load_config, list_available_exercises
+from generate_exam import (ExerciseExtractor, bisect_failure, compile_pdf, load_config,
+                           list_available_exercises, preflight_check, resolve_assets_in)
+from depfile import document_dependencies, write_depfile
+from latexcheck import find_bibliography
+from profiling import Profiler, profiling_requested
+from xraux import external_document
 
 
 def parse_xsim_numbering(base_path: Path) -> Dict[str, str]:
@@ -114,6 +117,7 @@ class PsetSolutionsGenerator:
         self.extractor = extractor
         self.styles_path = styles_path
         self.xsim_numbers = parse_xsim_numbering(extractor.base_path)
+        self.bibliography: Optional[str] = None
         self.template_header = self._get_template_header()
         self.template_footer = self._get_template_footer()
 
@@ -283,34 +287,16 @@ class PsetSolutionsGenerator:
 
     def _find_bib_file(self, base_path: Path) -> Optional[str]:
         """Auto-detect the book's bibliography file."""
-        # Check preamble files for \addbibresource
-        for preamble in sorted(base_path.glob("0-*.tex")):
-            try:
-                text = preamble.read_text(encoding='utf-8')
-                m = re.search(r'\\addbibresource\{([^}]+)\}', text)
-                if m:
-                    bib_path = base_path / m.group(1)
-                    if bib_path.exists():
-                        return m.group(1)
-            except Exception:
-                continue
-        # Fallback: check common locations
-        for candidate in ["common/book.bib", "book.bib", "references.bib"]:
-            if (base_path / candidate).exists():
-                return candidate
-        return None
+        return find_bibliography(base_path)
 
     def generate(self, config: Dict) -> str:
         """Generate a complete problem set solutions LaTeX file."""
         compile_root = Path(config.get('base_path_resolved', self.extractor.base_path)).resolve()
-        aux_rel = self._find_book_aux(compile_root)
-        if aux_rel and aux_rel.endswith('.aux'):
-            aux_rel = aux_rel[:-4]
-        xr_external = f"\\externaldocument{{{aux_rel}}}" if aux_rel else ''
 
-        # Generate the problems section first so we can check for citations
+        # Generate the problems section first so we can check for citations and references
         include_problems = config.get('include_problems', False)
         problems_section = self._generate_problems(config['problems'], include_problems)
+        xr_external = external_document(self._find_book_aux(compile_root), problems_section, compile_root)
 
         # Determine bibliography: explicit config, or auto-detect if content has citations
         bib_file = config.get('bibliography')
@@ -318,6 +304,7 @@ class PsetSolutionsGenerator:
             r'\\(?:auto)?cite|\\textcite|\\parencite|\\footcite|\\fullcite', problems_section))
         if not bib_file and has_citations:
             bib_file = self._find_bib_file(compile_root)
+        self.bibliography = bib_file
 
         if bib_file:
             biblatex_package = f"\\usepackage[backend=biber,style=numeric,sorting=none,natbib=true]{{biblatex}}\n\\addbibresource{{{bib_file}}}"
@@ -399,7 +386,7 @@ class PsetSolutionsGenerator:
                 content = re.sub(r'\\begin\{exercise\}.*?\n', '', content)
                 content = re.sub(r'\\end\{exercise\}', '', content)
                 content = re.sub(r'^\\def\\labelenum.*\n', '', content, flags=re.MULTILINE)
-                problems_latex += content
+                problems_latex += resolve_assets_in(content, exercise)
                 problems_latex += "\n\n\\noindent\\textbf{Solution:}\\par\n"
 
             # Solution (always included)
@@ -408,7 +395,7 @@ class PsetSolutionsGenerator:
                 solution = re.sub(r'\\begin\{solution\}.*?\n', '', solution)
                 solution = re.sub(r'\\end\{solution\}', '', solution)
                 solution = clean_solution_markdown(solution, ex_id)
-                problems_latex += solution
+                problems_latex += resolve_assets_in(solution, exercise)
             else:
                 problems_latex += "\\textit{No solution available.}\\par\n"
 
@@ -436,13 +423,14 @@ def create_sample_config():
         ]
     }
 
+    import yaml
     with open('pset_config_sample.yaml', 'w') as f:
         yaml.dump(sample_config, f, default_flow_style=False, indent=2)
 
     print("Sample configuration created: pset_config_sample.yaml")
 
 
-def main():
+def main(argv: Optional[List[str]] = None):
     parser = argparse.ArgumentParser(description='Generate problem set solutions from exercise database')
     parser.add_argument('--config', help='YAML configuration file')
     parser.add_argument('--problems', help='Comma-separated list of problem IDs/hashes')
@@ -462,23 +450,41 @@ def main():
     parser.add_argument('--include-problems', action='store_true',
                         help='Include problem statements before solutions (default: solutions only)')
     parser.add_argument('--no-quick', action='store_true', help='Skip PDF compilation')
-
-    args = parser.parse_args()
+    parser.add_argument('--no-depfile', action='store_true',
+                        help='Do not write the make dependency file (<output>.d)')
+    parser.add_argument('--no-check', action='store_true',
+                        help='Skip the static LaTeX checks run before compiling')
+    parser.add_argument('--bisect', action='store_true',
+                        help='If compilation fails, find the failing problem(s) by compiling subsets in parallel')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                        help='Concurrent compiles for --bisect and figure rendering (default: CPU count)')
+    parser.add_argument('--no-figure-cache', action='store_true',
+                        help='Compile standalone/TikZ figures in place instead of using pre-rendered PDFs')
+    parser.add_argument('--profile', action='store_true',
+                        help='Record per-phase and per-subprocess timings as a JSON trace (also EXAM_PROFILE=1)')
+    parser.add_argument('--cprofile', metavar='FILE', help='Also dump Python cProfile stats to FILE')
+
+    args = parser.parse_args(argv)
 
     if args.sample_config:
         create_sample_config()
         return
 
-    extractor = ExerciseExtractor(Path(args.base_path).resolve(), args.exercise_pattern)
+    profiler = Profiler('generate_pset_solutions', profiling_requested(args.profile), args.cprofile)
+
+    with profiler.phase('extractor_load'):
+        extractor = ExerciseExtractor(Path(args.base_path).resolve(), args.exercise_pattern)
 
     if args.list:
         list_available_exercises(extractor)
         return
 
-    generator = PsetSolutionsGenerator(extractor, args.styles_path)
+    with profiler.phase('xsim_numbering'):
+        generator = PsetSolutionsGenerator(extractor, args.styles_path)
 
     if args.config:
-        config = load_config(args.config)
+        with profiler.phase('config_load'):
+            config = load_config(args.config)
         config_path = Path(args.config).resolve()
         base_name = config_path.stem
         config['config_path'] = str(config_path)
@@ -500,7 +506,8 @@ def main():
     else:
         parser.error('Either --config or --problems must be specified')
 
-    latex_content = generator.generate(config)
+    with profiler.phase('render'):
+        latex_content = generator.generate(config)
 
     if args.output:
         base_name = args.output
@@ -518,15 +525,45 @@ def main():
             output_dir = Path('.').resolve()
             output_file = str(output_dir / f"{base_name}.tex")
 
+    profiler.document = Path(output_file).stem
+
     with open(output_file, 'w', encoding='utf-8') as f:
         f.write(latex_content)
 
     print(f"Problem set solutions generated: {output_file}")
 
+    if not args.no_depfile:
+        deps = document_dependencies(extractor, config['problems'], args.styles_path,
+                                     [config.get('config_path'), generator.bibliography,
+                                      generator._find_book_aux(extractor.base_path)])
+        write_depfile(Path(output_file).with_suffix('.d'),
+                      [output_file, Path(output_file).with_suffix('.pdf')], deps, extractor.base_path)
+
+    if not args.no_check:
+        with profiler.phase('check'):
+            parts = ('exercise', 'solution') if config.get('include_problems') else ('solution',)
+            check_errors = preflight_check(latex_content, extractor, config['problems'], parts)
+        if check_errors and not args.no_quick:
+            print(f"✗ {check_errors} error(s) found before compiling; fix them or pass --no-check")
+            profiler.write(Path(output_file).parent / '.profile')
+            return 1
+
+    status = 0
     if not args.no_quick:
         print("Compiling PDF...")
-        compile_pdf(output_file, args.base_path)
+        with profiler.phase('compile'):
+            compile_success = compile_pdf(output_file, args.base_path, profiler,
+                                          figure_cache=not args.no_figure_cache, jobs=args.jobs)
+        if not compile_success and args.bisect:
+            with profiler.phase('bisect'):
+                bisect_failure(config['problems'],
+                               lambda subset: generator.generate(dict(config, problems=subset)),
+                               args.base_path, args.jobs, profiler)
+            status = 1
+
+    profiler.write(Path(output_file).parent / '.profile')
+    return status
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -88,8 +88,8 @@ COMMANDS:
     --problems PROBLEMS     Generate solutions with comma-separated problem IDs/hashes
     --config FILE           Generate solutions from YAML configuration file
     --no-quick FILE         Generate without compiling (use with --config or --problems)
-    --validate              Validate exercise database
-    --stats                 Show exercise database statistics
+    --validate [--json]     Validate exercise database (JSON report for CI)
+    --stats [--format json] Show exercise database statistics
 
 OPTIONS (for --problems):
     --title TITLE           Document title (default: "Problem Set Solutions")
@@ -209,87 +209,13 @@ generate_from_config() {
 
 validate_database() {
     print_info "Validating exercise database..."
-
-    $PYTHON -c "
-import sys
-sys.path.insert(0, '$(dirname "$PSET_GENERATOR")/../exams')
-sys.path.insert(0, '.')
-try:
-    from generate_exam import ExerciseExtractor
-    extractor = ExerciseExtractor('$BASE_PATH', '$EXERCISE_PATTERN')
-    exercises = extractor.list_exercises()
-    print(f'✓ Successfully loaded {len(exercises)} exercises')
-
-    warnings = 0
-    for ex_id, ex in exercises.items():
-        if not ex['content'].strip():
-            print(f'⚠ Warning: Exercise {ex_id} has empty content')
-            warnings += 1
-        if ex['solution'] and not ex['solution'].strip():
-            print(f'⚠ Warning: Exercise {ex_id} has empty solution')
-            warnings += 1
-
-    if warnings == 0:
-        print('✓ No issues found')
-    else:
-        print(f'⚠ Found {warnings} warnings')
-
-    print('Validation complete')
-except Exception as e:
-    print(f'✗ Validation failed: {e}')
-    sys.exit(1)
-"
+    "$PYTHON" ../exams/validate_exercises.py --base-path "$BASE_PATH" --exercise-pattern "$EXERCISE_PATTERN" "$@"
     print_success "Database validation completed"
 }
 
 show_stats() {
     print_info "Exercise Database Statistics:"
-
-    $PYTHON -c "
-import sys
-from pathlib import Path
-import re
-
-def count_exercises_in_file(file_path):
-    if not file_path.exists():
-        return 0
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        return len(re.findall(r'\\\\begin\{exercise\}', content))
-    except Exception:
-        return 0
-
-base_path = Path('$BASE_PATH')
-exercise_files = sorted(base_path.glob('$EXERCISE_PATTERN'))
-
-total_exercises = 0
-files_found = 0
-
-for file_path in exercise_files:
-    count = count_exercises_in_file(file_path)
-    total_exercises += count
-    files_found += 1
-    status = '✓' if file_path.exists() else '✗'
-    print(f'{file_path.name}: {count} exercises {status}')
-
-print(f'Total exercises: {total_exercises}')
-print(f'Files found: {files_found}')
-
-try:
-    sys.path.insert(0, '$(dirname "$PSET_GENERATOR")/../exams')
-    from generate_exam import ExerciseExtractor
-    extractor = ExerciseExtractor('$BASE_PATH', '$EXERCISE_PATTERN')
-    exercises = extractor.list_exercises()
-    print(f'Exercises loaded by extractor: {len(exercises)}')
-
-    if len(exercises) != total_exercises:
-        print(f'⚠ Warning: Mismatch between file count ({total_exercises}) and extractor count ({len(exercises)})')
-except ImportError:
-    print('Note: Could not import exercise extractor for verification')
-except Exception as e:
-    print(f'Note: Error loading exercise extractor: {e}')
-"
+    "$PYTHON" ../exams/show_stats.py --base-path "$BASE_PATH" --exercise-pattern "$EXERCISE_PATTERN" "$@"
 }
 
 main() {
@@ -355,10 +281,12 @@ main() {
             esac
             ;;
         --validate|validate)
-            validate_database
+            shift
+            validate_database "$@"
             ;;
         --stats|stats)
-            show_stats
+            shift
+            show_stats "$@"
             ;;
         "")
             print_error "No command specified"
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Run the book's source sub-Makefiles (MATLAB/Python figure generators) in parallel.
+
+``make source`` used to run ``make -C`` in every sub-Makefile directory,
+one after another. This script first asks every directory with
+``make -q`` (concurrently; nothing is built) whether it is up to date,
+then runs only the stale ones, ``--jobs`` at a time. Each directory's
+output is printed as one block when it finishes, followed by a timing
+summary.
+
+MATLAB is not available in the build container, so sub-Makefiles list
+the MATLAB commands to run in ``matlab_run.sh``. With concurrent
+sub-makes the lines are aggregated safely:
+
+  - each sub-make gets ``MATLAB_RUN_SH`` in its environment, a private
+    file it can append to (``MATLAB_RUN_SH ?= ../../matlab_run.sh`` in a
+    sub-Makefile keeps it working when run by hand);
+  - sub-Makefiles that append to ``matlab_run.sh`` directly still work
+    (single-line appends do not interleave), but their lines land in the
+    order the sub-makes ran, which varies between runs;
+  - at the end ``matlab_run.sh`` holds the direct appends first, then the
+    lines of the private files in sub-Makefile order, without duplicates.
+
+Only sub-Makefiles that write to ``$(MATLAB_RUN_SH)`` get a reproducible
+order, so new ones should use it rather than the ``matlab_run.sh`` path.
+
+Usage:
+    python3 scripts/run_submakes.py [--jobs 4] ./ch02/matlab/Makefile ./source/figs/Makefile ...
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List
+
+MATLAB_RUN_FILE = Path("matlab_run.sh")
+# jobserver options of a parent make refer to file descriptors the sub-makes do not inherit
+JOBSERVER_RE = re.compile(r"(^|\s)(--jobserver-(auth|fds)=\S+|-j\d*)(?=\s|$)")
+
+
+def sub_env(matlab_run: Path) -> Dict[str, str]:
+    env = dict(os.environ)
+    if "MAKEFLAGS" in env:
+        env["MAKEFLAGS"] = JOBSERVER_RE.sub("", env["MAKEFLAGS"]).strip()
+    env.pop("MFLAGS", None)
+    env["MATLAB_RUN_SH"] = str(matlab_run.resolve())
+    return env
+
+
+def is_stale(directory: str, make: str) -> bool:
+    """make -q: 0 up to date, 1 needs remaking, 2 error (treated as stale so it is reported)."""
+    env = dict(os.environ)
+    env.pop("MAKEFLAGS", None)
+    env.pop("MFLAGS", None)
+    result = subprocess.run([make, "-q", "-C", directory], stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL, env=env)
+    return result.returncode != 0
+
+
+def run_make(directory: str, make: str, matlab_run: Path) -> Dict:
+    start = time.time()
+    result = subprocess.run([make, "-C", directory], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            text=True, env=sub_env(matlab_run), stdin=subprocess.DEVNULL)
+    return {"dir": directory, "returncode": result.returncode, "output": result.stdout,
+            "seconds": time.time() - start}
+
+
+def merge_matlab_run(direct_lines: List[str], private_files: List[Path]):
+    """Write matlab_run.sh: direct appends first (in the order they were made), then the
+    private files' lines in the order given, without duplicates."""
+    lines: List[str] = []
+    seen = set()
+    for line in direct_lines + [l for p in private_files if p.exists()
+                                for l in p.read_text(errors="replace").splitlines()]:
+        if line.strip() and line not in seen:
+            seen.add(line)
+            lines.append(line)
+    tmp = MATLAB_RUN_FILE.with_name(f"{MATLAB_RUN_FILE.name}.{os.getpid()}.tmp")
+    tmp.write_text("".join(f"{line}\n" for line in lines))
+    os.replace(tmp, MATLAB_RUN_FILE)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run stale source sub-Makefiles in parallel")
+    parser.add_argument("makefiles", nargs="*", help="Sub-Makefiles (their directories are made)")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1,
+                        help="Concurrent sub-makes (default: number of CPUs)")
+    parser.add_argument("--make", default=os.environ.get("MAKE", "make"), help="make executable")
+    args = parser.parse_args(argv)
+
+    directories = list(dict.fromkeys(os.path.dirname(m) or "." for m in args.makefiles))
+    MATLAB_RUN_FILE.write_text("")
+    if not directories:
+        return 0
+
+    jobs = max(1, args.jobs)
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        stale = [d for d, s in zip(directories, pool.map(lambda d: is_stale(d, args.make), directories)) if s]
+    print(f"{len(stale)} of {len(directories)} sub-Makefile directories need remaking")
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="submakes-") as tmp:
+        private = {d: Path(tmp) / f"{i}.sh" for i, d in enumerate(stale)}
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(run_make, d, args.make, private[d]) for d in stale]
+            for future in as_completed(futures):
+                result = future.result()
+                status = "ok" if result["returncode"] == 0 else f"FAILED ({result['returncode']})"
+                print(f"=== {result['dir']}: {status} [{result['seconds']:.1f}s]")
+                if result["output"].strip():
+                    print(result["output"].rstrip())
+                results.append(result)
+        merge_matlab_run(MATLAB_RUN_FILE.read_text(errors="replace").splitlines(),
+                         [private[d] for d in stale])
+
+    if results:
+        print("Sub-make timing (slowest first):")
+        for result in sorted(results, key=lambda r: r["seconds"], reverse=True):
+            print(f"  {result['seconds']:7.1f}s  {result['dir']}")
+    failed = [r["dir"] for r in results if r["returncode"] != 0]
+    if failed:
+        print(f"✗ Error: sub-make failed in {' '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
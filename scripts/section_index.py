@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Cached index of the book's sections: hash -> source file, type and chapter.
+
+``make section h=qv`` and ``build-alone.py`` need the file a section hash
+lives in. Sections are
+
+  - ``versionless/<h>/source.md`` and ``common/versioned/<h>/source.md``
+    (built to ``index.tex`` by pandoc), and
+  - ``<h>.tex`` or ``<h>/index.tex`` anywhere under a top-level ``ch*``
+    directory.
+
+A ``versionless/<h>/`` or ``common/versioned/<h>/`` directory without a
+``source.md`` (e.g. one left with only build output) is not a section.
+Symlinked directories under a chapter are not descended into.
+
+A versioned or versionless section takes precedence over a chapter file
+with the same hash. The chapter of a versioned/versionless section is
+the chapter whose ``.tex`` files reference its ``index``.
+
+The index is stored in ``build-sections/.section-index.json`` together
+with the modification time of every directory and chapter file it was
+built from. On each lookup only those are stat'ed, and only directories
+whose mtime changed (a section added, removed or renamed) are listed
+again, so a lookup does not walk the source, figure and build trees.
+
+Usage:
+    python scripts/section_index.py lookup qv        # "<source> <tex>"
+    python scripts/section_index.py list [--chapter ch03] [--json]
+    python scripts/section_index.py rebuild
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+INDEX_FILE = Path("build-sections/.section-index.json")
+SOURCE_DIRS = ("versionless", "common/versioned")
+INDEX_VERSION = 1
+# \input{versionless/qv/index}, \include{common/versioned/ab/index.tex}, ...
+SECTION_REF_RE = re.compile(r"(versionless|common/versioned)/([^/{}\s]+)/index")
+
+
+def _mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _scan_dir(root: Path, path: str) -> Dict:
+    """.tex files (by stem) and subdirectories directly inside root/path, relative to root."""
+    tex_files: Dict[str, str] = {}
+    subdirs: List[str] = []
+    try:
+        entries = sorted(os.scandir(root / path), key=lambda e: e.name)
+    except OSError:
+        entries = []
+    for entry in entries:
+        # Not followed: a symlink back up the tree (ch03/loop -> ..) would recurse forever
+        if entry.is_dir(follow_symlinks=False):
+            subdirs.append(os.path.join(path, entry.name))
+        elif entry.name.endswith(".tex"):
+            tex_files[entry.name[:-4]] = os.path.join(path, entry.name)
+    return {"sections": tex_files, "subdirs": subdirs}
+
+
+def _chapter_refs(path: str) -> List[str]:
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            return sorted({m.group(2) for m in SECTION_REF_RE.finditer(f.read())})
+    except OSError:
+        return []
+
+
+class SectionIndex:
+    """Hash -> section lookup backed by an mtime-validated cache.
+
+    Args:
+        root: Book root
+        index_file: Cache file relative to root
+    """
+
+    def __init__(self, root=".", index_file: Path = INDEX_FILE):
+        self.root = Path(root)
+        self.index_file = self.root / index_file
+        self.dirs: Dict[str, Dict] = {}
+        self.chapter_files: Dict[str, Dict] = {}
+        self.changed = False
+        self._load()
+        self.refresh()
+
+    def _load(self):
+        try:
+            with open(self.index_file, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == INDEX_VERSION:
+            self.dirs = data["dirs"]
+            self.chapter_files = data["chapter_files"]
+
+    def _visit(self, path: str, seen: set):
+        """Refresh the entry for directory path and its subdirectories."""
+        seen.add(path)
+        mtime = _mtime(self.root / path)
+        entry = self.dirs.get(path)
+        if entry is None or entry["mtime"] != mtime:
+            entry = dict(_scan_dir(self.root, path), mtime=mtime)
+            self.dirs[path] = entry
+            self.changed = True
+        for sub in entry["subdirs"]:
+            self._visit(sub, seen)
+
+    def refresh(self):
+        """Re-list directories whose mtime changed since the index was written."""
+        root_mtime = _mtime(self.root)
+        if self.dirs.get(".", {}).get("mtime") != root_mtime:
+            try:
+                names = sorted(os.listdir(self.root))
+            except OSError:
+                names = []
+            self.dirs["."] = {
+                "mtime": root_mtime,
+                "chapter_dirs": [n for n in names if n.startswith("ch") and (self.root / n).is_dir()],
+                "chapter_files": [n for n in names if n.startswith("ch") and n.endswith(".tex")
+                                  and not n.endswith("_exercises.tex")],
+            }
+            self.changed = True
+        top = self.dirs["."]
+
+        seen = {"."}
+        for source_dir in SOURCE_DIRS:
+            seen.add(source_dir)
+            mtime = _mtime(self.root / source_dir)
+            entry = self.dirs.get(source_dir)
+            if entry is None or entry["mtime"] != mtime:
+                try:
+                    names = sorted(e.name for e in os.scandir(self.root / source_dir) if e.is_dir())
+                except OSError:
+                    names = []
+                self.dirs[source_dir] = {"mtime": mtime, "hashes": names}
+                self.changed = True
+        for chapter_dir in top["chapter_dirs"]:
+            self._visit(chapter_dir, seen)
+        for stale in set(self.dirs) - seen:
+            del self.dirs[stale]
+            self.changed = True
+
+        chapter_files = list(top["chapter_files"])
+        for chapter_dir in top["chapter_dirs"]:
+            chapter_files.extend(tex for tex in self.dirs[chapter_dir]["sections"].values())
+        for path in chapter_files:
+            mtime = _mtime(self.root / path)
+            entry = self.chapter_files.get(path)
+            if entry is None or entry["mtime"] != mtime:
+                self.chapter_files[path] = {"mtime": mtime, "refs": _chapter_refs(self.root / path)}
+                self.changed = True
+        for stale in set(self.chapter_files) - set(chapter_files):
+            del self.chapter_files[stale]
+            self.changed = True
+        if self.changed:
+            self.save()
+
+    def save(self):
+        self.index_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.index_file.with_name(f"{self.index_file.name}.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "dirs": self.dirs, "chapter_files": self.chapter_files}, f)
+        os.replace(tmp, self.index_file)
+        self.changed = False
+
+    def sections(self) -> Dict[str, Dict]:
+        """hash -> {'source', 'tex', 'type', 'chapter'} for every section."""
+        chapter_of: Dict[str, str] = {}
+        for path, entry in self.chapter_files.items():
+            for h in entry["refs"]:
+                chapter_of.setdefault(h, Path(path).parts[0].split(".")[0])
+
+        sections: Dict[str, Dict] = {}
+        for path in sorted(p for p in self.dirs if p not in (".",) + SOURCE_DIRS):
+            chapter = Path(path).parts[0]
+            entry = self.dirs[path]
+            for h, tex in entry["sections"].items():
+                if h == "index":
+                    continue
+                sections[h] = {"source": tex, "tex": tex, "type": "chapter", "chapter": chapter}
+            for sub in entry["subdirs"]:
+                index_tex = os.path.join(sub, "index.tex")
+                if "index" in self.dirs.get(sub, {}).get("sections", {}):
+                    sections[Path(sub).name] = {"source": index_tex, "tex": index_tex, "type": "chapter",
+                                                "chapter": chapter}
+        for source_dir in SOURCE_DIRS:
+            kind = "versionless" if source_dir == "versionless" else "versioned"
+            for h in self.dirs.get(source_dir, {}).get("hashes", []):
+                # Adding or removing source.md leaves the listed directory's mtime alone, so check it here
+                if not (self.root / source_dir / h / "source.md").is_file():
+                    continue
+                sections[h] = {"source": f"{source_dir}/{h}/source.md", "tex": f"{source_dir}/{h}/index.tex",
+                               "type": kind, "chapter": chapter_of.get(h)}
+        return sections
+
+    def lookup(self, h: str) -> Optional[Dict]:
+        return self.sections().get(h)
+
+
+def lookup(h: str, root=".") -> Optional[Dict]:
+    """The section for hash h, or None."""
+    return SectionIndex(root).lookup(h)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Look up book sections by hash")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_lookup = sub.add_parser("lookup", help="Print '<source> <tex>' for a hash (nothing if unknown)")
+    p_lookup.add_argument("hash")
+    p_list = sub.add_parser("list", help="List sections")
+    p_list.add_argument("--chapter", help="Only sections of this chapter (e.g. ch03)")
+    p_list.add_argument("--json", action="store_true", help="Print JSON")
+    sub.add_parser("rebuild", help="Rebuild the index from scratch")
+    parser.add_argument("--root", default=".", help="Book root (default: current directory)")
+    args = parser.parse_args(argv)
+
+    if args.command == "rebuild":
+        index_file = Path(args.root) / INDEX_FILE
+        if index_file.exists():
+            index_file.unlink()
+        print(f"{len(SectionIndex(args.root).sections())} sections indexed")
+        return 0
+
+    index = SectionIndex(args.root)
+    if args.command == "lookup":
+        section = index.lookup(args.hash)
+        if not section:
+            return 1
+        print(section["source"], section["tex"])
+        return 0
+
+    sections = index.sections()
+    if args.chapter:
+        sections = {h: s for h, s in sections.items() if s["chapter"] == args.chapter}
+    if args.json:
+        print(json.dumps(sections, indent=2, sort_keys=True))
+    else:
+        for h, s in sorted(sections.items()):
+            print(f"{h:<12} {s['type']:<12} {s['chapter'] or '-':<8} {s['source']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Search the book sources with a PCRE pattern, through a trigram index.
+
+``make find`` used to run ``grep -lP`` once per file over every
+versionless/versioned ``*.md``, every ``*.tex`` under ``ch*/`` and the
+root ``*.tex`` files. This script keeps a trigram index of those files in
+``.source-search.json``: for each file, its size, mtime and the set of
+three-character sequences on its lines (lowercased). Files whose size or
+mtime changed are re-indexed on the next search; nothing else is read.
+
+A search extracts the literal text every match must contain from the
+pattern (conservatively: anything optional, alternated or a character
+class contributes nothing), keeps the files holding all of its trigrams,
+and runs one ``grep -HnP`` over just those. Results are exactly those of
+``grep -P``; a pattern with no usable literal (e.g. ``\\d+``) searches
+every file. Without a grep that supports ``-P``, Python's ``re`` is used.
+
+Usage:
+    python3 scripts/source_search.py 'transfer\\s+function'    # file:line:text
+    python3 scripts/source_search.py -l '(?i)bode plot'          # file names only
+    python3 scripts/source_search.py --rebuild
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+INDEX_FILE = Path(".source-search.json")
+INDEX_VERSION = 1
+# (directory, pattern) searched, in the order make find printed them
+SOURCES = (("versionless", "**/*.md"), ("common/versioned", "**/*.md"), ("", "ch*/**/*.tex"), ("", "*.tex"))
+
+# Escapes that stand for the character itself
+_LITERAL_ESCAPES = set("\\.^$|?*+()[]{}/-#&~'\"`!@%=:;,<> ")
+
+
+def source_files(root: str = ".") -> List[str]:
+    files: List[str] = []
+    for directory, pattern in SOURCES:
+        base = Path(root) / directory
+        if base.is_dir():
+            files.extend(str(p.relative_to(root)) for p in sorted(base.glob(pattern)) if p.is_file())
+    return list(dict.fromkeys(files))
+
+
+def trigrams(text: str) -> Set[str]:
+    """Lowercased trigrams of text's lines (grep matches line by line)."""
+    grams: Set[str] = set()
+    for line in text.lower().splitlines():
+        grams.update(line[i:i + 3] for i in range(len(line) - 2))
+    return grams
+
+
+# pattern -> required literals ---------------------------------------------
+
+def _skip_class(pattern: str, i: int) -> int:
+    """Index after the character class starting at pattern[i] == '['."""
+    i += 1
+    if i < len(pattern) and pattern[i] == "^":
+        i += 1
+    if i < len(pattern) and pattern[i] == "]":
+        i += 1
+    while i < len(pattern) and pattern[i] != "]":
+        i += 2 if pattern[i] == "\\" else 1
+    return i + 1
+
+
+def _group_end(pattern: str, i: int) -> int:
+    """Index of the ')' closing the group opened at pattern[i] == '('."""
+    depth = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            i += 2
+            continue
+        if c == "[":
+            i = _skip_class(pattern, i)
+            continue
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    return len(pattern)
+
+
+def _split_alternatives(pattern: str) -> List[str]:
+    """Split pattern at its top-level '|'."""
+    parts, start, i, depth = [], 0, 0, 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            i += 2
+            continue
+        if c == "[":
+            i = _skip_class(pattern, i)
+            continue
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        elif c == "|" and depth == 0:
+            parts.append(pattern[start:i])
+            start = i + 1
+        i += 1
+    parts.append(pattern[start:])
+    return parts
+
+
+def _optional_quantifier(pattern: str, i: int) -> Optional[bool]:
+    """None if no quantifier at i, else whether it allows zero repetitions."""
+    if i >= len(pattern):
+        return None
+    if pattern[i] in "?*":
+        return True
+    if pattern[i] == "+":
+        return False
+    match = re.match(r"\{(\d*)(,\d*)?\}", pattern[i:])
+    if match and (match.group(1) or match.group(2)):
+        return not match.group(1) or int(match.group(1)) == 0
+    return None
+
+
+def _skip_quantifier(pattern: str, i: int) -> int:
+    """Index after the quantifier (and lazy/possessive suffix) at i, if any."""
+    if _optional_quantifier(pattern, i) is None:
+        return i
+    i = pattern.index("}", i) + 1 if pattern[i] == "{" else i + 1
+    return i + 1 if i < len(pattern) and pattern[i] in "?+" else i
+
+
+def _escape_end(pattern: str, i: int) -> int:
+    """Index after the non-literal escape at pattern[i] == '\\' (with its argument)."""
+    letter = pattern[i + 1:i + 2]
+    i += 2
+    if i < len(pattern) and pattern[i] in "{<'" and letter in "xopPNgk":
+        return pattern.find({"{": "}", "<": ">", "'": "'"}[pattern[i]], i + 1) + 1 or len(pattern)
+    if letter == "x":
+        return i + len(re.match(r"[0-9a-fA-F]{0,2}", pattern[i:]).group(0))
+    if letter in "cpP":
+        return min(i + 1, len(pattern))
+    if letter == "g" or letter.isdigit():
+        return i + len(re.match(r"[-+]?\d*", pattern[i:]).group(0))
+    return i
+
+
+def _sequence_literals(pattern: str) -> List[str]:
+    """Literal strings every match of a branch without top-level '|' contains."""
+    literals: List[str] = []
+    run = ""
+    i = 0
+
+    def flush():
+        nonlocal run
+        if run:
+            literals.append(run)
+        run = ""
+
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "(":
+            end = _group_end(pattern, i)
+            body = pattern[i + 1:end]
+            optional = _optional_quantifier(pattern, end + 1)
+            flush()
+            if body.startswith("?"):
+                # (?:...) is an ordinary group; lookarounds, comments, flags etc. require nothing
+                body = body[2:] if body.startswith("?:") else None
+            if body is not None and not optional:
+                alternatives = _split_alternatives(body)
+                if len(alternatives) == 1:
+                    literals.extend(_sequence_literals(body))
+            i = _skip_quantifier(pattern, end + 1)
+            continue
+        if c == "[":
+            flush()
+            i = _skip_quantifier(pattern, _skip_class(pattern, i))
+            continue
+        if c == "\\":
+            nxt = pattern[i + 1:i + 2]
+            if nxt == "Q":
+                end = pattern.find("\\E", i + 2)
+                end = len(pattern) if end < 0 else end
+                char, i_next = pattern[i + 2:end], end + 2
+            elif nxt and nxt in _LITERAL_ESCAPES:
+                char, i_next = nxt, i + 2
+            else:
+                # \d, \s, \b, \x{..}, backreferences, ...: not literal text
+                flush()
+                i = _skip_quantifier(pattern, _escape_end(pattern, i))
+                continue
+        elif c in ".^$)":
+            flush()
+            i = _skip_quantifier(pattern, i + 1)
+            continue
+        else:
+            char, i_next = c, i + 1
+        optional = _optional_quantifier(pattern, i_next)
+        if optional is None:
+            run += char
+            i = i_next
+            continue
+        # A quantifier applies to the last character only
+        if not optional:
+            run += char
+        else:
+            run += char[:-1]
+        flush()
+        i = _skip_quantifier(pattern, i_next)
+    flush()
+    return literals
+
+
+def required_trigrams(pattern: str) -> Optional[List[Set[str]]]:
+    """Trigram sets, one per top-level alternative; a file matching must hold all of one set.
+
+    None when some alternative requires no trigram (every file is a candidate).
+    """
+    if re.search(r"\(\?[a-zA-Z]*x", pattern):
+        return None  # extended mode: whitespace and comments are not literal
+    alternatives = []
+    for branch in _split_alternatives(pattern):
+        grams: Set[str] = set()
+        for literal in _sequence_literals(branch):
+            grams |= trigrams(literal)
+        if not grams:
+            return None
+        alternatives.append(grams)
+    return alternatives
+
+
+# index ---------------------------------------------------------------------
+
+class SourceIndex:
+    """Trigram index of the book sources, updated from file sizes and mtimes.
+
+    Args:
+        root: Book root
+    """
+
+    def __init__(self, root: str = "."):
+        self.root = Path(root)
+        self.path = self.root / INDEX_FILE
+        self.files: Dict[str, list] = {}
+        self.updated = 0
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        if data.get("version") == INDEX_VERSION:
+            self.files = data.get("files", {})
+
+    def save(self):
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "files": self.files}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def update(self, rebuild: bool = False) -> List[str]:
+        """Re-index new and changed files, drop removed ones; the indexed files in search order."""
+        if not rebuild:
+            self.load()
+        paths = source_files(str(self.root))
+        files = {}
+        for path in paths:
+            st = os.stat(self.root / path)
+            entry = self.files.get(path)
+            if entry is None or entry[0] != st.st_size or entry[1] != st.st_mtime_ns:
+                with open(self.root / path, encoding="utf-8", errors="replace") as f:
+                    grams = trigrams(f.read())
+                # "\n" never occurs in a trigram, so it separates them
+                entry = [st.st_size, st.st_mtime_ns, "\n" + "\n".join(sorted(grams)) + "\n"]
+                self.updated += 1
+            files[path] = entry
+        if self.updated or set(files) != set(self.files):
+            self.files = files
+            self.save()
+        self.files = files
+        return paths
+
+    def candidates(self, pattern: str, paths: List[str]) -> List[str]:
+        alternatives = required_trigrams(pattern)
+        if alternatives is None:
+            return paths
+        return [path for path in paths if any(all(f"\n{g}\n" in self.files[path][2] for g in grams)
+                                              for grams in alternatives)]
+
+
+# search --------------------------------------------------------------------
+
+def _grep_supports_pcre(grep: str) -> bool:
+    result = subprocess.run([grep, "-P", "x"], input="", capture_output=True, text=True)
+    return result.returncode in (0, 1)
+
+
+def search(pattern: str, files: List[str], names_only: bool = False, root: str = ".") -> int:
+    """Print the matches (file:line:text, or file names); grep's status (0 found, 1 none, 2 error)."""
+    if not files:
+        return 1
+    grep = shutil.which("grep")
+    if grep and _grep_supports_pcre(grep):
+        status = 1
+        # Chunked, so long candidate lists stay within the command-line limit
+        for start in range(0, len(files), 1000):
+            result = subprocess.run([grep, "-l" if names_only else "-Hn", "-P", "-e", pattern, "--"]
+                                    + files[start:start + 1000], cwd=root)
+            if result.returncode == 2:
+                return 2
+            status = min(status, result.returncode)
+        return status
+    try:
+        regex = re.compile(pattern)
+    except re.error as e:
+        print(f"✗ Error: invalid pattern ({e}); grep -P is not available")
+        return 2
+    status = 1
+    for path in files:
+        with open(Path(root) / path, encoding="utf-8", errors="replace") as f:
+            for number, line in enumerate(f, 1):
+                if regex.search(line.rstrip("\n")):
+                    status = 0
+                    if names_only:
+                        print(path)
+                        break
+                    print(f"{path}:{number}:{line.rstrip(chr(10))}")
+    return status
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Search the book sources with a PCRE pattern")
+    parser.add_argument("pattern", nargs="?", help="Perl-compatible regular expression (as grep -P)")
+    parser.add_argument("-l", "--files-with-matches", action="store_true", help="Print only file names")
+    parser.add_argument("--rebuild", action="store_true", help="Re-index every file")
+    parser.add_argument("--stats", action="store_true", help="Print how many files were searched")
+    args = parser.parse_args(argv)
+
+    if not args.pattern and not args.rebuild:
+        print("Pattern not specified.")
+        return 2
+    index = SourceIndex()
+    paths = index.update(rebuild=args.rebuild)
+    if not args.pattern:
+        print(f"Indexed {len(paths)} files ({INDEX_FILE})")
+        return 0
+    candidates = index.candidates(args.pattern, paths)
+    sys.stdout.flush()
+    status = search(args.pattern, candidates, args.files_with_matches)
+    if args.stats:
+        print(f"{len(candidates)} of {len(paths)} files searched ({index.updated} re-indexed)", file=sys.stderr)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())